@@ -0,0 +1,220 @@
+"""Deterministic synthetic datasets for the benchmark database.
+
+`python manage.py bench_load --rows 1e6` creates a scratch database (never the one in
+`DATABASES`), applies the schema from `database/` (DDL, functions and triggers, not
+the sample DML) and fills it with:
+
+- the pollutant and weather variables below
+- stations scattered around Cali, one sensor per variable each
+- measurements ending at the last UTC midnight (or `--end`), going back `--days`:
+  every series has its own cadence (5 min to 1 h), a diurnal cycle, correlated
+  noise, rare spikes, short dropouts and the occasional multi-day outage
+
+Stations are added until the series reach `--rows` readings, so bigger datasets
+mean more stations over the same period, the way the network grows. The same
+rows, days and seed always produce the same data relative to its end, which is a
+whole day so the diurnal cycles line up too; the end is kept as `end` in
+`bench_dataset` and the same end date reproduces the data exactly. Measurements go
+in with COPY, one series at a time, after their monthly partitions exist.
+"""
+from datetime import datetime, timezone as dt_timezone
+import math
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from measurements import partitions
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+SCHEMA_FILES = ('vrisa.ddl.sql', 'vrisa.functions.sql', 'vrisa.triggers.sql')
+
+# name, unit, type, base level, diurnal amplitude (share of base), noise
+VARIABLES = (
+    ('PM2.5', 'µg/m3', 'contaminante', 18.0, 0.35, 4.0),
+    ('PM10', 'µg/m3', 'contaminante', 35.0, 0.30, 7.0),
+    ('NO2', 'ppm', 'contaminante', 0.03, 0.40, 0.006),
+    ('O3', 'ppm', 'contaminante', 0.04, 0.60, 0.008),
+    ('CO', 'ppm', 'contaminante', 1.2, 0.30, 0.2),
+    ('Temperatura', '°C', 'meteorologica', 24.0, 0.20, 0.8),
+)
+CADENCES = (300, 600, 900, 1800, 3600)
+CENTER = (3.45, -76.53)
+SPREAD_DEG = 0.15
+
+# dataset description kept in the bench database, checked against baselines
+META_TABLE = 'bench_dataset'
+
+
+def main_database_name():
+    return settings.DATABASES['default']['NAME']
+
+
+def _connect_params(dbname):
+    conf = connections['default'].settings_dict
+    params = {'dbname': dbname, 'user': conf['USER'], 'password': conf['PASSWORD'], 'host': conf['HOST']}
+    if conf.get('PORT'):
+        params['port'] = conf['PORT']
+    return params
+
+
+def use_database(name):
+    """Point the default connection of this process at the benchmark database."""
+    if name == main_database_name():
+        raise ValueError(f'refusing to use the main database "{name}" for benchmarks')
+    if 'replica' in settings.DATABASES:
+        raise ValueError('unset DB_REPLICA_HOST: benchmarks run against a single database')
+    conn = connections['default']
+    conn.close()
+    conn.settings_dict['NAME'] = name
+
+
+def create_database(name, recreate=False):
+    """Create the benchmark database; returns False if it exists and `recreate` is off."""
+    import psycopg
+    from psycopg import sql
+
+    if name == main_database_name():
+        raise ValueError(f'refusing to recreate the main database "{name}"')
+    with psycopg.connect(**_connect_params('postgres'), autocommit=True) as conn:
+        exists = conn.execute('SELECT 1 FROM pg_database WHERE datname = %s', [name]).fetchone()
+        if exists and not recreate:
+            return False
+        if exists:
+            conn.execute(sql.SQL('DROP DATABASE {} WITH (FORCE)').format(sql.Identifier(name)))
+        conn.execute(sql.SQL('CREATE DATABASE {}').format(sql.Identifier(name)))
+    return True
+
+
+def apply_schema(cursor):
+    folder = settings.BASE_DIR.parent / 'database'
+    for filename in SCHEMA_FILES:
+        cursor.execute((folder / filename).read_text(encoding='utf-8'))
+    cursor.execute(f'CREATE TABLE {META_TABLE} (key VARCHAR(50) PRIMARY KEY, value TEXT NOT NULL)')
+
+
+def read_meta(cursor):
+    cursor.execute(f'SELECT key, value FROM {META_TABLE}')
+    return dict(cursor.fetchall())
+
+
+def plan_series(rows, days, seed):
+    """[(cadence seconds, variable index)] for every series, one station (len(VARIABLES) series) at a time."""
+    rng = np.random.default_rng([seed, 0])
+    series, total = [], 0
+    while total < rows:
+        for v_index in range(len(VARIABLES)):
+            cadence = int(rng.choice(CADENCES))
+            series.append((cadence, v_index))
+            total += days * 86400 // cadence
+    return series
+
+
+def stations_for(n, seed):
+    rng = np.random.default_rng([seed, 1])
+    lat = CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG, n)
+    lon = CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG, n)
+    return [(f'Bench {i + 1:05d}', round(float(a), 6), round(float(b), 6)) for i, (a, b) in enumerate(zip(lat, lon))]
+
+
+def generate_series(seed, index, cadence, v_index, end_ts, days):
+    """(epoch seconds, values) of one series, identical for the same arguments."""
+    rng = np.random.default_rng([seed, 2, index])
+    _name, _unit, v_type, base, amplitude, noise = VARIABLES[v_index]
+    n = days * 86400 // cadence
+    ts = end_ts - cadence * np.arange(n, dtype=np.int64)[::-1]
+
+    keep = np.ones(n, dtype=bool)
+    # short dropouts: about one every three days, ~2 h each
+    for _ in range(rng.poisson(days / 3)):
+        start = rng.integers(0, n)
+        keep[start:start + max(1, int(rng.lognormal(math.log(7200), 0.8) // cadence))] = False
+    # a few sensors lose a couple of days
+    if rng.random() < 0.02:
+        start = rng.integers(0, n)
+        keep[start:start + int(rng.uniform(1, 3) * 86400 // cadence)] = False
+
+    hours = (ts % 86400) / 3600.0
+    level = base * (1 + amplitude * np.sin((hours - 9 - rng.uniform(-1, 1)) * math.pi / 12))
+    # correlated noise: white noise smoothed over about two hours
+    width = max(1, 7200 // cadence)
+    kernel = np.exp(-np.arange(width) / max(1.0, width / 3))
+    smooth = np.convolve(rng.normal(0, 1, n + width), kernel / np.sqrt((kernel ** 2).sum()), 'valid')[:n]
+    values = level + noise * smooth
+    spikes = rng.random(n) < 0.001
+    values[spikes] *= rng.uniform(3, 8, spikes.sum())
+    if v_type == 'contaminante':
+        values = np.maximum(values, 0)
+    return ts[keep], np.round(values[keep], 4)
+
+
+def _copy_rows(cursor, ts, values, sensor_id, variable_id):
+    dates = ts.astype('datetime64[s]').astype(str)
+    suffix = f'\t{sensor_id}\t{variable_id}\n'
+    lines = np.char.add(np.char.add(dates, '\t'), values.astype(str))
+    with cursor.copy('COPY measurement (m_date, m_value, sensor_id, variable_id) FROM STDIN') as copy:
+        copy.write(suffix.join(lines.tolist()) + suffix)
+
+
+def _ensure_partitions(cursor, start_ts, end_ts):
+    existing = {month for month, _name in partitions.list_partitions(cursor)}
+    month = partitions.month_start(datetime.fromtimestamp(start_ts, dt_timezone.utc))
+    last = partitions.month_start(datetime.fromtimestamp(end_ts, dt_timezone.utc))
+    while month <= last:
+        if month not in existing:
+            partitions.create_partition(cursor, month)
+        month = partitions.add_months(month, 1)
+
+
+def end_timestamp(end=None):
+    """Epoch seconds of UTC midnight starting `end` (a date, default today), where the data ends.
+
+    Never in the future, so the trigger that rejects future readings does not fire.
+    """
+    end = end or datetime.now(dt_timezone.utc).date()
+    return int(datetime(end.year, end.month, end.day, tzinfo=dt_timezone.utc).timestamp())
+
+
+def load(cursor, rows, days, seed, end=None, log=None):
+    """Fill a freshly created schema; returns the number of measurements written."""
+    if np is None:
+        raise RuntimeError('numpy is required to generate benchmark data')
+    plan = plan_series(rows, days, seed)
+    stations = stations_for(len(plan) // len(VARIABLES), seed)
+    end_ts = end_timestamp(end)
+    _ensure_partitions(cursor, end_ts - days * 86400, end_ts)
+
+    cursor.executemany('INSERT INTO variable (v_name, v_unit, v_type) VALUES (%s, %s, %s)', [v[:3] for v in VARIABLES])
+    cursor.execute('SELECT v_id FROM variable ORDER BY v_id')
+    variable_ids = [r[0] for r in cursor.fetchall()]
+    cursor.executemany(
+        "INSERT INTO station (s_name, lat, lon, s_state) VALUES (%s, %s, %s, 'activo')", stations,
+    )
+    cursor.execute('SELECT station_id FROM station ORDER BY station_id')
+    station_ids = [r[0] for r in cursor.fetchall()]
+    cursor.executemany(
+        "INSERT INTO sensor (s_type, s_state, station_id) VALUES (%s, 'activo', %s)",
+        [(VARIABLES[v][0], s_id) for s_id in station_ids for v in range(len(VARIABLES))],
+    )
+    cursor.execute('SELECT sensor_id FROM sensor ORDER BY sensor_id')
+    sensor_ids = [r[0] for r in cursor.fetchall()]
+
+    written = 0
+    started = time.monotonic()
+    for index, (cadence, v_index) in enumerate(plan):
+        ts, values = generate_series(seed, index, cadence, v_index, end_ts, days)
+        _copy_rows(cursor, ts, values, sensor_ids[index], variable_ids[v_index])
+        written += len(ts)
+        if log and (index + 1) % 500 == 0:
+            log(f'{index + 1}/{len(plan)} series, {written} rows, {written / (time.monotonic() - started):.0f} rows/s')
+    cursor.execute('ANALYZE')
+    cursor.executemany(f'INSERT INTO {META_TABLE} (key, value) VALUES (%s, %s)', [
+        ('rows', str(rows)), ('days', str(days)), ('seed', str(seed)),
+        ('measurements', str(written)), ('stations', str(len(station_ids))), ('series', str(len(plan))),
+        ('end', datetime.fromtimestamp(end_ts, dt_timezone.utc).date().isoformat()),
+    ])
+    return written
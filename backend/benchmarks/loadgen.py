@@ -0,0 +1,345 @@
+"""Mixed-workload load generator for a running VRISA server.
+
+    python -m benchmarks.loadgen --url http://localhost:8000 --stations 200 --cadence 60 \\
+        --dashboards 20 --reports 10 --duration 300
+
+Runs from `backend/` with the standard library only (no Django), so it can also run
+from another machine. Three kinds of virtual clients share the run:
+
+- stations: every simulated station POSTs one batch to `/api/measurements/` per
+  `--cadence` seconds, one reading per sensor. Posts are scheduled on the clock
+  (open model), so a slow server shows up as ingest lag rather than as fewer posts
+- dashboard sessions replay the calls `Dashboard.tsx` makes when it loads
+- report sessions replay `Reports.tsx`: the initial load, then `--changes` filter
+  changes (time range, station, pollutant), each one running the trends, air
+  quality and alerts reports the page runs
+
+Sessions wait `--think` seconds on average (exponential) between page loads and
+filter changes, and reload the page when done. Stations and sensors are read from
+the server at start. At the end the script prints throughput, error rate and
+latency percentiles per route and a latency histogram; `--json` also writes them
+to a file. Requests matching `--exclude` (method, path and query string) are
+skipped, e.g. `--exclude 'GET /api/measurements/$'` for the unpaginated list.
+"""
+import argparse
+import bisect
+import heapq
+import http.client
+import json
+import math
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode, urlsplit
+
+HISTOGRAM_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+POLLUTANTS = ('PM2.5', 'PM10', 'O3', 'NO2', 'SO2', 'CO')
+RANGES = {'24h': 1, '7d': 7, '30d': 30}
+_ID_RE = re.compile(r'/\d+(?=/)')
+
+
+class Stats:
+    """Latency samples and errors per route, shared by every client thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.lag_ms = []
+
+    def record(self, route, ms, ok):
+        with self._lock:
+            entry = self.routes.setdefault(route, {'latencies': [], 'errors': 0})
+            entry['latencies'].append(ms)
+            if not ok:
+                entry['errors'] += 1
+
+    def record_lag(self, ms):
+        with self._lock:
+            self.lag_ms.append(ms)
+
+    def summary(self, elapsed):
+        out = {}
+        with self._lock:
+            for route, entry in sorted(self.routes.items()):
+                lat = sorted(entry['latencies'])
+                counts = [0] * (len(HISTOGRAM_MS) + 1)
+                for ms in lat:
+                    counts[bisect.bisect_left(HISTOGRAM_MS, ms)] += 1
+                out[route] = {
+                    'requests': len(lat),
+                    'rps': round(len(lat) / elapsed, 2),
+                    'error_rate': round(entry['errors'] / len(lat), 4) if lat else 0.0,
+                    'p50_ms': _percentile(lat, 50),
+                    'p90_ms': _percentile(lat, 90),
+                    'p99_ms': _percentile(lat, 99),
+                    'max_ms': round(lat[-1], 1) if lat else None,
+                    'histogram': dict(zip([f'<={b}ms' for b in HISTOGRAM_MS] + ['>30000ms'], counts)),
+                }
+            lag = sorted(self.lag_ms)
+        return out, {'p50_ms': _percentile(lag, 50), 'p99_ms': _percentile(lag, 99), 'max_ms': round(lag[-1], 1) if lag else None}
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * q / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return round(sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo), 1)
+
+
+class Http:
+    """One keep-alive connection; each client thread owns its own."""
+
+    def __init__(self, base_url, stats, token=None, timeout=60, exclude=None):
+        url = urlsplit(base_url)
+        self.https = url.scheme == 'https'
+        self.host = url.netloc
+        self.stats = stats
+        self.timeout = timeout
+        self.exclude = re.compile(exclude) if exclude else None
+        self.headers = {'Accept': 'application/json'}
+        if token:
+            self.headers['Authorization'] = f'Bearer {token}'
+        self.conn = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        self.conn = cls(self.host, timeout=self.timeout)
+
+    def request(self, method, path, params=None, body=None):
+        """Send one request and record it; returns the decoded JSON body or None."""
+        route = f'{method} {_ID_RE.sub("/{id}", path)}'
+        query = urlencode({k: v for k, v in (params or {}).items() if v is not None})
+        target = f'{path}?{query}' if query else path
+        if self.exclude and self.exclude.search(f'{method} {target}'):
+            return None
+        headers = dict(self.headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        started = time.perf_counter()
+        ok, data = False, None
+        for attempt in (1, 2):
+            try:
+                if self.conn is None:
+                    self._connect()
+                self.conn.request(method, target, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                raw = response.read()
+                ok = response.status < 400
+                if ok and raw and response.getheader('Content-Type', '').startswith('application/json'):
+                    data = json.loads(raw)
+                break
+            except (http.client.HTTPException, OSError):
+                # the server closed an idle keep-alive connection: reconnect once
+                self.conn = None
+                if attempt == 2:
+                    break
+        self.stats.record(route, (time.perf_counter() - started) * 1000, ok)
+        return data
+
+
+def _results(data):
+    if isinstance(data, dict):
+        return data.get('results') or []
+    return data or []
+
+
+def discover(base_url, token=None):
+    """{station_id: [(sensor_id, variable_id)]} and the variable ids by name, read from the API."""
+    client = Http(base_url, Stats(), token)
+    variables = {v['v_name']: v['v_id'] for v in _results(client.request('GET', '/api/variables/'))}
+    if not variables:
+        raise SystemExit('The server has no variables; load some data first (see benchmarks/dataset.py).')
+    ids = sorted(variables.values())
+    stations = {}
+    for sensor in _results(client.request('GET', '/api/sensors/')):
+        if sensor.get('station') is None:
+            continue
+        # sensors are named after what they measure in the benchmark datasets
+        variable_id = variables.get(sensor.get('s_type')) or ids[sensor['sensor_id'] % len(ids)]
+        stations.setdefault(sensor['station'], []).append((sensor['sensor_id'], variable_id))
+    if not stations:
+        raise SystemExit('The server has no sensors attached to stations.')
+    return stations, variables
+
+
+def _now_iso():
+    # a second in the past: the database rejects readings from the future
+    return (datetime.now(timezone.utc) - timedelta(seconds=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _start_date(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def run_ingest(args, stations, stats, stop):
+    """Post one batch per station and cadence from a pool of workers, on a fixed schedule."""
+    work = queue.Queue()
+    rng = random.Random(args.seed)
+    station_ids = sorted(stations)
+    # more simulated stations than real ones reuse the real sensors
+    schedule = [
+        (time.monotonic() + rng.uniform(0, args.cadence), n, station_ids[n % len(station_ids)])
+        for n in range(args.stations)
+    ]
+    heapq.heapify(schedule)
+
+    def worker():
+        client = Http(args.url, stats, args.token, exclude=args.exclude)
+        level = random.Random()
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            due, station_id = item
+            stats.record_lag(max(0.0, (time.monotonic() - due) * 1000))
+            m_date = _now_iso()
+            batch = [
+                {'m_date': m_date, 'm_value': round(level.uniform(5, 60), 4), 'sensor': sensor_id, 'variable': variable_id}
+                for sensor_id, variable_id in stations[station_id]
+            ]
+            client.request('POST', '/api/measurements/', body=batch)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.ingest_workers)]
+    for t in threads:
+        t.start()
+    while not stop.is_set() and schedule:
+        due, n, station_id = schedule[0]
+        wait = due - time.monotonic()
+        if wait > 0:
+            stop.wait(min(wait, 0.5))
+            continue
+        heapq.heapreplace(schedule, (due + args.cadence, n, station_id))
+        work.put((due, station_id))
+    for _ in threads:
+        work.put(None)
+
+
+def dashboard_session(client, rng, think, stop, context):
+    """What Dashboard.tsx requests on every load."""
+    while not stop.is_set():
+        client.request('GET', '/api/stations/')
+        client.request('GET', '/api/reports/air_quality/')
+        client.request('GET', '/api/measurements/')
+        client.request('GET', '/api/variables/')
+        client.request('GET', '/api/reports/alerts/')
+        client.request('GET', '/api/measurements/', {'days': 7})
+        client.request('GET', '/api/variables/')
+        stop.wait(rng.expovariate(1 / think))
+
+
+def reports_session(client, rng, think, stop, context, changes=3):
+    """What Reports.tsx requests on load and on every filter change."""
+    station_ids = context['station_ids']
+    variables = context['variables']
+    while not stop.is_set():
+        # initial load: these three run in parallel in the page, sequential here
+        client.request('GET', '/api/stations/')
+        client.request('GET', '/api/sensors/')
+        client.request('GET', '/api/variables/')
+        client.request('GET', '/api/reports/infrastructure/')
+        for _ in range(changes):
+            if stop.wait(rng.expovariate(1 / think)):
+                return
+            time_range = rng.choice(list(RANGES))
+            days = RANGES[time_range]
+            station = rng.choice(station_ids) if rng.random() < 0.5 else None
+            pollutant = rng.choice([p for p in POLLUTANTS if p in variables] or list(variables))
+            variable_id = variables.get(pollutant)
+            # generateTrendsReport
+            client.request('GET', '/api/reports/trends/', {'days': days, 'variable': pollutant, 'station_id': station})
+            client.request('GET', '/api/reports/projection/', {'variable': pollutant, 'station_id': station, 'hours': 24, 'points': 24})
+            # generateAirQualityReport
+            client.request('GET', '/api/reports/air_quality/', {'days': days, 'station_id': station})
+            client.request('GET', '/api/variables/')
+            client.request('GET', '/api/reports/infrastructure/', {'station_id': station, 'start_date': _start_date(days)})
+            client.request('GET', '/api/measurements/', {'start_date': _start_date(days), 'variable': variable_id})
+            # generateAlertsReport
+            client.request('GET', '/api/reports/alerts/', {'days': days, 'station_id': station, 'variable': pollutant})
+            client.request('GET', '/api/measurements/', {'station_id': station, 'start_date': _start_date(days), 'variable': variable_id})
+        stop.wait(rng.expovariate(1 / think))
+
+
+def _print_report(routes, lag, elapsed, out):
+    total = sum(r['requests'] for r in routes.values())
+    errors = sum(r['requests'] * r['error_rate'] for r in routes.values())
+    out.write(f'\n{total} requests in {elapsed:.0f} s: {total / elapsed:.1f} req/s, '
+              f'{(errors / total if total else 0):.2%} errors\n')
+    out.write(f"ingest schedule lag: p50 {lag['p50_ms']} ms, p99 {lag['p99_ms']} ms, max {lag['max_ms']} ms\n\n")
+    out.write(f"{'route':48} {'req':>7} {'req/s':>7} {'err%':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}\n")
+    for route, r in routes.items():
+        out.write(f"{route:48} {r['requests']:7d} {r['rps']:7.2f} {r['error_rate'] * 100:6.2f} "
+                  f"{r['p50_ms']:8.1f} {r['p90_ms']:8.1f} {r['p99_ms']:8.1f} {r['max_ms']:8.1f}\n")
+    out.write('\nlatency histogram (requests per bucket, all routes)\n')
+    buckets = {}
+    for r in routes.values():
+        for label, n in r['histogram'].items():
+            buckets[label] = buckets.get(label, 0) + n
+    widest = max(buckets.values() or [1]) or 1
+    for label, n in buckets.items():
+        out.write(f"{label:>10} {n:8d} {'#' * round(40 * n / widest)}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--token', default=None, help='Access token sent as "Authorization: Bearer".')
+    parser.add_argument('--stations', type=int, default=50, help='Simulated stations posting measurements.')
+    parser.add_argument('--cadence', type=float, default=60, help='Seconds between two posts of a station.')
+    parser.add_argument('--ingest-workers', type=int, default=8, help='Concurrent connections used for posts.')
+    parser.add_argument('--dashboards', type=int, default=10, help='Concurrent Dashboard.tsx sessions.')
+    parser.add_argument('--reports', type=int, default=5, help='Concurrent Reports.tsx sessions.')
+    parser.add_argument('--changes', type=int, default=3, help='Filter changes per Reports.tsx page load.')
+    parser.add_argument('--think', type=float, default=5.0, help='Mean seconds a user waits between actions.')
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--ramp', type=float, default=10, help='Seconds over which sessions start.')
+    parser.add_argument('--exclude', default=None, help='Skip requests whose "METHOD path?query" matches this regex.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', default=None, help='Also write the results to this file.')
+    args = parser.parse_args(argv)
+
+    stations, variables = discover(args.url, args.token)
+    print(f'{len(stations)} stations with sensors, {len(variables)} variables on {args.url}')
+    stats = Stats()
+    stop = threading.Event()
+    context = {'station_ids': sorted(stations), 'variables': variables}
+    threads = []
+    if args.stations:
+        threads.append(threading.Thread(target=run_ingest, args=(args, stations, stats, stop), daemon=True))
+    sessions = [(dashboard_session, {})] * args.dashboards + [(reports_session, {'changes': args.changes})] * args.reports
+    for n, (session, extra) in enumerate(sessions):
+        def start(session=session, extra=extra, n=n):
+            if stop.wait(args.ramp * n / max(1, len(sessions))):
+                return
+            client = Http(args.url, stats, args.token, exclude=args.exclude)
+            session(client, random.Random(args.seed * 1000 + n), args.think, stop, context, **extra)
+        threads.append(threading.Thread(target=start, daemon=True))
+
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    try:
+        stop.wait(args.duration)
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    elapsed = time.monotonic() - started
+    for t in threads:
+        t.join(timeout=5)
+
+    routes, lag = stats.summary(elapsed)
+    _print_report(routes, lag, elapsed, sys.stdout)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump({'config': vars(args), 'elapsed_s': round(elapsed, 1), 'ingest_lag': lag, 'routes': routes}, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from benchmarks import dataset
+
+
+class Command(BaseCommand):
+    help = 'Create the benchmark database and fill it with a synthetic dataset (see benchmarks/dataset.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=float, default=1e5, help='Measurements to generate, e.g. 1e5 to 1e8 (default 1e5).')
+        parser.add_argument('--days', type=int, default=30, help='Days of history before the end (default 30).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--end', type=date.fromisoformat, default=None,
+                            help='UTC date the data ends at (midnight starting it, default today), e.g. to rebuild a dataset.')
+        parser.add_argument('--database', default=None, help='Benchmark database name (default BENCH_DATABASE_NAME).')
+        parser.add_argument('--recreate', action='store_true', help='Drop the benchmark database first if it exists.')
+
+    def handle(self, *args, **options):
+        name = options['database'] or getattr(settings, 'BENCH_DATABASE_NAME', 'vrisa_bench')
+        rows = int(options['rows'])
+        end = options['end']
+        if end is not None and dataset.end_timestamp(end) > dataset.end_timestamp():
+            raise CommandError(f'--end cannot be after today: {end}')
+        try:
+            if not dataset.create_database(name, recreate=options['recreate']):
+                raise CommandError(f'Database "{name}" already exists; pass --recreate to replace it.')
+            dataset.use_database(name)
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        with transaction.atomic(), connection.cursor() as cur:
+            dataset.apply_schema(cur)
+            written = dataset.load(cur, rows, options['days'], options['seed'], end=end, log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f'Loaded {written} measurements into "{name}"'))
@@ -0,0 +1,67 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from benchmarks import dataset, runner
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'baselines')
+
+
+class Command(BaseCommand):
+    help = ('Time the /api/reports/ and /api/measurements/ endpoints on the benchmark database and '
+            'compare them with a recorded baseline (see benchmarks/runner.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=None, help='Benchmark database name (default BENCH_DATABASE_NAME).')
+        parser.add_argument('--repeat', type=int, default=10, help='Timed requests per scenario (default 10).')
+        parser.add_argument('--only', default=None, help='Only run scenarios whose name matches this regex.')
+        parser.add_argument('--baseline', default=None, help='Baseline JSON (default benchmarks/baselines/rows-<rows>-days-<days>.json).')
+        parser.add_argument('--update-baseline', action='store_true', help='Record this run as the baseline instead of comparing.')
+        parser.add_argument('--tolerance', type=float, default=None, help='Allowed relative slowdown (default BENCH_TOLERANCE).')
+        parser.add_argument('--output', default=None, help='Also write the results of this run to a JSON file.')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the recent-series cache so reports read the database.')
+
+    def handle(self, *args, **options):
+        name = options['database'] or getattr(settings, 'BENCH_DATABASE_NAME', 'vrisa_bench')
+        try:
+            dataset.use_database(name)
+            with connection.cursor() as cur:
+                meta = dataset.read_meta(cur)
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        except Exception as ex:
+            raise CommandError(f'Could not read the benchmark dataset in "{name}" (run bench_load first): {ex}')
+
+        tolerance = options['tolerance'] if options['tolerance'] is not None else getattr(settings, 'BENCH_TOLERANCE', 0.25)
+        path = options['baseline'] or os.path.join(BASELINE_DIR, f"rows-{meta['rows']}-days-{meta['days']}.json")
+        cache = not options['no_cache']
+        with override_settings(SERIES_CACHE_ENABLED=cache):
+            if cache:
+                from measurements.series_cache import series_cache
+
+                series_cache.warm()
+            results = runner.run(meta, repeat=options['repeat'], only=options['only'], log=self.stdout.write)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump({'dataset': meta, 'results': results}, fh, indent=2, sort_keys=True)
+        if options['update_baseline']:
+            runner.write_baseline(path, meta, results)
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {path}'))
+            return
+        if not os.path.exists(path):
+            self.stdout.write(self.style.WARNING(f'No baseline at {path}; record one with --update-baseline'))
+            return
+        baseline = runner.read_baseline(path)
+        if not runner.same_dataset(baseline['dataset'], meta):
+            raise CommandError(f'Baseline {path} was recorded on a different dataset: {baseline["dataset"]}')
+        problems = runner.compare(results, baseline['results'], tolerance)
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError(f'{len(problems)} regression(s) beyond {tolerance:.0%} of the baseline')
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} scenarios within {tolerance:.0%} of the baseline'))
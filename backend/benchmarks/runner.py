@@ -0,0 +1,137 @@
+"""Timing of the report and measurement endpoints against the benchmark database.
+
+Every scenario is a GET run in-process through the full middleware stack with
+Django's test client: one warm-up request, `repeat` timed requests (latency
+percentiles), then one request under `CaptureQueriesContext` and `tracemalloc` for
+the query count and the peak Python memory of the request (kept out of the timings,
+both slow requests down).
+
+Results are compared with a JSON baseline recorded on the same dataset: a scenario
+regresses when its p50 or p90 grows by more than the tolerance (plus a small
+absolute slack for noise on fast endpoints), when it runs more queries, when its
+peak memory grows beyond the tolerance, or when its status code changes.
+"""
+import json
+import re
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+WINDOWS_DAYS = (1, 7, 30)
+# unpaginated list endpoints only run on datasets up to this size
+UNBOUNDED_MAX_ROWS = 10 ** 6
+# noise floor added to the relative tolerance
+SLACK_MS = 2.0
+SLACK_KB = 64
+
+
+def scenarios(meta):
+    """[(name, path, params)] for a dataset described by its `bench_dataset` rows.
+
+    Report windows end where the data ends, so they cover the same readings however
+    long after `bench_load` the benchmark runs.
+    """
+    end = {'end_date': f"{meta['end']}T00:00:00"} if meta.get('end') else {}
+    out = []
+    for days in WINDOWS_DAYS:
+        out.append((f'air_quality.d{days}', '/api/reports/air_quality/', {'days': days, **end}))
+        out.append((f'air_quality.station.d{days}', '/api/reports/air_quality/', {'days': days, 'station_id': 1, **end}))
+        out.append((f'trends.d{days}', '/api/reports/trends/', {'days': days, 'variable': 'PM2.5', **end}))
+        out.append((f'alerts.scan.d{days}', '/api/reports/alerts/', {'days': days, 'variable': 'PM2.5', 'mode': 'scan', **end}))
+    out.append(('alerts.events.d7', '/api/reports/alerts/', {'days': 7, **end}))
+    out.append(('projection.station', '/api/reports/projection/', {'variable': 'PM2.5', 'station_id': 1, 'hours': 24}))
+    out.append(('infrastructure', '/api/reports/infrastructure/', {}))
+    out.append(('measurements.detail', '/api/measurements/1/', {}))
+    if int(float(meta.get('measurements', 0))) <= UNBOUNDED_MAX_ROWS:
+        out.append(('measurements.list', '/api/measurements/', {}))
+    return out
+
+
+def _percentile(samples, q):
+    return round(float(np.percentile(samples, q)), 3)
+
+
+def run_scenario(client, path, params, repeat):
+    client.get(path, params)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path, params)
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path, params)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'status': response.status_code,
+        'tier': response.get('X-Report-Tier'),
+        'p50_ms': _percentile(timings, 50),
+        'p90_ms': _percentile(timings, 90),
+        'p99_ms': _percentile(timings, 99),
+        'max_ms': round(max(timings), 3),
+        'queries': len(queries),
+        'peak_kb': round(peak / 1024, 1),
+        'bytes': len(response.content) if not getattr(response, 'streaming', False) else None,
+    }
+
+
+def run(meta, repeat=10, only=None, log=None):
+    client = Client(HTTP_HOST='localhost')
+    results = {}
+    for name, path, params in scenarios(meta):
+        if only and not re.search(only, name):
+            continue
+        results[name] = run_scenario(client, path, params, repeat)
+        if log:
+            r = results[name]
+            log(f"{name:32} {r['status']} p50 {r['p50_ms']:9.1f} ms  p90 {r['p90_ms']:9.1f} ms  "
+                f"{r['queries']:5d} queries  {r['peak_kb']:10.1f} KiB  {r['tier'] or ''}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Human-readable regressions of `results` against a baseline's results."""
+    problems = []
+    for name, base in baseline.items():
+        cur = results.get(name)
+        if cur is None:
+            continue
+        if cur['status'] != base['status']:
+            problems.append(f"{name}: status {base['status']} -> {cur['status']}")
+        for key in ('p50_ms', 'p90_ms'):
+            limit = base[key] * (1 + tolerance) + SLACK_MS
+            if cur[key] > limit:
+                problems.append(f'{name}: {key} {base[key]} -> {cur[key]} (limit {limit:.1f})')
+        if cur['queries'] > base['queries']:
+            problems.append(f"{name}: queries {base['queries']} -> {cur['queries']}")
+        limit = base['peak_kb'] * (1 + tolerance) + SLACK_KB
+        if cur['peak_kb'] > limit:
+            problems.append(f"{name}: peak_kb {base['peak_kb']} -> {cur['peak_kb']} (limit {limit:.0f})")
+    return problems
+
+
+def same_dataset(a, b):
+    """Whether two `bench_dataset` descriptions hold the same data, up to the day it ends on."""
+    return {k: v for k, v in a.items() if k != 'end'} == {k: v for k, v in b.items() if k != 'end'}
+
+
+def read_baseline(path):
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def write_baseline(path, meta, results):
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump({'dataset': meta, 'results': results}, fh, indent=2, sort_keys=True)
+        fh.write('\n')
@@ -0,0 +1,38 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from users.tokens import ClaimsUser
+from . import views
+
+
+class DashboardScopeTests(SimpleTestCase):
+    def get(self, user):
+        request = APIRequestFactory().get('/api/institutions/3/dashboard/')
+        if user is not None:
+            force_authenticate(request, user=user)
+        cache = mock.Mock()
+        cache.get.return_value = {'institution': {'institution_id': 3}}
+        with mock.patch.object(views, 'cache', cache):
+            return views.InstitutionViewSet.as_view({'get': 'dashboard'})(request, pk='3')
+
+    def test_requires_a_token(self):
+        self.assertEqual(self.get(None).status_code, 401)
+
+    def test_other_institutions_admin_is_forbidden(self):
+        user = ClaimsUser({'user_id': 1, 'u_type': 'admin', 'institutions': [4], 'stations': []})
+        self.assertEqual(self.get(user).status_code, 403)
+
+    def test_station_admin_is_forbidden(self):
+        user = ClaimsUser({'user_id': 1, 'u_type': 'station_admin', 'institutions': [], 'stations': [3]})
+        self.assertEqual(self.get(user).status_code, 403)
+
+    def test_institution_admin_and_super_admin_are_allowed(self):
+        for user in (
+            ClaimsUser({'user_id': 1, 'u_type': 'admin', 'institutions': [3], 'stations': []}),
+            ClaimsUser({'user_id': 2, 'u_type': 'super_admin'}),
+        ):
+            response = self.get(user)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {'institution': {'institution_id': 3}})
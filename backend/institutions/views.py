@@ -1,13 +1,27 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction, IntegrityError
+from django.db.models import Count, Q
+from django.utils import timezone
+from measurements.queries import describe_readings, hourly_coverage, latest_readings
+from reports.alerting import open_since
+from reports.models import AlertEvent
+from reports.thresholds import SEVERITIES
+from sensors.models import Sensor
 from .models import Institution
 from .serializers import InstitutionSerializer
 from stations.models import Station
 from stations.serializers import StationSerializer
 from users.models import User, Email
+from users.tokens import claims_user
 from users.views import approve_user
+from vrisa_backend.metrics import CACHE_REQUESTS
+
+# sensor.s_state spellings found in the DML and written by the frontend
+ACTIVE_SENSOR_STATES = ('activo', 'active')
 
 
 class InstitutionViewSet(viewsets.ModelViewSet):
@@ -33,6 +47,75 @@ class InstitutionViewSet(viewsets.ModelViewSet):
         except Exception as ex:
             return Response({'error': 'No se pudo listar estaciones', 'detail': str(ex)}, status=500)
 
+    @action(detail=True, methods=['get'])
+    def dashboard(self, request, pk=None):
+        """Everything the institution dashboard shows, in a fixed number of queries.
+
+        Stations, sensor counts, latest reading per variable, open alerts by severity and
+        the share of the last `DASHBOARD_COVERAGE_HOURS` hours each station reported in.
+        Cached per institution for `INSTITUTION_DASHBOARD_CACHE_SECONDS`. Needs a bearer
+        token of an administrator of the institution (or a super admin).
+        """
+        user = claims_user(request)
+        if user is None:
+            return Response({'error': 'Se requiere un token de acceso'}, status=401)
+        if not user.manages_institution(pk):
+            return Response({'error': 'No administra esta institución'}, status=403)
+        key = f'institution-dashboard:{pk}'
+        data = cache.get(key)
+        CACHE_REQUESTS.inc(cache='dashboard', result='miss' if data is None else 'hit')
+        if data is None:
+            try:
+                inst = self.get_queryset().filter(pk=pk).values('institution_id', 'i_name').first()
+                if not inst:
+                    return Response({'error': 'Institución no encontrada'}, status=404)
+                data = self._dashboard(inst)
+            except Exception as ex:
+                return Response({'error': 'No se pudo construir el tablero', 'detail': str(ex)}, status=500)
+            cache.set(key, data, getattr(settings, 'INSTITUTION_DASHBOARD_CACHE_SECONDS', 30))
+        return Response(data)
+
+    def _dashboard(self, inst):
+        stations = list(
+            Station.objects.filter(institution_id=inst['institution_id'])
+            .values('station_id', 's_name', 'lat', 'lon', 'latitude', 'longitude', 's_state', 'maintenance_date')
+            .order_by('-station_id')
+        )
+        ids = [s['station_id'] for s in stations]
+        sensors = {
+            row['station_id']: row
+            for row in Sensor.objects.filter(station_id__in=ids).values('station_id').annotate(
+                total=Count('sensor_id'), active=Count('sensor_id', filter=Q(s_state__in=ACTIVE_SENSOR_STATES)),
+            ).order_by()
+        }
+        alerts = {}
+        for row in (AlertEvent.objects.filter(station_id__in=ids, last_seen__gte=open_since())
+                    .values('station_id', 'severity').annotate(n=Count('event_id')).order_by()):
+            alerts.setdefault(row['station_id'], {})[row['severity']] = row['n']
+        latest = latest_readings(ids)
+        hours = getattr(settings, 'DASHBOARD_COVERAGE_HOURS', 24)
+        coverage = hourly_coverage(ids, hours)
+
+        totals = {'stations': len(stations), 'sensors': 0, 'active_sensors': 0, 'open_alerts': {sev: 0 for sev in SEVERITIES}}
+        for s in stations:
+            s_id = s['station_id']
+            counts = sensors.get(s_id, {})
+            s['sensors'] = {'total': counts.get('total', 0), 'active': counts.get('active', 0)}
+            s['open_alerts'] = {sev: alerts.get(s_id, {}).get(sev, 0) for sev in SEVERITIES}
+            s['latest'] = describe_readings(latest.get(s_id, []))
+            s['completeness'] = coverage.get(s_id, 0.0)
+            totals['sensors'] += s['sensors']['total']
+            totals['active_sensors'] += s['sensors']['active']
+            for sev, n in s['open_alerts'].items():
+                totals['open_alerts'][sev] += n
+        return {
+            'institution': inst,
+            'generated_at': timezone.now(),
+            'coverage_hours': hours,
+            'totals': totals,
+            'stations': stations,
+        }
+
 
 # Atomic creation of institution + user (institution account)
 @api_view(['POST'])
@@ -6,4 +6,4 @@ from .models import Measurement
 class MeasurementAdmin(admin.ModelAdmin):
     list_display = ('m_id', 'm_date', 'm_value', 'sensor', 'variable')
     search_fields = ('m_value',)
-    list_filter = ('m_date', 'sensor', 'variable')
\ No newline at end of file
+    list_filter = ('m_date', 'sensor', 'variable')
@@ -4,4 +4,31 @@ from django.apps import AppConfig
 class MeasurementsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'measurements'
-    verbose_name = 'Mediciones'
\ No newline at end of file
+    verbose_name = 'Mediciones'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save, pre_save
+        from .ingest import on_revised
+        from .models import Measurement
+
+        def remember_stored(sender, instance, raw=False, **kwargs):
+            # an edit can move a reading to another series or time; the old place is redone too
+            if raw or instance.pk is None:
+                return
+            instance._stored_as = (
+                Measurement.objects.filter(pk=instance.pk).values_list('sensor_id', 'variable_id', 'm_date').first()
+            )
+
+        def edited(sender, instance, created=False, raw=False, **kwargs):
+            # new rows go through on_ingested
+            if created or raw:
+                return
+            stored = getattr(instance, '_stored_as', None)
+            on_revised([(instance.sensor_id, instance.variable_id, instance.m_date)] + ([stored] if stored else []))
+
+        def deleted(sender, instance, **kwargs):
+            on_revised([(instance.sensor_id, instance.variable_id, instance.m_date)])
+
+        pre_save.connect(remember_stored, sender=Measurement, dispatch_uid='measurements.revision.pre_save')
+        post_save.connect(edited, sender=Measurement, dispatch_uid='measurements.revision.save')
+        post_delete.connect(deleted, sender=Measurement, dispatch_uid='measurements.revision.delete')
@@ -0,0 +1,352 @@
+"""Append-only columnar archive of sealed measurement months.
+
+`python manage.py export_columnar` writes every sealed month (a month that is over),
+read from `measurement` so rows left in the default partition are included, as one
+segment per variable under `COLUMNAR_ARCHIVE_DIR`:
+
+    v<variable_id>/<YYYY-MM>.ts    int64 epoch seconds
+    v<variable_id>/<YYYY-MM>.val   float32 values
+
+Rows of a segment are sorted by station, sensor and then time; `manifest.json`
+records, per segment, the station and [offset, count] slice of every sensor, so a
+station filter is a few slices of the memory-mapped arrays and calibration
+corrections apply to the sensor they belong to.
+
+Months are exported in order, from the oldest row on, and never rewritten. Every run
+records the newest `m_id` it exported (`max_id`); rows that reach an archived month
+afterwards (late readings) are appended by the next run as extra segments
+(`<YYYY-MM>.<part>.ts`). So the archive holds every row before `ColumnarArchive.end`
+with an id up to `max_id`, and reports read the database from `end` on plus the rows
+before it with a higher id (`ReportPlan.queryset`).
+
+Readers open the segments with `numpy.memmap`; without NumPy, or before the first
+export, `open_archive()` returns None and callers keep using the database. Segments
+hold raw values; reads apply the calibration corrections (`sensors.calibration`).
+"""
+from datetime import date, datetime, timezone as dt_timezone
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.db import connection
+
+from stations.geo import station_id_set
+from . import partitions
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+# version 1 keyed slices by station only, version 2 had no max_id
+FORMAT_VERSION = 3
+TS_DTYPE = '<i8'
+VALUE_DTYPE = '<f4'
+
+
+def _month_key(month):
+    return f'{month:%Y-%m}'
+
+
+def _segment_paths(root, variable_id, month_key, part=0):
+    base = os.path.join(root, f'v{variable_id}', f'{month_key}.{part}' if part else month_key)
+    return base + '.ts', base + '.val'
+
+
+class Segment:
+    def __init__(self, root, entry):
+        self.variable_id = entry['variable_id']
+        self.month = entry['month']
+        self.rows = entry['rows']
+        # sensor_id -> (station_id, offset, count)
+        self.sensors = {int(k): v for k, v in entry['sensors'].items()}
+        self._paths = _segment_paths(root, self.variable_id, self.month, entry.get('part', 0))
+
+    def arrays(self):
+        ts_path, val_path = self._paths
+        if not self.rows:
+            return np.empty(0, dtype=TS_DTYPE), np.empty(0, dtype=VALUE_DTYPE)
+        return (np.memmap(ts_path, dtype=TS_DTYPE, mode='r', shape=(self.rows,)),
+                np.memmap(val_path, dtype=VALUE_DTYPE, mode='r', shape=(self.rows,)))
+
+    def station_slices(self, stations=None):
+        """Yield (station_id, ts, values) memmap slices, one per sensor, optionally only for a set of stations.
+
+        Slices with a calibration correction come back as corrected float64 copies.
+        """
+        from sensors.calibration import registry as calibration
+
+        ts, values = self.arrays()
+        for sensor_id, (s_id, offset, count) in sorted(self.sensors.items(), key=lambda item: item[1][1]):
+            if stations is not None and s_id not in stations:
+                continue
+            s_ts = ts[offset:offset + count]
+            yield s_id, s_ts, calibration.correct(sensor_id, self.variable_id, s_ts, values[offset:offset + count])
+
+
+class ColumnarArchive:
+    def __init__(self, root, manifest):
+        self.root = root
+        self.months = manifest['months']
+        self.max_id = manifest['max_id']
+        self.segments = [Segment(root, entry) for entry in manifest['segments']]
+
+    @property
+    def end(self):
+        """First instant not covered by the archive (aware UTC datetime)."""
+        last = partitions.add_months(datetime.strptime(self.months[-1], '%Y-%m').date(), 1)
+        return datetime(last.year, last.month, 1, tzinfo=dt_timezone.utc)
+
+    def _segments(self, variable_ids=None):
+        for seg in self.segments:
+            if variable_ids is None or seg.variable_id in variable_ids:
+                yield seg
+
+    def parts(self, variable_ids=None, station_id=None):
+        """(station_id, variable_id, ts, values) slices, the shape `series_cache.query` returns
+        (one per sensor).
+
+        `station_id` is one id, a collection of ids, or None for every station.
+        """
+        stations = station_id_set(station_id)
+        for seg in self._segments(variable_ids):
+            for s_id, ts, values in seg.station_slices(stations):
+                yield s_id, seg.variable_id, ts, values
+
+    def totals_by_variable(self, station_id=None, variable_ids=None):
+        """Per-variable samples/total/minimum/maximum, like `rollups.totals_by_variable`."""
+        out = {}
+        for s_id, v_id, _ts, values in self.parts(variable_ids, station_id):
+            if not len(values):
+                continue
+            t = out.setdefault(v_id, {'samples': 0, 'total': 0.0, 'minimum': None, 'maximum': None})
+            t['samples'] += len(values)
+            t['total'] += float(values.sum(dtype=np.float64))
+            lo, hi = float(values.min()), float(values.max())
+            t['minimum'] = lo if t['minimum'] is None else min(t['minimum'], lo)
+            t['maximum'] = hi if t['maximum'] is None else max(t['maximum'], hi)
+        return out
+
+    def totals_by_station(self, station_id=None, variable_ids=None):
+        """Per-station samples/total with the station columns `rollups.totals_by_station` returns."""
+        from stations.models import Station
+
+        out = {}
+        for s_id, _v_id, _ts, values in self.parts(variable_ids, station_id):
+            t = out.setdefault(s_id, {'samples': 0, 'total': 0.0})
+            t['samples'] += len(values)
+            t['total'] += float(values.sum(dtype=np.float64))
+        for row in Station.objects.filter(station_id__in=list(out)).values('station_id', 's_name', 'lat', 'lon'):
+            out[row['station_id']].update({
+                'sensor__station__station_id': row['station_id'],
+                'sensor__station__s_name': row['s_name'],
+                'sensor__station__lat': row['lat'],
+                'sensor__station__lon': row['lon'],
+            })
+        return {s_id: t for s_id, t in out.items() if 'sensor__station__station_id' in t}
+
+    def hourly_buckets(self, variable_ids=None, station_id=None):
+        """Yield (bucket, samples, value_sum) per hour, like `rollups.hourly_buckets`."""
+        stations = station_id_set(station_id)
+        for seg in self._segments(variable_ids):
+            chunks = [(ts // 3600, values) for _s, ts, values in seg.station_slices(stations) if len(ts)]
+            if not chunks:
+                continue
+            # each sensor slice is time-ordered, so its first/last hour bound the segment
+            first = min(int(h[0]) for h, _v in chunks)
+            last = max(int(h[-1]) for h, _v in chunks)
+            sums = np.zeros(last - first + 1)
+            counts = np.zeros(last - first + 1, dtype=np.int64)
+            for h, values in chunks:
+                sums += np.bincount(h - first, weights=values, minlength=len(sums))
+                counts += np.bincount(h - first, minlength=len(counts))
+            for i in np.flatnonzero(counts):
+                bucket = datetime.fromtimestamp(int(first + i) * 3600, dt_timezone.utc)
+                yield bucket, int(counts[i]), float(sums[i])
+
+
+_cache = {}
+
+
+def archive_dir():
+    return getattr(settings, 'COLUMNAR_ARCHIVE_DIR', None)
+
+
+def read_manifest(root):
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return {'version': FORMAT_VERSION, 'months': [], 'max_id': 0, 'segments': []}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def open_archive():
+    """The archive under `COLUMNAR_ARCHIVE_DIR`, or None when it is missing or unusable."""
+    root = archive_dir()
+    if np is None or not root:
+        return None
+    path = os.path.join(root, MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    cached = _cache.get(root)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        manifest = read_manifest(root)
+    except (OSError, ValueError):
+        logger.exception('Could not read columnar archive manifest %s', path)
+        return None
+    if manifest.get('version', 1) != FORMAT_VERSION:
+        logger.error('Columnar archive %s has format version %s, expected %s; remove it and run export_columnar',
+                     root, manifest.get('version', 1), FORMAT_VERSION)
+        archive = None
+    else:
+        archive = ColumnarArchive(str(root), manifest) if manifest['months'] else None
+    _cache[root] = (mtime, archive)
+    return archive
+
+
+def _write_manifest(root, manifest):
+    tmp = os.path.join(root, MANIFEST + '.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp, os.path.join(root, MANIFEST))
+
+
+def _month_range(month):
+    nxt = partitions.add_months(month, 1)
+    return (datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc),
+            datetime(nxt.year, nxt.month, 1, tzinfo=dt_timezone.utc))
+
+
+def _export_segment(cursor, root, variable_id, month_key, part, where, params):
+    """Write the `measurement` rows of one variable matching `where`; returns the manifest entry."""
+    ts_path, val_path = _segment_paths(root, variable_id, month_key, part)
+    os.makedirs(os.path.dirname(ts_path), exist_ok=True)
+    cursor.execute(
+        f"SELECT s.station_id, m.sensor_id, extract(epoch FROM m.m_date)::bigint, m.m_value::float8"
+        f" FROM measurement m JOIN sensor s ON s.sensor_id = m.sensor_id"
+        f" WHERE m.variable_id = %s AND {where} ORDER BY s.station_id, m.sensor_id, m.m_date",
+        [variable_id, *params],
+    )
+    sensors = {}
+    rows = 0
+    with open(ts_path + '.tmp', 'wb') as ts_fh, open(val_path + '.tmp', 'wb') as val_fh:
+        while True:
+            chunk = cursor.fetchmany(50000)
+            if not chunk:
+                break
+            station_col, sensor_col, ts_col, val_col = zip(*chunk)
+            np.asarray(ts_col, dtype=TS_DTYPE).tofile(ts_fh)
+            np.asarray(val_col, dtype=VALUE_DTYPE).tofile(val_fh)
+            for s_id, sensor_id in zip(station_col, sensor_col):
+                entry = sensors.get(sensor_id)
+                if entry is None:
+                    sensors[sensor_id] = [s_id, rows, 1]
+                else:
+                    entry[2] += 1
+                rows += 1
+    os.replace(ts_path + '.tmp', ts_path)
+    os.replace(val_path + '.tmp', val_path)
+    return {'variable_id': variable_id, 'month': month_key, 'part': part, 'rows': rows,
+            'sensors': {str(k): v for k, v in sensors.items()}}
+
+
+def _export_late_rows(cur, root, manifest, max_id, log=None):
+    """Append the rows that reached archived months since the last run, as extra segments."""
+    end = ColumnarArchive(root, manifest).end
+    cur.execute(
+        "SELECT DISTINCT date_trunc('month', m_date AT TIME ZONE 'UTC'), variable_id FROM measurement"
+        " WHERE m_date < %s AND m_id > %s AND m_id <= %s",
+        [end, manifest['max_id'], max_id],
+    )
+    parts = {}
+    for seg in manifest['segments']:
+        key = (seg['variable_id'], seg['month'])
+        parts[key] = max(parts.get(key, 0), seg.get('part', 0))
+    for month, variable_id in sorted(cur.fetchall()):
+        key = _month_key(month)
+        start, nxt = _month_range(month)
+        part = parts.get((variable_id, key), 0) + 1
+        parts[(variable_id, key)] = part
+        entry = _export_segment(
+            cur, root, variable_id, key, part, 'm.m_date >= %s AND m.m_date < %s AND m.m_id > %s AND m.m_id <= %s',
+            [start, nxt, manifest['max_id'], max_id],
+        )
+        if entry['rows']:
+            manifest['segments'].append(entry)
+            if log:
+                log(f'Appended {entry["rows"]} late rows of variable {variable_id} to {key}')
+
+
+def export_sealed(root=None, today=None, dry_run=False, log=None):
+    """Export every sealed month after the archive, and the late rows of archived months;
+    returns the exported month keys.
+
+    Export stops at the first month that already has compacted rows: its raw rows are
+    partly gone, and the archive must stay complete up to `end`. The manifest is
+    written once, at the end, so an interrupted run leaves the archive as it was.
+    """
+    from .models import MeasurementDaily
+
+    if np is None:
+        raise RuntimeError('numpy is required for the columnar archive')
+    root = str(root or archive_dir())
+    os.makedirs(root, exist_ok=True)
+    manifest = read_manifest(root)
+    if manifest.get('version', 1) != FORMAT_VERSION:
+        raise RuntimeError(f'{root} holds a columnar archive in format {manifest.get("version", 1)}; '
+                           f'remove it and export again')
+    exported = []
+    with connection.cursor() as cur:
+        # rows up to this id are exported by this run, later ones by the next
+        cur.execute("SELECT max(m_id), min(m_date) FROM measurement")
+        max_id, oldest = cur.fetchone()
+        if max_id is None:
+            return exported
+        if manifest['months'] and max_id > manifest['max_id'] and not dry_run:
+            _export_late_rows(cur, root, manifest, max_id, log)
+
+        current = partitions.month_start(today or date.today())
+        if manifest['months']:
+            month = partitions.add_months(datetime.strptime(manifest['months'][-1], '%Y-%m').date(), 1)
+        else:
+            month = partitions.month_start(oldest.astimezone(dt_timezone.utc))
+        while partitions.add_months(month, 1) <= current:
+            key = _month_key(month)
+            start, end = _month_range(month)
+            if MeasurementDaily.objects.filter(bucket__gte=start, bucket__lt=end).exists():
+                if log:
+                    log(f'Stopping at {key}: it already has compacted rows; keep raw_days above a month to archive it')
+                break
+            if dry_run:
+                if log:
+                    log(f'Would export {key}')
+            else:
+                cur.execute(
+                    "SELECT DISTINCT variable_id FROM measurement WHERE m_date >= %s AND m_date < %s AND m_id <= %s"
+                    " ORDER BY variable_id",
+                    [start, end, max_id],
+                )
+                variable_ids = [row[0] for row in cur.fetchall()]
+                entries = [
+                    _export_segment(cur, root, v_id, key, 0, 'm.m_date >= %s AND m.m_date < %s AND m.m_id <= %s',
+                                    [start, end, max_id])
+                    for v_id in variable_ids
+                ]
+                manifest['segments'].extend(e for e in entries if e['rows'])
+                manifest['months'].append(key)
+                if log:
+                    log(f'Exported {key}: {sum(e["rows"] for e in entries)} rows in {len(entries)} segments')
+            exported.append(key)
+            month = partitions.add_months(month, 1)
+    if not dry_run:
+        manifest['max_id'] = max_id
+        _write_manifest(root, manifest)
+    return exported
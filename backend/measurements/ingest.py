@@ -0,0 +1,118 @@
+"""Post-ingest processing for measurement batches.
+
+Every code path that stores measurements should hand the saved rows to
+`on_ingested`, which runs the per-batch hooks once the transaction commits and
+records the ingest metrics (rows per station, commit latency) on `/metrics`.
+Edits and deletes of stored measurements go through `on_revised` instead.
+"""
+import logging
+import time
+
+from django.db import transaction
+
+from vrisa_backend import metrics
+
+logger = logging.getLogger(__name__)
+
+INGESTED_ROWS = metrics.counter('vrisa_ingest_rows_total', 'Measurements stored, by station', ['station'])
+INGEST_BATCHES = metrics.histogram(
+    'vrisa_ingest_batch_rows', 'Measurements per stored batch', buckets=(1, 10, 50, 100, 500, 1000, 5000),
+)
+INGEST_COMMIT_SECONDS = metrics.histogram(
+    'vrisa_ingest_commit_seconds', 'From the start of a batch write to its commit',
+)
+INGEST_HOOK_FAILURES = metrics.counter('vrisa_ingest_hook_failures_total', 'Failed post-ingest hooks', ['hook'])
+
+
+def on_ingested(measurements, started=None):
+    """`started` (time.perf_counter()) is when the write began; the commit latency is measured from it."""
+    measurements = list(measurements)
+    if not measurements:
+        return
+    started = started if started is not None else time.perf_counter()
+    transaction.on_commit(lambda: process_batch(measurements, started))
+
+
+def _record_batch(measurements, started):
+    from .series_cache import series_cache
+
+    INGEST_COMMIT_SECONDS.observe(time.perf_counter() - started)
+    INGEST_BATCHES.observe(len(measurements))
+    per_sensor = {}
+    for m in measurements:
+        per_sensor[m.sensor_id] = per_sensor.get(m.sensor_id, 0) + 1
+    per_station = {}
+    for sensor_id, station_id in series_cache.stations_of(per_sensor).items():
+        per_station[station_id] = per_station.get(station_id, 0) + per_sensor[sensor_id]
+    for station_id, n in per_station.items():
+        INGESTED_ROWS.inc(n, station='' if station_id is None else station_id)
+
+
+def process_batch(measurements, started=None):
+    """Run the ingest hooks for a committed batch; failures never reject the data."""
+    from reports.alerting import evaluate_batch
+    from .series_cache import series_cache
+    from .stream import publish_alert_events, publish_measurements
+
+    if started is not None:
+        try:
+            _record_batch(measurements, started)
+        except Exception:
+            logger.exception('Recording metrics for a batch of %d measurements failed', len(measurements))
+    try:
+        series_cache.append(measurements)
+    except Exception:
+        INGEST_HOOK_FAILURES.inc(hook='series_cache')
+        logger.exception('Appending a batch of %d measurements to the series cache failed', len(measurements))
+    alert_events = []
+    try:
+        alert_events = evaluate_batch(measurements)
+    except Exception:
+        INGEST_HOOK_FAILURES.inc(hook='alerts')
+        logger.exception('Alert evaluation failed for a batch of %d measurements', len(measurements))
+    try:
+        publish_measurements(measurements)
+        publish_alert_events(alert_events)
+    except Exception:
+        INGEST_HOOK_FAILURES.inc(hook='stream')
+        logger.exception('Publishing a batch of %d measurements to stream clients failed', len(measurements))
+
+
+def on_revised(revisions):
+    """`revisions` are (sensor_id, variable_id, m_date) of edited or deleted measurements, before and after.
+
+    Logs them in `measurement_revision`, so every worker's series cache re-reads those
+    series, and rebuilds the alert episodes around them once the transaction commits.
+    """
+    from .models import MeasurementRevision
+
+    revisions = set(revisions)
+    if not revisions:
+        return
+    MeasurementRevision.objects.bulk_create([
+        MeasurementRevision(sensor_id=sensor_id, variable_id=variable_id, m_date=m_date)
+        for sensor_id, variable_id, m_date in revisions
+    ])
+    transaction.on_commit(lambda: process_revisions(revisions))
+
+
+def process_revisions(revisions):
+    """Run the revision hooks for committed edits or deletes; failures never undo them."""
+    from reports.alerting import reevaluate
+    from .series_cache import series_cache
+
+    try:
+        series_cache.reset({(sensor_id, variable_id) for sensor_id, variable_id, _m_date in revisions})
+    except Exception:
+        INGEST_HOOK_FAILURES.inc(hook='series_cache')
+        logger.exception('Re-reading %d revised series in the series cache failed', len(revisions))
+    windows = {}
+    for sensor_id, variable_id, m_date in revisions:
+        first, last = windows.get((sensor_id, variable_id), (m_date, m_date))
+        windows[sensor_id, variable_id] = (min(first, m_date), max(last, m_date))
+    for (sensor_id, variable_id), (first, last) in windows.items():
+        try:
+            reevaluate(sensor_id, first, last, variable_id=variable_id)
+        except Exception:
+            INGEST_HOOK_FAILURES.inc(hook='alerts')
+            logger.exception('Alert re-evaluation failed for sensor %s, variable %s', sensor_id, variable_id)
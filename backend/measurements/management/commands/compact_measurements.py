@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from measurements import archive, rollups
+
+
+class Command(BaseCommand):
+    help = ('Compact raw measurements older than the per-variable-type retention '
+            '(MEASUREMENT_RETENTION) into hourly/daily rollups, optionally archiving them first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', dest='v_types', action='append',
+                            help='Only process this Variable.v_type (repeatable).')
+        parser.add_argument('--no-archive', action='store_true', help='Skip writing archive files.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be compacted and pruned.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        archive_dir = None if options['no_archive'] else getattr(settings, 'MEASUREMENT_ARCHIVE_DIR', None)
+        if archive.archive_dir() and archive.np is not None:
+            # sealed months must reach the columnar archive before their raw rows are compacted
+            try:
+                archive.export_sealed(dry_run=dry_run, log=self.stdout.write)
+            except RuntimeError as exc:
+                raise CommandError(f'{exc}; nothing was compacted')
+        for v_type, variable_ids in sorted(rollups.variables_by_type().items()):
+            if options['v_types'] and v_type not in options['v_types']:
+                continue
+            cfg = rollups.retention_for(v_type)
+            moved = rollups.compact(v_type, variable_ids, cfg, archive_dir=archive_dir, log=self.stdout.write,
+                                    dry_run=dry_run)
+            pruned = rollups.prune_hourly(variable_ids, cfg, dry_run=dry_run)
+            verb = 'would be' if dry_run else 'were'
+            self.stdout.write(self.style.SUCCESS(
+                f'{v_type}: {moved} raw rows {verb} compacted, {pruned} hourly rollups {verb} pruned'
+            ))
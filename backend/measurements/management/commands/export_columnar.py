@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from measurements import archive
+
+
+class Command(BaseCommand):
+    help = ('Append sealed measurement months, and rows that reached archived months since the last run, '
+            'to the columnar archive (COLUMNAR_ARCHIVE_DIR).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if not archive.archive_dir():
+            raise CommandError('COLUMNAR_ARCHIVE_DIR is not set.')
+        try:
+            exported = archive.export_sealed(dry_run=options['dry_run'], log=self.stdout.write)
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'{len(exported)} month(s) exported'))
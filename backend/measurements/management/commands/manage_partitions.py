@@ -0,0 +1,61 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from measurements import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly measurement partitions and detach or drop expired ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=None,
+                            help='Months to create after the current one (default MEASUREMENT_PARTITIONS_AHEAD).')
+        parser.add_argument('--retention-months', type=int, default=None,
+                            help='Remove partitions entirely older than N months (default MEASUREMENT_RETENTION_MONTHS; unset keeps everything).')
+        parser.add_argument('--detach-only', action='store_true',
+                            help='Detach expired partitions but keep them as standalone tables.')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        ahead = options['ahead'] if options['ahead'] is not None else getattr(settings, 'MEASUREMENT_PARTITIONS_AHEAD', 3)
+        retention = options['retention_months']
+        if retention is None:
+            retention = getattr(settings, 'MEASUREMENT_RETENTION_MONTHS', None)
+        dry_run = options['dry_run']
+        current = partitions.month_start(date.today())
+
+        with connection.cursor() as cur:
+            if not partitions.is_partitioned(cur):
+                raise CommandError('Table "measurement" is not partitioned; recreate it from database/vrisa.ddl.sql first.')
+
+            existing = {month for month, _name in partitions.list_partitions(cur)}
+            wanted = {partitions.add_months(current, n) for n in range(ahead + 1)}
+            # also give rows parked in the default partition a proper home
+            wanted.update(partitions.months_in_default(cur))
+
+            for month in sorted(wanted - existing):
+                name = partitions.partition_name(month)
+                if dry_run:
+                    self.stdout.write(f'Would create {name}')
+                    continue
+                moved = partitions.create_partition(cur, month)
+                self.stdout.write(f'Created {name}' + (f' ({moved} rows moved from default)' if moved else ''))
+
+            if retention is None:
+                return
+            cutoff = partitions.add_months(current, -retention)
+            for month, name in partitions.list_partitions(cur):
+                if partitions.add_months(month, 1) > cutoff:
+                    continue
+                if dry_run:
+                    self.stdout.write(f'Would {"detach" if options["detach_only"] else "drop"} {name}')
+                    continue
+                partitions.detach_partition(cur, name)
+                if options['detach_only']:
+                    self.stdout.write(f'Detached {name}')
+                else:
+                    partitions.drop_table(cur, name)
+                    self.stdout.write(f'Dropped {name}')
@@ -1,3 +1,4 @@
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -11,8 +12,61 @@ class Measurement(models.Model):
 
     class Meta:
         db_table = 'measurement'
+        # Partitioned by month on m_date in vrisa.ddl.sql; the indexes live there too
+        indexes = [
+            models.Index(fields=['variable', 'sensor', 'm_date'], name='measurement_var_sensor_idx'),
+            models.Index(fields=['sensor', 'm_date'], name='measurement_sensor_date_idx'),
+            BrinIndex(fields=['m_date'], name='measurement_date_brin'),
+        ]
         verbose_name = _('Medición')
         verbose_name_plural = _('Mediciones')
 
     def __str__(self):
-        return f"{self.m_date}: {self.m_value}"
\ No newline at end of file
+        return f"{self.m_date}: {self.m_value}"
+
+
+class MeasurementRevision(models.Model):
+    """A measurement that was edited or deleted; series caches re-read its series (see measurements/series_cache.py)."""
+    revision_id = models.BigAutoField(primary_key=True)
+    sensor = models.ForeignKey('sensors.Sensor', on_delete=models.CASCADE, db_column='sensor_id', verbose_name=_('Sensor'))
+    variable = models.ForeignKey('variables.Variable', on_delete=models.RESTRICT, db_column='variable_id', verbose_name=_('Variable'))
+    m_date = models.DateTimeField(_('Fecha de medición'))
+    revised_at = models.DateTimeField(_('Revisado'), auto_now_add=True)
+
+    class Meta:
+        db_table = 'measurement_revision'
+        verbose_name = _('Revisión de medición')
+        verbose_name_plural = _('Revisiones de mediciones')
+
+
+class MeasurementRollup(models.Model):
+    """Aggregated measurements for one sensor/variable and time bucket (compacted tier)."""
+    pk = models.CompositePrimaryKey('variable_id', 'sensor_id', 'bucket')
+    sensor = models.ForeignKey('sensors.Sensor', on_delete=models.RESTRICT, db_column='sensor_id', verbose_name=_('Sensor'))
+    variable = models.ForeignKey('variables.Variable', on_delete=models.RESTRICT, db_column='variable_id', verbose_name=_('Variable'))
+    bucket = models.DateTimeField(_('Inicio del intervalo'))
+    samples = models.IntegerField(_('Muestras'))
+    value_sum = models.DecimalField(_('Suma'), max_digits=18, decimal_places=4)
+    value_min = models.DecimalField(_('Mínimo'), max_digits=10, decimal_places=4)
+    value_max = models.DecimalField(_('Máximo'), max_digits=10, decimal_places=4)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def value_avg(self):
+        return self.value_sum / self.samples if self.samples else None
+
+
+class MeasurementHourly(MeasurementRollup):
+    class Meta:
+        db_table = 'measurement_hourly'
+        verbose_name = _('Medición horaria')
+        verbose_name_plural = _('Mediciones horarias')
+
+
+class MeasurementDaily(MeasurementRollup):
+    class Meta:
+        db_table = 'measurement_daily'
+        verbose_name = _('Medición diaria')
+        verbose_name_plural = _('Mediciones diarias')
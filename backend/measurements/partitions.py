@@ -0,0 +1,109 @@
+"""Helpers for the monthly range partitions of the `measurement` table.
+
+Partitions are named `measurement_yYYYYmMM` and cover [first day of month, first day
+of next month). Rows outside every monthly partition land in `measurement_default`;
+creating the partition for their month moves them out of it.
+"""
+from datetime import date
+import re
+
+from django.db import connection, transaction
+
+PARENT = 'measurement'
+DEFAULT_PARTITION = 'measurement_default'
+
+_NAME_RE = re.compile(r'^measurement_y(\d{4})m(\d{2})$')
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + (month.month - 1) + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARENT}_y{month.year:04d}m{month.month:02d}'
+
+
+def partition_month(name):
+    match = _NAME_RE.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def is_partitioned(cursor):
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+        [PARENT],
+    )
+    return cursor.fetchone()[0]
+
+
+def list_partitions(cursor):
+    """Return the attached monthly partitions as a sorted list of (month, name)."""
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        """,
+        [PARENT],
+    )
+    out = []
+    for (name,) in cursor.fetchall():
+        month = partition_month(name)
+        if month is not None:
+            out.append((month, name))
+    return sorted(out)
+
+
+def months_in_default(cursor):
+    cursor.execute(
+        f"SELECT DISTINCT date_trunc('month', m_date)::date FROM {connection.ops.quote_name(DEFAULT_PARTITION)}"
+    )
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+def create_partition(cursor, month):
+    """Create the partition for `month`, moving any matching rows out of the default partition."""
+    name = connection.ops.quote_name(partition_name(month))
+    parent = connection.ops.quote_name(PARENT)
+    default = connection.ops.quote_name(DEFAULT_PARTITION)
+    start, end = month, add_months(month, 1)
+    with transaction.atomic():
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {default} WHERE m_date >= %s AND m_date < %s)",
+            [start, end],
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(f"CREATE TABLE {name} PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)", [start, end])
+            return 0
+        # Postgres refuses to attach a range that the default partition still holds rows for
+        cursor.execute(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {default} WHERE m_date >= %s AND m_date < %s RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved",
+            [start, end],
+        )
+        moved = cursor.rowcount
+        cursor.execute(f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end])
+        return moved
+
+
+def detach_partition(cursor, name):
+    cursor.execute(f"ALTER TABLE {connection.ops.quote_name(PARENT)} DETACH PARTITION {connection.ops.quote_name(name)}")
+
+
+def drop_table(cursor, name):
+    cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+
+
+def sealed_partitions(cursor, today=None):
+    """Monthly partitions that can no longer receive rows (their month is over)."""
+    current = month_start(today or date.today())
+    return [(month, name) for month, name in list_partitions(cursor) if add_months(month, 1) <= current]
@@ -0,0 +1,108 @@
+"""Read helpers shared by views that show the current state of stations."""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+
+from .series_cache import np, series_cache
+
+# hours with at least one reading, per station
+COVERAGE_SQL = """
+    SELECT s.station_id, COUNT(DISTINCT date_trunc('hour', m.m_date))
+      FROM measurement m
+      JOIN sensor s ON s.sensor_id = m.sensor_id
+     WHERE s.station_id = ANY(%s) AND m.m_date >= %s AND m.m_date < %s
+     GROUP BY s.station_id
+"""
+
+# newest row per station/variable; the (variable_id, sensor_id, m_date) index serves the sort
+LATEST_SQL = """
+    SELECT DISTINCT ON (s.station_id, m.variable_id)
+           s.station_id, m.variable_id, m.m_date, m.m_value::float8
+      FROM measurement m
+      JOIN sensor s ON s.sensor_id = m.sensor_id
+     WHERE s.station_id = ANY(%s) {since}
+     ORDER BY s.station_id, m.variable_id, m.m_date DESC
+"""
+
+
+def latest_readings(station_ids, hours=None):
+    """Newest reading of every variable of each station: {station_id: [{variable_id, datetime, value}]}.
+
+    Only readings from the last `hours` (default `LATEST_READINGS_HOURS`, None for all
+    history) count. The series cache answers when it holds that window; otherwise a
+    single DISTINCT ON query does.
+    """
+    station_ids = [int(s) for s in station_ids]
+    out = {s_id: [] for s_id in station_ids}
+    if not station_ids:
+        return out
+    if hours is None:
+        hours = getattr(settings, 'LATEST_READINGS_HOURS', 24)
+    now = datetime.now(dt_timezone.utc)
+    since = now - timedelta(hours=hours) if hours else None
+    parts = series_cache.query(since, now, None, station_ids) if since is not None else None
+    if parts is not None:
+        # one part per sensor: keep the newest reading of each station/variable
+        newest = {}
+        for s_id, v_id, ts, values in parts:
+            if (s_id, v_id) not in newest or ts[-1] > newest[(s_id, v_id)][0]:
+                newest[(s_id, v_id)] = (int(ts[-1]), float(values[-1]))
+        for (s_id, v_id), (ts, value) in sorted(newest.items()):
+            out[s_id].append({
+                'variable_id': v_id,
+                'datetime': datetime.fromtimestamp(ts, dt_timezone.utc),
+                'value': value,
+            })
+        return out
+    params = [station_ids]
+    if since is not None:
+        params.append(since)
+    with connection.cursor() as cur:
+        cur.execute(LATEST_SQL.format(since='AND m.m_date >= %s' if since is not None else ''), params)
+        for s_id, v_id, m_date, value in cur.fetchall():
+            out[s_id].append({'variable_id': v_id, 'datetime': m_date, 'value': value})
+    return out
+
+
+def describe_readings(readings):
+    """`latest_readings()` entries with the variable name and unit, for API responses."""
+    from variables.catalog import catalog as variable_catalog
+
+    out = []
+    for reading in readings:
+        variable = variable_catalog.get(reading['variable_id']) or {}
+        out.append({
+            'variable_id': reading['variable_id'],
+            'variable': variable.get('v_name'),
+            'unit': variable.get('v_unit'),
+            'value': reading['value'],
+            'datetime': reading['datetime'].isoformat(),
+        })
+    return out
+
+
+def hourly_coverage(station_ids, hours=24):
+    """Share (0..1) of the last `hours` complete hours in which each station reported anything."""
+    station_ids = [int(s) for s in station_ids]
+    if not station_ids:
+        return {}
+    end = datetime.now(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(hours=hours)
+    seen = {s_id: 0 for s_id in station_ids}
+    parts = series_cache.query(start, end, None, station_ids)
+    if parts is not None:
+        end_ts = int(end.timestamp())
+        buckets = {}
+        for s_id, _v_id, ts, _values in parts:
+            ts = ts[ts < end_ts]
+            if len(ts):
+                buckets.setdefault(s_id, []).append(np.unique(ts // 3600))
+        for s_id, chunks in buckets.items():
+            seen[s_id] = len(np.unique(np.concatenate(chunks)))
+    else:
+        with connection.cursor() as cur:
+            cur.execute(COVERAGE_SQL, [station_ids, start, end])
+            for s_id, n in cur.fetchall():
+                seen[s_id] = n
+    return {s_id: round(n / hours, 4) for s_id, n in seen.items()}
@@ -0,0 +1,329 @@
+"""Compacted tier of the measurement history.
+
+Raw rows older than the retention configured for their variable type
+(`MEASUREMENT_RETENTION`, keyed by `Variable.v_type`) are folded into
+`measurement_hourly` and `measurement_daily` and deleted from `measurement` in the
+same statement, so raw rows and rollups never describe the same reading and
+readers can simply add both tiers together. Hourly rollups are kept for
+`hourly_days`; before that only daily rollups remain.
+
+Rollups aggregate raw values; the readers below apply calibration corrections to
+whole buckets (`sensors.calibration`).
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+import csv
+import gzip
+import os
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q, Sum
+from django.utils import timezone
+
+from sensors.calibration import registry as calibration
+from stations.geo import station_id_set
+from variables.catalog import catalog as variable_catalog
+from .models import Measurement, MeasurementDaily, MeasurementHourly
+
+DEFAULT_RETENTION = {'raw_days': None, 'hourly_days': None, 'archive': False}
+
+
+def retention_for(v_type):
+    config = getattr(settings, 'MEASUREMENT_RETENTION', {})
+    return {**DEFAULT_RETENTION, **config.get('default', {}), **config.get(v_type, {})}
+
+
+def _day_floor(dt):
+    return datetime.combine(dt.date(), time.min, tzinfo=dt.tzinfo)
+
+
+def _aware(dt):
+    if dt is not None and timezone.is_naive(dt):
+        return timezone.make_aware(dt, dt_timezone.utc)
+    return dt
+
+
+def _cutoff(days, now=None):
+    if days is None:
+        return None
+    return _day_floor((now or timezone.now()) - timedelta(days=days))
+
+
+def variables_by_type():
+    groups = {}
+    for row in variable_catalog.rows():
+        groups.setdefault(row['v_type'], []).append(row['v_id'])
+    return groups
+
+
+def raw_cutoff(variable_ids=None, now=None):
+    """Earliest instant before which some of the given variables may only exist as rollups.
+
+    Returns None when none of them is ever compacted.
+    """
+    cutoffs = []
+    for v_type, ids in variables_by_type().items():
+        if variable_ids is not None and not set(ids) & set(variable_ids):
+            continue
+        cut = _cutoff(retention_for(v_type)['raw_days'], now)
+        if cut is not None:
+            cutoffs.append(cut)
+    return max(cutoffs) if cutoffs else None
+
+
+def needs_compacted(start, variable_ids=None):
+    """Whether a window starting at `start` (None = all history) can reach compacted data."""
+    cut = raw_cutoff(variable_ids)
+    return cut is not None and (start is None or _aware(start) < cut)
+
+
+def _tier_filter(start, end, variable_ids, station_id):
+    q = Q()
+    if start is not None:
+        q &= Q(bucket__gte=_aware(start))
+    if end is not None:
+        q &= Q(bucket__lte=_aware(end))
+    if variable_ids is not None:
+        q &= Q(variable_id__in=variable_ids)
+    stations = station_id_set(station_id)
+    if stations is not None:
+        q &= Q(sensor__station_id__in=stations)
+    return q
+
+
+def _split_hourly_daily(variable_ids, now=None):
+    """Q objects selecting hourly rows where they are kept and daily rows before that."""
+    hourly_q, daily_q = Q(), Q()
+    any_pruned = False
+    for v_type, ids in variables_by_type().items():
+        if variable_ids is not None:
+            ids = [v for v in ids if v in variable_ids]
+        if not ids:
+            continue
+        cut = _cutoff(retention_for(v_type)['hourly_days'], now)
+        if cut is None:
+            continue
+        any_pruned = True
+        hourly_q &= ~Q(variable_id__in=ids, bucket__lt=cut)
+        daily_q |= Q(variable_id__in=ids, bucket__lt=cut)
+    if not any_pruned:
+        return hourly_q, None
+    return hourly_q, daily_q
+
+
+def hourly_buckets(start=None, end=None, variable_ids=None, station_id=None):
+    """Yield (bucket, samples, value_sum) from the compacted tier, finest resolution kept."""
+    base = _tier_filter(start, end, variable_ids, station_id)
+    hourly_q, daily_q = _split_hourly_daily(variable_ids)
+    total = Sum(calibration.corrected('value_sum', 'bucket', samples='samples'))
+    for row in (
+        MeasurementHourly.objects.filter(base & hourly_q)
+        .values('bucket').annotate(n=Sum('samples'), total=total).order_by('bucket')
+    ):
+        yield row['bucket'], row['n'], float(row['total'])
+    if daily_q is not None:
+        for row in (
+            MeasurementDaily.objects.filter(base & daily_q)
+            .values('bucket').annotate(n=Sum('samples'), total=total).order_by('bucket')
+        ):
+            yield row['bucket'], row['n'], float(row['total'])
+
+
+def _edge_ranges(start, end):
+    """Split [start, end] into (days, edges): the whole days it covers and its partial days.
+
+    `days` is a Q on `bucket`, or None when no whole day fits; `edges` are
+    (start, stop, inclusive) bounds of the partial days.
+    """
+    start, end = _aware(start), _aware(end)
+    first = start
+    if start is not None and start != _day_floor(start):
+        first = _day_floor(start) + timedelta(days=1)
+    last = None if end is None else _day_floor(end)
+    if first is not None and last is not None and first >= last:
+        return None, [(start, end, True)]
+    days, edges = Q(), []
+    if first is not None:
+        days &= Q(bucket__gte=first)
+        if start < first:
+            edges.append((start, first, False))
+    if last is not None:
+        days &= Q(bucket__lt=last)
+        edges.append((last, end, True))
+    return days, edges
+
+
+def _bucket_range(start, stop, inclusive):
+    return Q(bucket__gte=start, **{'bucket__lte' if inclusive else 'bucket__lt': stop})
+
+
+def _totals_parts(start, end, variable_ids, station_id):
+    """(model, Q) pairs covering [start, end] in the compacted tier, each reading once.
+
+    Whole days are read from the daily rollups and the partial days at the edges from
+    the hourly ones, clipped to the hour. Where a variable's hourly rows were pruned,
+    its edge days fall back to their daily rollups, so the whole edge day is counted.
+    """
+    base = _tier_filter(None, None, variable_ids, station_id)
+    days, edges = _edge_ranges(start, end)
+    parts = []
+    if days is not None:
+        parts.append((MeasurementDaily, base & days))
+    if edges:
+        hourly_q, daily_q = _split_hourly_daily(variable_ids)
+        hourly_edges, daily_edges = Q(), Q()
+        for lo, hi, inclusive in edges:
+            hourly_edges |= _bucket_range(lo, hi, inclusive)
+            daily_edges |= _bucket_range(_day_floor(lo), hi, inclusive)
+        parts.append((MeasurementHourly, base & hourly_q & hourly_edges))
+        if daily_q is not None:
+            parts.append((MeasurementDaily, base & daily_q & daily_edges))
+    return parts
+
+
+def _add_totals(into, key, row):
+    prev = into.get(key)
+    if prev is None:
+        into[key] = row
+        return
+    prev['samples'] += row['samples']
+    prev['total'] += row['total']
+    if 'minimum' in row:
+        prev['minimum'] = min(prev['minimum'], row['minimum'])
+        prev['maximum'] = max(prev['maximum'], row['maximum'])
+
+
+def totals_by_variable(start=None, end=None, station_id=None, variable_ids=None):
+    """Per-variable samples/sum/min/max of the compacted tier over [start, end]."""
+    out = {}
+    for model, q in _totals_parts(start, end, variable_ids, station_id):
+        for row in (
+            model.objects.filter(q)
+            .values('variable_id')
+            .annotate(
+                samples=Sum('samples'),
+                total=Sum(calibration.corrected('value_sum', 'bucket', samples='samples')),
+                minimum=Min(calibration.corrected('value_min', 'bucket')),
+                maximum=Max(calibration.corrected('value_max', 'bucket')),
+            )
+        ):
+            _add_totals(out, row['variable_id'], row)
+    return out
+
+
+def totals_by_station(start=None, end=None, station_id=None, variable_ids=None):
+    out = {}
+    for model, q in _totals_parts(start, end, variable_ids, station_id):
+        for row in (
+            model.objects.filter(q)
+            .values('sensor__station__station_id', 'sensor__station__s_name', 'sensor__station__lat', 'sensor__station__lon')
+            .annotate(samples=Sum('samples'), total=Sum(calibration.corrected('value_sum', 'bucket', samples='samples')))
+        ):
+            _add_totals(out, row['sensor__station__station_id'], row)
+    return out
+
+
+_ROLLUP_SQL = """
+    INSERT INTO {table} (sensor_id, variable_id, bucket, samples, value_sum, value_min, value_max)
+    SELECT sensor_id, variable_id, date_trunc('{unit}', m_date), count(*), sum(m_value), min(m_value), max(m_value)
+    FROM moved
+    GROUP BY sensor_id, variable_id, date_trunc('{unit}', m_date)
+    ON CONFLICT (variable_id, sensor_id, bucket) DO UPDATE SET
+        samples = {table}.samples + EXCLUDED.samples,
+        value_sum = {table}.value_sum + EXCLUDED.value_sum,
+        value_min = LEAST({table}.value_min, EXCLUDED.value_min),
+        value_max = GREATEST({table}.value_max, EXCLUDED.value_max)
+"""
+
+COMPACT_DAY_SQL = (
+    "WITH moved AS ("
+    " DELETE FROM measurement WHERE variable_id = ANY(%s) AND sensor_id IS NOT NULL AND m_date >= %s AND m_date < %s"
+    " RETURNING sensor_id, variable_id, m_date, m_value"
+    "), hourly AS (" + _ROLLUP_SQL.format(table='measurement_hourly', unit='hour') + " RETURNING 1"
+    ") " + _ROLLUP_SQL.format(table='measurement_daily', unit='day')
+)
+
+
+def archive_day(cursor, v_type, variable_ids, day, archive_dir):
+    """Write the raw rows of one day to `<archive_dir>/<v_type>/<YYYY>/<YYYY-MM-DD>.csv.gz`."""
+    folder = os.path.join(archive_dir, v_type, f'{day:%Y}')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{day:%Y-%m-%d}.csv.gz')
+    tmp = path + '.tmp'
+    cursor.execute(
+        "SELECT m_id, m_date, m_value, sensor_id, variable_id FROM measurement"
+        " WHERE variable_id = ANY(%s) AND sensor_id IS NOT NULL AND m_date >= %s AND m_date < %s ORDER BY m_date, m_id",
+        [variable_ids, day, day + timedelta(days=1)],
+    )
+    written = 0
+    with gzip.open(tmp, 'wt', newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(['m_id', 'm_date', 'm_value', 'sensor_id', 'variable_id'])
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            writer.writerows(rows)
+            written += len(rows)
+    if written:
+        if os.path.exists(path):
+            # a second run for the same day (late rows) appends a new file instead of clobbering
+            path = path.replace('.csv.gz', f'.{timezone.now():%Y%m%d%H%M%S}.csv.gz')
+        os.replace(tmp, path)
+    else:
+        os.remove(tmp)
+    return written
+
+
+def compact_day(cursor, variable_ids, day):
+    """Move one day of raw rows into the rollup tables; returns the number of raw rows moved."""
+    cursor.execute(
+        "SELECT count(*) FROM measurement WHERE variable_id = ANY(%s) AND sensor_id IS NOT NULL AND m_date >= %s AND m_date < %s",
+        [variable_ids, day, day + timedelta(days=1)],
+    )
+    count = cursor.fetchone()[0]
+    if count:
+        cursor.execute(COMPACT_DAY_SQL, [variable_ids, day, day + timedelta(days=1)])
+    return count
+
+
+def compact(v_type, variable_ids, cfg, now=None, archive_dir=None, log=None, dry_run=False):
+    """Compact every day older than the raw retention of `v_type`, one transaction per day.
+
+    With `dry_run` nothing changes; returns how many raw rows would be compacted.
+    """
+    cutoff = _cutoff(cfg['raw_days'], now)
+    if cutoff is None or not variable_ids:
+        return 0
+    if dry_run:
+        n = Measurement.objects.filter(variable_id__in=variable_ids, m_date__lt=cutoff).count()
+        if n and log:
+            log(f'{v_type}: would compact {n} rows older than {cutoff:%Y-%m-%d}')
+        return n
+    with connection.cursor() as cur:
+        cur.execute("SELECT min(m_date) FROM measurement WHERE variable_id = ANY(%s) AND m_date < %s", [variable_ids, cutoff])
+        oldest = cur.fetchone()[0]
+        if oldest is None:
+            return 0
+        day = _day_floor(_aware(oldest))
+        moved = 0
+        while day < cutoff:
+            with transaction.atomic():
+                if cfg['archive'] and archive_dir:
+                    archive_day(cur, v_type, variable_ids, day, archive_dir)
+                n = compact_day(cur, variable_ids, day)
+            if n and log:
+                log(f'{v_type}: compacted {n} rows of {day:%Y-%m-%d}')
+            moved += n
+            day += timedelta(days=1)
+        return moved
+
+
+def prune_hourly(variable_ids, cfg, now=None, dry_run=False):
+    cutoff = _cutoff(cfg['hourly_days'], now)
+    if cutoff is None or not variable_ids:
+        return 0
+    if dry_run:
+        return MeasurementHourly.objects.filter(variable_id__in=variable_ids, bucket__lt=cutoff).count()
+    deleted, _ = MeasurementHourly.objects.filter(variable_id__in=variable_ids, bucket__lt=cutoff).delete()
+    return deleted
@@ -1,8 +1,15 @@
 from rest_framework import serializers
+from sensors.calibration import registry as calibration
 from .models import Measurement
 
 
 class MeasurementSerializer(serializers.ModelSerializer):
+    # m_value stays the raw reading; this one has the calibration corrections applied
+    corrected_value = serializers.SerializerMethodField()
+
     class Meta:
         model = Measurement
-        fields = ['m_id', 'm_date', 'm_value', 'sensor', 'variable']
\ No newline at end of file
+        fields = ['m_id', 'm_date', 'm_value', 'corrected_value', 'sensor', 'variable']
+
+    def get_corrected_value(self, obj):
+        return calibration.value_for(obj.sensor_id, obj.variable_id, obj.m_date, obj.m_value)
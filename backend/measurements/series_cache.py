@@ -0,0 +1,386 @@
+"""In-process cache of recent measurement series.
+
+Each (sensor, variable) pair keeps a NumPy ring buffer of epoch-second timestamps
+and float values covering `SERIES_CACHE_HOURS`. The cache is warmed from the
+database when a worker starts (see `vrisa_backend/wsgi.py` / `asgi.py`), appended
+to by the ingest hook, and caught up with rows ingested by other workers through
+a cheap `m_id > floor` query before it answers; series whose stored rows were
+edited or deleted are re-read whole when their `measurement_revision` row shows
+up. Report views use it when the
+requested window lies entirely inside the cached horizon and fall back to the
+database otherwise. Answers are grouped by station; keeping the series per sensor
+lets reads apply calibration corrections (`sensors.calibration`) to the sensor
+they belong to.
+
+Without NumPy the cache stays disabled.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from stations.geo import station_id_set
+from vrisa_backend.metrics import CACHE_REQUESTS
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def _aware(dt):
+    # report views work with naive UTC datetimes
+    if timezone.is_naive(dt):
+        return timezone.make_aware(dt, dt_timezone.utc)
+    return dt
+
+
+class RingSeries:
+    """Time-ordered ring buffer of (timestamp, value) pairs that grows up to `max_capacity`."""
+
+    __slots__ = ('ts', 'values', 'start', 'size', 'max_capacity', 'evicted_until')
+
+    def __init__(self, max_capacity, initial=256):
+        capacity = min(initial, max_capacity)
+        self.ts = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.start = 0
+        self.size = 0
+        self.max_capacity = max_capacity
+        # newest timestamp dropped from the buffer; data after it is complete
+        self.evicted_until = None
+
+    def view(self):
+        """Return (ts, values) in time order (copies only when the buffer wraps)."""
+        end = self.start + self.size
+        cap = len(self.ts)
+        if end <= cap:
+            return self.ts[self.start:end], self.values[self.start:end]
+        tail = end - cap
+        return (np.concatenate((self.ts[self.start:], self.ts[:tail])),
+                np.concatenate((self.values[self.start:], self.values[:tail])))
+
+    def _reset(self, ts, values):
+        if len(ts) > self.max_capacity:
+            self.evicted_until = int(ts[-self.max_capacity - 1])
+            ts, values = ts[-self.max_capacity:], values[-self.max_capacity:]
+        capacity = len(self.ts)
+        while capacity < len(ts):
+            capacity *= 2
+        capacity = min(max(capacity, len(ts)), self.max_capacity)
+        if capacity != len(self.ts):
+            self.ts = np.empty(capacity, dtype=np.int64)
+            self.values = np.empty(capacity, dtype=np.float64)
+        self.ts[:len(ts)] = ts
+        self.values[:len(ts)] = values
+        self.start = 0
+        self.size = len(ts)
+
+    def extend(self, ts, values):
+        if not len(ts):
+            return
+        order = np.argsort(ts, kind='stable')
+        ts, values = ts[order], values[order]
+        cur_ts, cur_values = self.view()
+        if self.size and ts[0] < cur_ts[-1]:
+            # out-of-order data: merge and keep the newest points
+            merged_ts = np.concatenate((cur_ts, ts))
+            merged_values = np.concatenate((cur_values, values))
+            order = np.argsort(merged_ts, kind='stable')
+            self._reset(merged_ts[order], merged_values[order])
+            return
+        if self.size + len(ts) > len(self.ts):
+            if len(self.ts) < self.max_capacity or len(ts) > len(self.ts):
+                self._reset(np.concatenate((cur_ts, ts)), np.concatenate((cur_values, values)))
+                return
+        # in-order append into the ring, overwriting the oldest points when full
+        cap = len(self.ts)
+        overflow = self.size + len(ts) - cap
+        if overflow > 0:
+            self.evicted_until = int(cur_ts[overflow - 1])
+            self.start = (self.start + overflow) % cap
+            self.size -= overflow
+        idx = (self.start + self.size + np.arange(len(ts))) % cap
+        self.ts[idx] = ts
+        self.values[idx] = values
+        self.size += len(ts)
+
+    def trim_before(self, ts_min):
+        ts, values = self.view()
+        cut = int(np.searchsorted(ts, ts_min, side='left'))
+        if cut:
+            self.evicted_until = int(ts[cut - 1])
+            self._reset(ts[cut:], values[cut:])
+
+    def window(self, start_ts, end_ts):
+        ts, values = self.view()
+        i = np.searchsorted(ts, start_ts, side='left')
+        j = np.searchsorted(ts, end_ts, side='right')
+        return ts[i:j], values[i:j]
+
+
+class SeriesCache:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._series = {}
+        self._station_by_sensor = {}
+        self._ready = False
+        self._warming = False
+        self._warmed_from = None
+        # ids above `_floor` already applied; rows below it are assumed applied
+        self._floor = 0
+        self._seen = set()
+        self._max_seen = 0
+        self._watermarks = []
+        # same bookkeeping for measurement_revision ids
+        self._revision_floor = 0
+        self._revisions_seen = set()
+        self._last_sync = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return np is not None and getattr(settings, 'SERIES_CACHE_ENABLED', True)
+
+    @property
+    def horizon(self):
+        return timedelta(hours=getattr(settings, 'SERIES_CACHE_HOURS', 24 * 7))
+
+    def _capacity(self):
+        return getattr(settings, 'SERIES_CACHE_MAX_POINTS', 20000)
+
+    def _load_sensors(self):
+        from sensors.models import Sensor
+
+        self._station_by_sensor = dict(Sensor.objects.values_list('sensor_id', 'station_id'))
+
+    def _group(self, rows):
+        """rows: iterable of (m_id, m_date, m_value, sensor_id, variable_id) -> {key: (ts, values)}."""
+        grouped = {}
+        missing_sensor = False
+        for m_id, m_date, m_value, sensor_id, variable_id in rows:
+            if m_id in self._seen or (m_id is not None and m_id <= self._floor and self._ready):
+                continue
+            if sensor_id not in self._station_by_sensor and not missing_sensor:
+                missing_sensor = True
+                self._load_sensors()
+            if sensor_id not in self._station_by_sensor:
+                continue
+            ts_list, val_list = grouped.setdefault((sensor_id, variable_id), ([], []))
+            ts_list.append(int(m_date.timestamp()))
+            val_list.append(float(m_value))
+            if m_id is not None:
+                self._seen.add(m_id)
+                self._max_seen = max(self._max_seen, m_id)
+        return grouped
+
+    def _apply(self, grouped):
+        cap = self._capacity()
+        for key, (ts_list, val_list) in grouped.items():
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = RingSeries(cap)
+            series.extend(np.asarray(ts_list, dtype=np.int64), np.asarray(val_list, dtype=np.float64))
+
+    def warm(self):
+        """Load the recent horizon from the database; safe to call from a background thread."""
+        if not self.enabled:
+            return
+        from .models import Measurement, MeasurementRevision
+
+        with self._lock:
+            if self._warming:
+                return
+            self._warming = True
+        try:
+            since = timezone.now() - self.horizon
+            # revisions logged from here on may have changed rows read below
+            revision_floor = MeasurementRevision.objects.order_by('-revision_id').values_list('revision_id', flat=True).first()
+            rows = (
+                Measurement.objects.filter(m_date__gte=since)
+                .order_by('m_date')
+                .values_list('m_id', 'm_date', 'm_value', 'sensor_id', 'variable_id')
+                .iterator(chunk_size=10000)
+            )
+            with self._lock:
+                self._series = {}
+                self._seen = set()
+                self._floor = 0
+                self._max_seen = 0
+                self._load_sensors()
+                self._apply(self._group(rows))
+                self._floor = self._max_seen
+                self._seen = set()
+                self._watermarks = []
+                self._revision_floor = revision_floor or 0
+                self._revisions_seen = set()
+                self._warmed_from = int(since.timestamp())
+                self._ready = True
+            logger.info('Series cache warmed with %d series', len(self._series))
+        except Exception:
+            logger.exception('Warming the series cache failed; reports will read the database')
+        finally:
+            self._warming = False
+
+    def warm_in_background(self):
+        if self.enabled and getattr(settings, 'SERIES_CACHE_WARM_ON_START', True):
+            threading.Thread(target=self.warm, name='series-cache-warm', daemon=True).start()
+
+    def append(self, measurements):
+        """Add freshly ingested `Measurement` instances."""
+        if not self._ready:
+            return
+        with self._lock:
+            self._apply(self._group((m.m_id, m.m_date, m.m_value, m.sensor_id, m.variable_id) for m in measurements))
+
+    def sync(self):
+        """Pick up rows other workers ingested since our last look (throttled)."""
+        interval = getattr(settings, 'SERIES_CACHE_SYNC_SECONDS', 1.0)
+        now = time.monotonic()
+        if now - self._last_sync < interval:
+            return
+        from .models import Measurement, MeasurementRevision
+
+        with self._lock:
+            self._last_sync = now
+            rows = list(
+                Measurement.objects.filter(m_id__gt=self._floor, m_date__gte=timezone.now() - self.horizon)
+                .values_list('m_id', 'm_date', 'm_value', 'sensor_id', 'variable_id')
+            )
+            self._apply(self._group(rows))
+            revisions = [
+                (revision_id, key)
+                for revision_id, *key in MeasurementRevision.objects.filter(revision_id__gt=self._revision_floor)
+                .values_list('revision_id', 'sensor_id', 'variable_id')
+                if revision_id not in self._revisions_seen
+            ]
+            if revisions:
+                self.reset({tuple(key) for _revision_id, key in revisions})
+                self._revisions_seen.update(revision_id for revision_id, _key in revisions)
+            # Ids are allocated before commit, so a slow transaction can still surface
+            # below the newest id we saw; only advance the floor past ids seen a while ago.
+            lag = getattr(settings, 'SERIES_CACHE_COMMIT_LAG_SECONDS', 30)
+            self._watermarks.append((now, self._max_seen, max(self._revisions_seen, default=0)))
+            while self._watermarks and now - self._watermarks[0][0] >= lag:
+                _at, max_seen, max_revision = self._watermarks.pop(0)
+                self._floor = max(self._floor, max_seen)
+                self._revision_floor = max(self._revision_floor, max_revision)
+            self._seen = {i for i in self._seen if i > self._floor}
+            self._revisions_seen = {i for i in self._revisions_seen if i > self._revision_floor}
+            horizon_start = int((timezone.now() - self.horizon).timestamp())
+            for series in self._series.values():
+                if series.size and series.ts[series.start] < horizon_start:
+                    series.trim_before(horizon_start)
+
+    def _count(self, result):
+        if result == 'hit':
+            self.hits += 1
+        else:
+            self.misses += 1
+        CACHE_REQUESTS.inc(cache='series', result=result)
+
+    def stations_of(self, sensor_ids):
+        """{sensor_id: station_id} for the given sensors, reloading the sensor map once for unknown ones."""
+        if any(s_id not in self._station_by_sensor for s_id in sensor_ids):
+            self._load_sensors()
+        return {s_id: self._station_by_sensor.get(s_id) for s_id in sensor_ids}
+
+    def covers(self, start):
+        return self._ready and start is not None and int(_aware(start).timestamp()) >= self._warmed_from
+
+    def query(self, start, end, variable_ids=None, station_id=None, corrected=False):
+        """Return [(station_id, variable_id, ts, values)] for the window, or None on a miss.
+
+        There is one entry per sensor, so a station can appear more than once for a
+        variable. `variable_ids=None` means every variable; `station_id` is one id, a
+        collection of ids, or None for every station. `corrected` applies the
+        calibration corrections to the values.
+        """
+        if not self.enabled or not self.covers(start):
+            self._count('miss')
+            return None
+        try:
+            self.sync()
+        except Exception:
+            logger.exception('Series cache sync failed')
+            self._count('miss')
+            return None
+        start_ts, end_ts = int(_aware(start).timestamp()), int(_aware(end).timestamp())
+        stations = station_id_set(station_id)
+        wanted = set(variable_ids) if variable_ids is not None else None
+        if corrected:
+            from sensors.calibration import registry as calibration
+        out = []
+        with self._lock:
+            for (sensor_id, v_id), series in self._series.items():
+                s_id = self._station_by_sensor.get(sensor_id)
+                if stations is not None and s_id not in stations:
+                    continue
+                if wanted is not None and v_id not in wanted:
+                    continue
+                if series.evicted_until is not None and series.evicted_until >= start_ts:
+                    # the buffer no longer holds the start of this window
+                    self._count('miss')
+                    return None
+                ts, values = series.window(start_ts, end_ts)
+                if not len(ts):
+                    continue
+                values = calibration.correct(sensor_id, v_id, ts, values) if corrected else values
+                out.append((s_id, v_id, ts.copy(), values.copy()))
+        self._count('hit')
+        return out
+
+    def reset(self, keys):
+        """Re-read the (sensor_id, variable_id) series in `keys` after stored rows were edited or deleted."""
+        if not self._ready or not keys:
+            return
+        from .models import Measurement
+
+        lookup = Q()
+        for sensor_id, variable_id in keys:
+            lookup |= Q(sensor_id=sensor_id, variable_id=variable_id)
+        with self._lock:
+            rows = (
+                Measurement.objects.filter(lookup, m_date__gte=datetime.fromtimestamp(self._warmed_from, dt_timezone.utc))
+                .values_list('m_id', 'm_date', 'm_value', 'sensor_id', 'variable_id')
+            )
+            grouped = {}
+            for m_id, m_date, m_value, sensor_id, variable_id in rows:
+                ts_list, val_list = grouped.setdefault((sensor_id, variable_id), ([], []))
+                ts_list.append(int(m_date.timestamp()))
+                val_list.append(float(m_value))
+                if m_id > self._floor:
+                    # already applied: a later sync must not add it again
+                    self._seen.add(m_id)
+                    self._max_seen = max(self._max_seen, m_id)
+            for key in keys:
+                self._series.pop(key, None)
+            self._apply(grouped)
+
+    def invalidate(self):
+        with self._lock:
+            self._ready = False
+            self._series = {}
+
+
+series_cache = SeriesCache()
+
+
+def concat(parts):
+    """Concatenate the arrays of a `query()` result into (ts, values, station_ids, variable_ids)."""
+    if not parts:
+        empty_i = np.empty(0, dtype=np.int64)
+        return empty_i, np.empty(0, dtype=np.float64), empty_i, empty_i
+    ts = np.concatenate([p[2] for p in parts])
+    values = np.concatenate([p[3] for p in parts])
+    stations = np.concatenate([np.full(len(p[2]), p[0], dtype=np.int64) for p in parts])
+    variables = np.concatenate([np.full(len(p[2]), p[1], dtype=np.int64) for p in parts])
+    order = np.argsort(ts, kind='stable')
+    return ts[order], values[order], stations[order], variables[order]
@@ -0,0 +1,356 @@
+"""Live push of measurements, latest values and alert events.
+
+`hub` is an in-process fan-out: ingest code publishes events from any thread and
+every subscribed client receives the ones matching its station / variable /
+institution filters. Each client has a bounded buffer; when a slow client falls
+behind, the oldest events are dropped and an `overflow` event tells it to resync
+through the REST endpoints.
+
+On its own the hub only reaches clients of the process that ingested the data, so
+`/api/stream/` and every ingest path must then run in a single ASGI process. With
+`STREAM_RELAY` on (PostgreSQL with psycopg 3), published events go out through
+`NOTIFY` on `STREAM_RELAY_CHANNEL` instead, and each process serving streams
+`LISTEN`s there and fans them out to its own clients, so any number of WSGI/ASGI
+workers can ingest and serve streams.
+
+`stream_app` is a plain ASGI application serving the hub as Server-Sent Events
+(`GET /api/stream/`) or over a WebSocket on the same path; it is mounted in
+`vrisa_backend/asgi.py`.
+
+Query parameters (comma separated ids): `station`, `variable`, `institution` and
+`types` (any of `measurement`, `latest`, `alert`).
+"""
+import asyncio
+import collections
+import json
+import logging
+import threading
+import time
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('measurement', 'latest', 'alert')
+# NOTIFY payloads must stay under 8000 bytes
+RELAY_PAYLOAD_BYTES = 7000
+
+
+def _id_set(values):
+    ids = set()
+    for raw in values:
+        for part in raw.split(','):
+            part = part.strip()
+            if part.isdigit():
+                ids.add(int(part))
+    return ids or None
+
+
+class Subscription:
+    def __init__(self, loop, stations=None, variables=None, institutions=None, types=None, maxlen=256):
+        self.loop = loop
+        self.stations = stations
+        self.variables = variables
+        self.institutions = institutions
+        self.types = types
+        self.buffer = collections.deque(maxlen=maxlen)
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    @classmethod
+    def from_query_string(cls, loop, query_string, maxlen):
+        params = parse_qs(query_string.decode() if isinstance(query_string, bytes) else query_string)
+        types = set()
+        for raw in params.get('types', []):
+            types.update(t.strip() for t in raw.split(',') if t.strip() in EVENT_TYPES)
+        return cls(
+            loop,
+            stations=_id_set(params.get('station', []) + params.get('station_id', [])),
+            variables=_id_set(params.get('variable', [])),
+            institutions=_id_set(params.get('institution', [])),
+            types=types or None,
+            maxlen=maxlen,
+        )
+
+    def matches(self, event):
+        data = event['data']
+        if self.types is not None and event['type'] not in self.types:
+            return False
+        if self.stations is not None and data.get('station_id') not in self.stations:
+            return False
+        if self.variables is not None and data.get('variable_id') not in self.variables:
+            return False
+        if self.institutions is not None and data.get('institution_id') not in self.institutions:
+            return False
+        return True
+
+    def push(self, event):
+        # runs on the subscriber's event loop
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(event)
+        self.ready.set()
+
+    def drain(self):
+        events = list(self.buffer)
+        self.buffer.clear()
+        if self.dropped:
+            events.insert(0, {'type': 'overflow', 'data': {'dropped': self.dropped}})
+            self.dropped = 0
+        self.ready.clear()
+        return events
+
+
+def _relay_channel():
+    return getattr(settings, 'STREAM_RELAY_CHANNEL', 'vrisa_stream')
+
+
+def _relay_payloads(events):
+    """JSON arrays of `events`, split so each fits in one NOTIFY payload."""
+    batch, size = [], 0
+    for event in events:
+        encoded = json.dumps(event, cls=DjangoJSONEncoder)
+        if batch and size + len(encoded) > RELAY_PAYLOAD_BYTES:
+            yield '[' + ','.join(batch) + ']'
+            batch, size = [], 0
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        yield '[' + ','.join(batch) + ']'
+
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._listener = None
+
+    @property
+    def relay(self):
+        return bool(getattr(settings, 'STREAM_RELAY', False))
+
+    def has_subscribers(self):
+        """Whether published events can reach anyone: local clients, or other processes through the relay."""
+        return self.relay or bool(self._subscriptions)
+
+    def subscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if self.relay and self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='stream-relay', daemon=True)
+                self._listener.start()
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, events):
+        """Fan events out to matching subscribers; safe to call from any thread.
+
+        With `STREAM_RELAY` they are sent through NOTIFY instead and reach this
+        process's clients through its listener, like every other process's.
+        """
+        if self.relay:
+            self._notify(events)
+        else:
+            self.deliver(events)
+
+    def deliver(self, events):
+        """Fan events out to this process's matching subscribers."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for sub in subscriptions:
+            for event in events:
+                if sub.matches(event):
+                    try:
+                        sub.loop.call_soon_threadsafe(sub.push, event)
+                    except RuntimeError:
+                        # loop already closed; the connection is going away
+                        self.unsubscribe(sub)
+                        break
+
+    def _notify(self, events):
+        from django.db import connection
+
+        with connection.cursor() as cur:
+            for payload in _relay_payloads(events):
+                cur.execute('SELECT pg_notify(%s, %s)', [_relay_channel(), payload])
+
+    def _listen(self):
+        # own connection outside Django's (and its pool): it stays in LISTEN for good
+        import psycopg
+        from django.db import connection
+        from psycopg import sql
+
+        while True:
+            try:
+                with psycopg.connect(**connection.get_connection_params(), autocommit=True) as conn:
+                    conn.execute(sql.SQL('LISTEN {}').format(sql.Identifier(_relay_channel())))
+                    for notify in conn.notifies():
+                        self.deliver(json.loads(notify.payload))
+            except Exception:
+                logger.exception('Stream relay listener lost its connection; reconnecting')
+                time.sleep(5)
+
+
+hub = Hub()
+
+
+def publish_measurements(measurements):
+    """Publish `measurement` events plus one `latest` event per station/variable."""
+    if not hub.has_subscribers():
+        return
+    from sensors.models import Sensor
+
+    sensor_ids = {m.sensor_id for m in measurements}
+    placement = {
+        row[0]: (row[1], row[2])
+        for row in Sensor.objects.filter(sensor_id__in=sensor_ids).values_list('sensor_id', 'station_id', 'station__institution_id')
+    }
+    events = []
+    latest = {}
+    for m in measurements:
+        station_id, institution_id = placement.get(m.sensor_id, (None, None))
+        data = {
+            'm_id': m.m_id,
+            'm_date': m.m_date,
+            'm_value': m.m_value,
+            'sensor_id': m.sensor_id,
+            'variable_id': m.variable_id,
+            'station_id': station_id,
+            'institution_id': institution_id,
+        }
+        events.append({'type': 'measurement', 'data': data})
+        key = (station_id, m.variable_id)
+        if key not in latest or latest[key]['m_date'] <= m.m_date:
+            latest[key] = data
+    events.extend({'type': 'latest', 'data': data} for data in latest.values())
+    hub.publish(events)
+
+
+def publish_alert_events(alert_events):
+    if not hub.has_subscribers() or not alert_events:
+        return
+    from stations.models import Station
+
+    institution_by_station = dict(
+        Station.objects.filter(station_id__in={ev.station_id for ev in alert_events}).values_list('station_id', 'institution_id')
+    )
+    hub.publish([
+        {'type': 'alert', 'data': {
+            'event_id': ev.event_id,
+            'station_id': ev.station_id,
+            'variable_id': ev.variable_id,
+            'institution_id': institution_by_station.get(ev.station_id),
+            'severity': ev.severity,
+            'first_seen': ev.first_seen,
+            'last_seen': ev.last_seen,
+            'peak_value': ev.peak_value,
+            'samples': ev.samples,
+        }}
+        for ev in alert_events
+    ])
+
+
+def _encode(event):
+    return json.dumps(event['data'], cls=DjangoJSONEncoder)
+
+
+async def _wait(subscription, timeout):
+    try:
+        await asyncio.wait_for(subscription.ready.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return subscription.drain()
+
+
+async def _serve_sse(scope, receive, send, subscription, keepalive):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                subscription.ready.set()
+                return
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        while not disconnected.is_set():
+            events = await _wait(subscription, keepalive)
+            if disconnected.is_set():
+                break
+            if events:
+                body = ''.join(f"event: {ev['type']}\ndata: {_encode(ev)}\n\n" for ev in events)
+            else:
+                body = ': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    except OSError:
+        pass
+    finally:
+        watcher.cancel()
+
+
+async def _serve_websocket(scope, receive, send, subscription, keepalive):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+
+    closed = asyncio.Event()
+
+    async def watch_close():
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                closed.set()
+                subscription.ready.set()
+                return
+
+    watcher = asyncio.ensure_future(watch_close())
+    try:
+        while not closed.is_set():
+            events = await _wait(subscription, keepalive)
+            if closed.is_set():
+                break
+            for ev in events:
+                await send({'type': 'websocket.send', 'text': json.dumps({'type': ev['type'], 'data': ev['data']}, cls=DjangoJSONEncoder)})
+    finally:
+        watcher.cancel()
+
+
+async def stream_app(scope, receive, send):
+    """ASGI application for `/api/stream/` (SSE over HTTP, or WebSocket)."""
+    loop = asyncio.get_running_loop()
+    maxlen = getattr(settings, 'STREAM_CLIENT_BUFFER', 256)
+    keepalive = getattr(settings, 'STREAM_KEEPALIVE_SECONDS', 15)
+    subscription = Subscription.from_query_string(loop, scope.get('query_string', b''), maxlen)
+
+    if scope['type'] == 'http' and scope.get('method') != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    hub.subscribe(subscription)
+    try:
+        if scope['type'] == 'websocket':
+            await _serve_websocket(scope, receive, send, subscription, keepalive)
+        else:
+            await _serve_sse(scope, receive, send, subscription, keepalive)
+    finally:
+        hub.unsubscribe(subscription)
@@ -1,8 +1,50 @@
-from rest_framework import viewsets
+import time
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import status, viewsets
+from rest_framework.response import Response
+from vrisa_backend.renderers import stream_json_list
+from .ingest import on_ingested
 from .models import Measurement
 from .serializers import MeasurementSerializer
 
 
 class MeasurementViewSet(viewsets.ModelViewSet):
+    """Edits and deletes reach the series cache and alert episodes through the
+    Measurement signals (see MeasurementsConfig.ready and ingest.on_revised)."""
+
     queryset = Measurement.objects.all()
-    serializer_class = MeasurementSerializer
\ No newline at end of file
+    serializer_class = MeasurementSerializer
+
+    def list(self, request, *args, **kwargs):
+        """All measurements as a streamed JSON array, serialized a chunk of rows at a time.
+
+        Paginated or browsable (HTML) listings keep DRF's regular response.
+        """
+        if self.paginator is not None or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.iterator(chunk_size=settings.JSON_STREAM_CHUNK_ROWS)
+        return stream_json_list(request, rows, lambda chunk: self.get_serializer(chunk, many=True).data)
+
+    def create(self, request, *args, **kwargs):
+        """Create one measurement, or a batch when the payload is a list.
+
+        Batches are validated together and written with a single bulk INSERT.
+        """
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        started = time.perf_counter()
+        with transaction.atomic():
+            objs = Measurement.objects.bulk_create([Measurement(**item) for item in serializer.validated_data])
+            on_ingested(objs, started)
+        return Response(self.get_serializer(objs, many=True).data, status=status.HTTP_201_CREATED)
+
+    def perform_create(self, serializer):
+        started = time.perf_counter()
+        with transaction.atomic():
+            instance = serializer.save()
+            on_ingested([instance], started)
@@ -0,0 +1,193 @@
+"""Threshold evaluation for freshly ingested measurements.
+
+Each batch is classified against the threshold registry, after the sensors'
+calibration corrections, and folded into `alert_event` rows. The exceedances of a (station, variable, severity) are split into runs wherever
+two of them are more than `ALERT_EVENT_GAP_MINUTES` apart; a run extends the latest
+episode within that gap of it, otherwise it starts a new episode. When stored
+readings change, `reevaluate` rebuilds the episodes around them.
+"""
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q
+
+from sensors.calibration import registry as calibration
+from sensors.models import Sensor
+from .models import AlertEvent
+from .thresholds import SEVERITIES, registry as threshold_registry
+
+logger = logging.getLogger(__name__)
+
+
+def _event_gap():
+    return timedelta(minutes=getattr(settings, 'ALERT_EVENT_GAP_MINUTES', 60))
+
+
+def open_since(now=None):
+    """Episodes whose last sample is newer than this can still be extended: they are open."""
+    from django.utils import timezone
+
+    return (now or timezone.now()) - _event_gap()
+
+
+def classify(value, cfg):
+    """Return the severity reached by `value` for a thresholds dict, or None."""
+    for sev in SEVERITIES:
+        if value >= cfg[sev]:
+            return sev
+    return None
+
+
+def runs(hits, gap):
+    """Split exceedances into episodes.
+
+    `hits` are (key, m_date, value) tuples. Returns {key: [[first, last, peak, samples], ...]}
+    with each key's runs in time order; a run ends where the next exceedance comes
+    more than `gap` after it.
+    """
+    by_key = {}
+    for key, m_date, value in hits:
+        by_key.setdefault(key, []).append((m_date, value))
+    out = {}
+    for key, points in by_key.items():
+        points.sort(key=lambda p: p[0])
+        key_runs = out[key] = []
+        for m_date, value in points:
+            run = key_runs[-1] if key_runs else None
+            if run is not None and m_date - run[1] <= gap:
+                run[1] = m_date
+                run[2] = max(run[2], value)
+                run[3] += 1
+            else:
+                key_runs.append([m_date, m_date, value, 1])
+    return out
+
+
+def _lock_keys(keys):
+    # Serialize batches touching the same (station, variable, severity), so two of
+    # them cannot both open an episode for it; taken in a fixed order (no deadlocks)
+    # and released at commit.
+    if connection.vendor != 'postgresql':
+        return
+    names = sorted({f'alert_event:{station_id}:{variable_id}:{sev}' for station_id, variable_id, sev in keys})
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT pg_advisory_xact_lock(hashtextextended(k, 0)) FROM (SELECT unnest(%s::text[]) AS k ORDER BY 1) keys",
+            [names],
+        )
+
+
+def evaluate_batch(measurements):
+    """Update `alert_event` with the exceedances found in a batch of measurements.
+
+    `measurements` are saved `Measurement` instances (only `sensor_id`, `variable_id`,
+    `m_date` and `m_value` are read); their calibrated values are classified, as in
+    scan mode. Returns the created or extended events.
+    """
+    measurements = [m for m in measurements if threshold_registry.for_variable(m.variable_id)]
+    if not measurements:
+        return []
+
+    sensor_ids = {m.sensor_id for m in measurements}
+    station_by_sensor = dict(Sensor.objects.filter(sensor_id__in=sensor_ids).values_list('sensor_id', 'station_id'))
+
+    hits = []
+    for m in measurements:
+        station_id = station_by_sensor.get(m.sensor_id)
+        if station_id is None:
+            continue
+        cfg = threshold_registry.for_variable(m.variable_id, station_id)
+        value = calibration.value_for(m.sensor_id, m.variable_id, m.m_date, m.m_value)
+        sev = classify(float(value), cfg)
+        if sev:
+            hits.append(((station_id, m.variable_id, sev), m.m_date, value))
+    if not hits:
+        return []
+
+    gap = _event_gap()
+    groups = runs(hits, gap)
+    lookup = Q()
+    for (station_id, variable_id, sev), key_runs in groups.items():
+        lookup |= Q(station_id=station_id, variable_id=variable_id, severity=sev,
+                    last_seen__gte=key_runs[0][0] - gap, first_seen__lte=key_runs[-1][1] + gap)
+
+    touched = []
+    with transaction.atomic():
+        _lock_keys(groups)
+        events = {}
+        for ev in AlertEvent.objects.select_for_update().filter(lookup).order_by('last_seen'):
+            events.setdefault((ev.station_id, ev.variable_id, ev.severity), []).append(ev)
+
+        changed, new_events = [], []
+        for key, key_runs in groups.items():
+            key_events = events.setdefault(key, [])
+            for first, last, peak, n in key_runs:
+                # the latest episode within `gap` of the run, if any, absorbs it
+                near = [ev for ev in key_events if ev.last_seen >= first - gap and ev.first_seen <= last + gap]
+                if near:
+                    ev = max(near, key=lambda e: e.last_seen)
+                    ev.first_seen = min(ev.first_seen, first)
+                    ev.last_seen = max(ev.last_seen, last)
+                    ev.peak_value = max(ev.peak_value, peak)
+                    ev.samples += n
+                    if ev.pk is not None and ev not in changed:
+                        changed.append(ev)
+                    continue
+                station_id, variable_id, sev = key
+                ev = AlertEvent(
+                    station_id=station_id, variable_id=variable_id, severity=sev,
+                    first_seen=first, last_seen=last, peak_value=peak, samples=n,
+                )
+                key_events.append(ev)
+                new_events.append(ev)
+        for ev in changed:
+            ev.save(update_fields=['first_seen', 'last_seen', 'peak_value', 'samples'])
+        touched.extend(changed)
+        if new_events:
+            touched.extend(AlertEvent.objects.bulk_create(new_events))
+    return touched
+
+
+def reevaluate(sensor_id, start, end=None, variable_id=None):
+    """Rebuild the episodes of a sensor's station around [start, end] after its readings changed.
+
+    Episodes within the event gap of the window (of `variable_id`, or of every variable)
+    are deleted and their whole span is replayed from the stored measurements, so
+    edited, deleted or recalibrated readings are reflected. `end=None` means up to now.
+    Returns the rebuilt events.
+    """
+    from django.utils import timezone
+    from measurements.models import Measurement
+
+    station_id = Sensor.objects.filter(sensor_id=sensor_id).values_list('station_id', flat=True).first()
+    if station_id is None:
+        return []
+    gap = _event_gap()
+    end = end or timezone.now()
+    touched = []
+    with transaction.atomic():
+        # widen the window until no episode it reaches sticks out of it; the episodes
+        # left alone then hold none of the readings replayed below
+        while True:
+            events = AlertEvent.objects.filter(station_id=station_id, last_seen__gte=start - gap,
+                                               first_seen__lte=end + gap)
+            if variable_id is not None:
+                events = events.filter(variable_id=variable_id)
+            span = events.aggregate(first=Min('first_seen'), last=Max('last_seen'))
+            if (span['first'] is None or span['first'] >= start) and (span['last'] is None or span['last'] <= end):
+                break
+            start, end = min(start, span['first']), max(end, span['last'])
+        events.delete()
+        readings = Measurement.objects.filter(sensor__station_id=station_id, m_date__gte=start, m_date__lte=end)
+        if variable_id is not None:
+            readings = readings.filter(variable_id=variable_id)
+        batch = []
+        for m in readings.only('m_date', 'm_value', 'sensor_id', 'variable_id').order_by('m_date').iterator(chunk_size=5000):
+            batch.append(m)
+            if len(batch) >= 5000:
+                touched.extend(evaluate_batch(batch))
+                batch = []
+        touched.extend(evaluate_batch(batch))
+    return touched
@@ -0,0 +1,84 @@
+"""Concurrent database work for the async report views (served under ASGI).
+
+Django's async ORM runs every query on one shared thread, one after the other. The
+async report views instead hand each independent part of a report (an aggregate,
+an older tier) to a small pool of long-lived threads, each keeping its own
+database connection between requests (`CONN_MAX_AGE`), and await them together,
+so a multi-part report takes as long as its slowest part. The event loop stays
+free meanwhile and one worker can hold many reports in flight;
+`REPORT_QUERY_WORKERS` bounds the connections a worker opens for them.
+
+Parts run with a copy of the request's context, so replica routing and the
+request timings (see `vrisa_backend.timing`) apply to their queries. Multi-part
+reports are answered once every part has completed, so a failed part still turns
+into an error status. Responses are encoded like the API's default renderer
+(`vrisa_backend.renderers`).
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+
+from vrisa_backend.renderers import dumps
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'REPORT_QUERY_WORKERS', 8), thread_name_prefix='report-query'
+                )
+    return _pool
+
+
+def _call(fn, args):
+    # same connection housekeeping Django does around a request
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+def run(fn, *args):
+    """Start `fn(*args)` on the report pool now; returns a future to await."""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_executor(), contextvars.copy_context().run, _call, fn, args)
+
+
+def json_response(data, status=200, headers=None):
+    return HttpResponse(dumps(data), status=status, headers=headers, content_type='application/json')
+
+
+def _members(members):
+    """`members` encoded as the inside of a JSON object (b'' when empty)."""
+    return dumps(members)[1:-1]
+
+
+async def object_response(parts, head=None, headers=None):
+    """JSON object of `head`'s members followed by each part's, once every part has completed.
+
+    `parts` are futures from `run()` resolving to dicts of members. The status line
+    waits for all of them, so a failed part turns the response into a 500 instead of
+    a 200 carrying an error member; the report still takes as long as its slowest part.
+    """
+    results = await asyncio.gather(*parts, return_exceptions=True)
+    data = dict(head or {})
+    for members in results:
+        if isinstance(members, Exception):
+            logger.error('A report part failed', exc_info=members)
+            return json_response({'error': 'No se pudo generar el reporte', 'detail': str(members)}, status=500)
+        data.update(members)
+    return json_response(data, headers=headers)
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from measurements.models import Measurement
+from reports.alerting import evaluate_batch
+from reports.models import AlertEvent
+
+
+class Command(BaseCommand):
+    help = 'Rebuild alert_event by replaying stored measurements through the threshold evaluator.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Replay only the last N days (default 30).')
+        parser.add_argument('--all', action='store_true', help='Replay the full measurement history.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--keep', action='store_true', help='Do not delete existing events in the window first.')
+
+    def handle(self, *args, **options):
+        qs = Measurement.objects.only('m_id', 'm_date', 'm_value', 'sensor_id', 'variable_id')
+        events = AlertEvent.objects.all()
+        if not options['all']:
+            start = timezone.now() - timedelta(days=options['days'])
+            qs = qs.filter(m_date__gte=start)
+            events = events.filter(last_seen__gte=start)
+        if not options['keep']:
+            deleted, _ = events.delete()
+            self.stdout.write(f'Deleted {deleted} existing events')
+
+        batch = []
+        total = touched = 0
+        for m in qs.order_by('m_date', 'm_id').iterator(chunk_size=options['batch_size']):
+            batch.append(m)
+            if len(batch) >= options['batch_size']:
+                touched += len(evaluate_batch(batch))
+                total += len(batch)
+                batch = []
+        if batch:
+            touched += len(evaluate_batch(batch))
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Replayed {total} measurements, {touched} event updates'))
@@ -25,4 +25,34 @@ class ReportLog(models.Model):
     class Meta:
         db_table = 'report_log'
         verbose_name = _('Log de Reporte')
-        verbose_name_plural = _('Logs de Reportes')
\ No newline at end of file
+        verbose_name_plural = _('Logs de Reportes')
+
+
+class AlertEvent(models.Model):
+    """Threshold exceedance episode for a station/variable, maintained at ingest time."""
+    SEVERITY_CHOICES = (
+        ('info', 'Info'),
+        ('warning', 'Warning'),
+        ('critical', 'Critical'),
+    )
+
+    event_id = models.BigAutoField(primary_key=True)
+    station = models.ForeignKey('stations.Station', on_delete=models.CASCADE, db_column='station_id', verbose_name=_('Estación'))
+    variable = models.ForeignKey('variables.Variable', on_delete=models.RESTRICT, db_column='variable_id', verbose_name=_('Variable'))
+    severity = models.CharField(_('Severidad'), max_length=20, choices=SEVERITY_CHOICES)
+    first_seen = models.DateTimeField(_('Primera detección'))
+    last_seen = models.DateTimeField(_('Última detección'))
+    peak_value = models.DecimalField(_('Valor máximo'), max_digits=10, decimal_places=4)
+    samples = models.IntegerField(_('Muestras'), default=1)
+
+    class Meta:
+        db_table = 'alert_event'
+        verbose_name = _('Evento de alerta')
+        verbose_name_plural = _('Eventos de alerta')
+        indexes = [
+            models.Index(fields=['station', 'variable', 'severity', '-last_seen'], name='alert_event_open_idx'),
+            models.Index(fields=['-last_seen'], name='alert_event_last_seen_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.severity} {self.station_id}/{self.variable_id} {self.first_seen} - {self.last_seen}"
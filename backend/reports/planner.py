@@ -0,0 +1,183 @@
+"""Window parsing and storage-tier selection shared by the report views.
+
+A report reads measurements from up to three disjoint slices of history:
+
+- `archive`: sealed months in the columnar archive (only for `days=all`)
+- `rollup`: hourly/daily aggregates of data compacted out of the raw table
+- `raw` or `cache`: raw rows, answered from the recent-series cache when it holds
+  the whole slice and from `measurement` otherwise
+
+`plan()` parses the request once and decides which slices a view reads, depending
+on the resolution it needs: `summary` and `hourly` reports can use rollups, while
+`samples` (alert scans, projections) only use tiers that still have every reading.
+The chosen tiers are returned to the client in the `X-Report-Tier` header. Every
+tier reads corrected values (see `sensors.calibration`).
+"""
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from measurements import rollups
+from measurements.archive import open_archive
+from measurements.models import Measurement
+from measurements.series_cache import series_cache
+from stations import geo
+from variables.catalog import catalog as variable_catalog
+from vrisa_backend import timing
+
+TIER_HEADER = 'X-Report-Tier'
+RESOLUTIONS = ('summary', 'hourly', 'samples')
+
+
+def _parse_dt(value):
+    if not value:
+        return None
+    try:
+        return parse_datetime(value) or datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+class ReportWindow:
+    """Station, variable and time window of a report request; `start=None` means all history.
+
+    `stations` is the station filter handed to every tier: None for all stations,
+    otherwise the set of ids selected by `station_id` and/or a `bbox`/`near` area.
+    """
+
+    def __init__(self, start, end, station_id=None, variable=None, area_ids=None):
+        self.start = start
+        self.end = end
+        self.station_id = station_id or None
+        self.variable = variable or None
+        self.variable_ids = variable_catalog.resolve(variable) if variable else None
+        self.stations = geo.station_id_set(self.station_id)
+        if area_ids is not None:
+            area = set(area_ids)
+            self.stations = area if self.stations is None else self.stations & area
+
+    @property
+    def all_history(self):
+        return self.start is None
+
+    @property
+    def size_class(self):
+        """Window length rounded up to 1d, 7d or 30d ('longer', 'all'), the label used in metrics."""
+        if self.start is None:
+            return 'all'
+        days = (self.end - self.start).total_seconds() / 86400
+        for label, limit in (('1d', 1), ('7d', 7), ('30d', 31)):
+            if days <= limit:
+                return label
+        return 'longer'
+
+    @classmethod
+    def from_request(cls, request, default=timedelta(days=7)):
+        """Read `start_date`/`end_date`, `days` (a number or 'all'), `station_id`, `variable`
+        and the station area parameters (`bbox`, `near`, `radius`).
+
+        An explicit `start_date` wins over `days`; without either the window is
+        `default` long and ends now (naive UTC, like the rest of the report code).
+        """
+        # DRF request in the sync views, plain Django request in the async ones
+        params = getattr(request, 'query_params', request.GET)
+        days = params.get('days')
+        end = _parse_dt(params.get('end_date')) or datetime.utcnow()
+        start = _parse_dt(params.get('start_date'))
+        if start is None and days != 'all':
+            try:
+                start = end - (timedelta(days=int(days)) if days else default)
+            except ValueError:
+                start = end - default
+        try:
+            area_ids = geo.area_station_ids(params)
+        except geo.AreaError as exc:
+            raise ValidationError({'error': 'Parámetros de área inválidos', 'detail': str(exc)})
+        return cls(start, end, params.get('station_id'), params.get('variable'), area_ids)
+
+
+class ReportPlan:
+    def __init__(self, window, resolution):
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f'unknown resolution {resolution!r}')
+        self.window = window
+        self.resolution = resolution
+        self.archive = open_archive() if window.all_history else None
+        # raw and rollup reads start where the archive stops
+        self.start = self.archive.end if self.archive is not None else window.start
+        self.end = window.end
+        self.compacted = resolution != 'samples' and rollups.needs_compacted(self.start, window.variable_ids)
+        self._cached = False
+        timing.note('window', window.size_class)
+
+    @property
+    def cached(self):
+        """(station_id, variable_id, ts, values) parts of the raw slice from the series cache, or None."""
+        if self._cached is False:
+            self._cached = None
+            # with the archive, the raw slice also has late rows from before `start`
+            if (self.start is not None and self.archive is None
+                    and not rollups.needs_compacted(self.start, self.window.variable_ids)):
+                with timing.span('cache'):
+                    self._cached = series_cache.query(
+                        self.start, self.end, self.window.variable_ids, self.window.stations, corrected=True,
+                    )
+        return self._cached
+
+    @property
+    def tiers(self):
+        tiers = []
+        if self.archive is not None:
+            tiers.append('archive')
+        if self.compacted:
+            tiers.append('rollup')
+        tiers.append('cache' if self.cached is not None else 'raw')
+        return tiers
+
+    def queryset(self):
+        """Raw `Measurement` rows of the plan's raw slice.
+
+        With the archive these include the rows before its end that it does not hold
+        yet (ids above its `max_id`).
+        """
+        qs = Measurement.objects.all()
+        if self.archive is not None:
+            qs = qs.filter(Q(m_date__gte=self.start) | Q(m_id__gt=self.archive.max_id), m_date__lte=self.end)
+        elif self.start is not None:
+            qs = qs.filter(m_date__gte=self.start, m_date__lte=self.end)
+        if self.window.variable_ids is not None:
+            qs = qs.filter(variable_id__in=self.window.variable_ids)
+        if self.window.stations is not None:
+            qs = qs.filter(sensor__station__station_id__in=self.window.stations)
+        return qs
+
+    def rollup_range(self):
+        """(start, end) for the rollup helpers; None bounds mean unbounded."""
+        return self.start, None if self.window.all_history else self.end
+
+    def headers(self, tiers=None):
+        """Response headers naming the tiers read (noted for the request metrics too)."""
+        tier = ','.join(tiers or self.tiers)
+        timing.note('tier', tier)
+        return {TIER_HEADER: tier}
+
+    def response(self, data, status=None, tiers=None, rows=None):
+        """DRF response with the tier header; `rows` is how many readings the report aggregated."""
+        if rows is not None:
+            timing.note('rows', int(rows))
+        return Response(data, status=status, headers=self.headers(tiers))
+
+
+def plan(request, resolution, default=timedelta(days=7)):
+    return ReportPlan(ReportWindow.from_request(request, default), resolution)
+
+
+def cached_plan(request, resolution, default=timedelta(days=7)):
+    """`plan()` with its series cache lookup done, for the async views: they build plans on
+    the report query pool, and afterwards `tiers` needs no database access."""
+    result = plan(request, resolution, default)
+    result.cached
+    return result
@@ -0,0 +1,166 @@
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+import asyncio
+import json
+
+from django.test import SimpleTestCase
+
+from . import alerting, concurrent
+from .models import AlertEvent
+
+T0 = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+GAP = timedelta(minutes=60)
+CFG = {'info': 10.0, 'warning': 20.0, 'critical': 30.0}
+
+
+def at(minutes):
+    return T0 + timedelta(minutes=minutes)
+
+
+class RunsTests(SimpleTestCase):
+    def test_hits_within_the_gap_form_one_run(self):
+        hits = [('a', at(0), 12.0), ('a', at(30), 15.0), ('a', at(90), 11.0)]
+        self.assertEqual(alerting.runs(hits, GAP), {'a': [[at(0), at(90), 15.0, 3]]})
+
+    def test_a_gap_longer_than_the_limit_splits_runs(self):
+        hits = [('a', at(0), 12.0), ('a', at(61), 14.0)]
+        self.assertEqual(alerting.runs(hits, GAP), {'a': [[at(0), at(0), 12.0, 1], [at(61), at(61), 14.0, 1]]})
+
+    def test_hits_are_sorted_and_kept_per_key(self):
+        hits = [('a', at(30), 13.0), ('b', at(0), 40.0), ('a', at(0), 12.0)]
+        self.assertEqual(alerting.runs(hits, GAP), {
+            'a': [[at(0), at(30), 13.0, 2]],
+            'b': [[at(0), at(0), 40.0, 1]],
+        })
+
+
+class FakeEvents:
+    """Stands in for `AlertEvent.objects`: returns `existing` to the locked lookup."""
+
+    def __init__(self, existing=()):
+        self.existing = list(existing)
+        self.created = []
+
+    def select_for_update(self):
+        return self
+
+    def filter(self, *args, **kwargs):
+        return self
+
+    def order_by(self, *fields):
+        return sorted(self.existing, key=lambda ev: ev.last_seen)
+
+    def bulk_create(self, events):
+        self.created.extend(events)
+        return events
+
+
+class EvaluateBatchTests(SimpleTestCase):
+    def reading(self, minutes, value, sensor_id=1, variable_id=7):
+        return mock.Mock(sensor_id=sensor_id, variable_id=variable_id, m_date=at(minutes), m_value=value)
+
+    def evaluate(self, measurements, existing=(), gains=None):
+        events = FakeEvents(existing)
+        registry = mock.Mock()
+        registry.for_variable.side_effect = lambda variable_id, station_id=None: CFG if variable_id == 7 else None
+        sensors = mock.Mock()
+        sensors.objects.filter.return_value.values_list.return_value = [(1, 100), (2, 200)]
+        calibration = mock.Mock()
+        calibration.value_for.side_effect = lambda sensor_id, variable_id, when, value: value * (gains or {}).get(sensor_id, 1)
+        with mock.patch.object(alerting, 'threshold_registry', registry), \
+                mock.patch.object(alerting, 'calibration', calibration), \
+                mock.patch.object(alerting, 'Sensor', sensors), \
+                mock.patch.object(alerting, '_lock_keys'), \
+                mock.patch.object(alerting.transaction, 'atomic', nullcontext), \
+                mock.patch.object(AlertEvent, 'objects', events), \
+                mock.patch.object(AlertEvent, 'save') as save:
+            touched = alerting.evaluate_batch(measurements)
+        return touched, events.created, save
+
+    def test_runs_split_by_gap_become_separate_episodes(self):
+        touched, created, _save = self.evaluate([
+            self.reading(0, 12.0), self.reading(20, 14.0), self.reading(200, 11.0),
+        ])
+        self.assertEqual(len(touched), 2)
+        self.assertEqual(
+            [(ev.station_id, ev.severity, ev.first_seen, ev.last_seen, ev.peak_value, ev.samples) for ev in created],
+            [(100, 'info', at(0), at(20), 14.0, 2), (100, 'info', at(200), at(200), 11.0, 1)],
+        )
+
+    def test_severities_and_stations_are_kept_apart(self):
+        _touched, created, _save = self.evaluate([
+            self.reading(0, 12.0), self.reading(5, 35.0), self.reading(10, 12.0, sensor_id=2),
+        ])
+        self.assertEqual(
+            sorted((ev.station_id, ev.severity, ev.samples) for ev in created),
+            [(100, 'critical', 1), (100, 'info', 1), (200, 'info', 1)],
+        )
+
+    def test_readings_below_thresholds_or_without_them_are_ignored(self):
+        touched, created, _save = self.evaluate([
+            self.reading(0, 5.0), self.reading(5, 50.0, variable_id=8), self.reading(10, 50.0, sensor_id=3),
+        ])
+        self.assertEqual((touched, created), ([], []))
+
+    def test_calibrated_values_are_classified(self):
+        _touched, created, _save = self.evaluate([self.reading(0, 12.0), self.reading(5, 12.0, sensor_id=2)],
+                                                 gains={1: 2.0, 2: 0.5})
+        self.assertEqual([(ev.station_id, ev.severity, ev.peak_value) for ev in created], [(100, 'warning', 24.0)])
+
+    def test_an_open_episode_within_the_gap_is_extended(self):
+        open_event = AlertEvent(
+            event_id=1, station_id=100, variable_id=7, severity='info',
+            first_seen=at(-30), last_seen=at(-10), peak_value=11.0, samples=3,
+        )
+        touched, created, save = self.evaluate([self.reading(30, 16.0), self.reading(200, 12.0)], [open_event])
+        self.assertEqual((open_event.first_seen, open_event.last_seen, open_event.peak_value, open_event.samples),
+                         (at(-30), at(30), 16.0, 4))
+        save.assert_called_once()
+        self.assertEqual([(ev.first_seen, ev.samples) for ev in created], [(at(200), 1)])
+        self.assertEqual(touched, [open_event] + created)
+
+    def test_late_readings_join_the_episode_they_fall_into(self):
+        older = AlertEvent(
+            event_id=1, station_id=100, variable_id=7, severity='info',
+            first_seen=at(0), last_seen=at(60), peak_value=12.0, samples=5,
+        )
+        newer = AlertEvent(
+            event_id=2, station_id=100, variable_id=7, severity='info',
+            first_seen=at(300), last_seen=at(360), peak_value=13.0, samples=5,
+        )
+        _touched, created, _save = self.evaluate([self.reading(30, 18.0)], [older, newer])
+        self.assertEqual(created, [])
+        self.assertEqual((older.peak_value, older.samples), (18.0, 6))
+        self.assertEqual((newer.peak_value, newer.samples), (13.0, 5))
+
+
+async def part(members, delay=0.0):
+    await asyncio.sleep(delay)
+    return members
+
+
+async def failing_part(delay=0.0):
+    await asyncio.sleep(delay)
+    raise ValueError('boom')
+
+
+class ObjectResponseTests(SimpleTestCase):
+    async def test_members_follow_the_head_in_part_order(self):
+        response = await concurrent.object_response(
+            [part({'b': 2}, 0.02), part({'c': 3, 'd': [1]})], head={'a': 1}, headers={'X-Report-Tier': 'raw'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Report-Tier'], 'raw')
+        self.assertEqual(list(json.loads(response.content)), ['a', 'b', 'c', 'd'])
+
+    async def test_a_failed_part_turns_into_a_500(self):
+        response = await concurrent.object_response([part({'b': 2}), failing_part(0.01)], head={'a': 1})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(json.loads(response.content), {'error': 'No se pudo generar el reporte', 'detail': 'boom'})
+
+    async def test_parts_run_concurrently(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await concurrent.object_response([part({'a': 1}, 0.1), part({'b': 2}, 0.1), part({'c': 3}, 0.1)])
+        self.assertLess(loop.time() - started, 0.25)
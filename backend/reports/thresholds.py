@@ -1,15 +1,28 @@
 """Thresholds per variable for alert severity levels.
 
-This file is intentionally a simple Python dict to avoid DB migrations.
-Keys should match `Variable.v_name` or variable id as string.
-Values: dict with keys 'info','warning','critical' numeric thresholds.
+The configuration is intentionally a set of simple Python dicts to avoid DB migrations.
+Keys of `THRESHOLDS` are canonical variable names (`Variable.v_name`); other spellings
+are mapped through `ALIASES`. Values: dict with keys 'info','warning','critical' numeric thresholds.
+
+`STATION_OVERRIDES` allows a station to use its own limits for some variables:
+    {station_id: {'PM2.5': {'info': ..., 'warning': ..., 'critical': ...}}}
+
+Use `registry` instead of reading the dicts directly: it resolves thresholds once per
+variable id and builds the SQL `CASE` expression used to classify measurements. A
+variable gets thresholds when its name matches a key or alias, or when the catalog
+resolves a key or alias to it (e.g. by code), so request parameters, ingest and the
+`CASE` all see the same variables.
 """
+import re
+
+from django.db.models import Case, CharField, Q, Value, When
+
+from variables.catalog import catalog as variable_catalog
 
 THRESHOLDS = {
     # Example thresholds (units depend on variable.v_unit)
     # PM2.5
     'PM2.5': {'info': 12.0, 'warning': 35.0, 'critical': 55.0},
-    'PM25': {'info': 12.0, 'warning': 35.0, 'critical': 55.0},
     # PM10
     'PM10': {'info': 20.0, 'warning': 50.0, 'critical': 150.0},
     # O3
@@ -21,3 +34,137 @@ THRESHOLDS = {
     # CO (mg/m3)
     'CO': {'info': 4.0, 'warning': 10.0, 'critical': 30.0},
 }
+
+# Alternative spellings -> canonical key in THRESHOLDS
+ALIASES = {
+    'PM25': 'PM2.5',
+    'PM2,5': 'PM2.5',
+    'OZONO': 'O3',
+    'DIOXIDODENITROGENO': 'NO2',
+    'DIOXIDODEAZUFRE': 'SO2',
+    'MONOXIDODECARBONO': 'CO',
+}
+
+# Per-station limits, keyed by station_id and then by canonical variable name
+STATION_OVERRIDES = {}
+
+# Ordered from most to least severe; classification picks the first level reached
+SEVERITIES = ('critical', 'warning', 'info')
+
+
+def normalize_key(name):
+    """Normalize a variable name for lookups: 'pm 2.5' -> 'PM2.5'."""
+    return re.sub(r'[\s_\-]+', '', str(name or '')).upper()
+
+
+class ThresholdRegistry:
+    """Thresholds resolved once per variable id.
+
+    Variable names come from the variable catalog; the resolved map is rebuilt
+    whenever the catalog reloads, or after `invalidate()` when the config changes.
+    """
+
+    def __init__(self, thresholds, aliases=None, station_overrides=None):
+        self._aliases = {normalize_key(a): normalize_key(c) for a, c in (aliases or {}).items()}
+        # spellings the catalog is asked to resolve, with their canonical key
+        self._names = [(name, normalize_key(name)) for name in thresholds]
+        self._names += [(alias, normalize_key(canonical)) for alias, canonical in (aliases or {}).items()]
+        self._by_key = {}
+        for name, cfg in thresholds.items():
+            self._by_key[normalize_key(name)] = cfg
+        for alias, canonical in self._aliases.items():
+            if canonical in self._by_key:
+                self._by_key.setdefault(alias, self._by_key[canonical])
+        self._station_overrides = {}
+        for station_id, per_variable in (station_overrides or {}).items():
+            for name, cfg in per_variable.items():
+                self._station_overrides.setdefault(self._canonical_key(name), {})[int(station_id)] = cfg
+        self._by_variable_id = None
+        self._catalog_version = None
+
+    def _canonical_key(self, name):
+        key = normalize_key(name)
+        return self._aliases.get(key, key)
+
+    def _load(self):
+        rows = variable_catalog.rows()
+        if self._by_variable_id is not None and self._catalog_version == variable_catalog.version:
+            return self._by_variable_id
+
+        resolved = {}
+        for row in rows:
+            cfg = self._by_key.get(normalize_key(row['v_name']))
+            if cfg:
+                resolved[row['v_id']] = (cfg, self._station_overrides.get(self._canonical_key(row['v_name']), {}))
+        for name, key in self._names:
+            cfg = self._by_key.get(key)
+            if not cfg:
+                continue
+            for v_id in variable_catalog.resolve(name):
+                resolved.setdefault(v_id, (cfg, self._station_overrides.get(key, {})))
+        self._by_variable_id = resolved
+        self._catalog_version = variable_catalog.version
+        return resolved
+
+    def invalidate(self):
+        self._by_variable_id = None
+
+    def for_name(self, name):
+        """Return the default thresholds for a variable name or alias, or None."""
+        return self._by_key.get(normalize_key(name))
+
+    def for_variable(self, variable_id, station_id=None):
+        """Return the thresholds for a variable id, honouring station overrides."""
+        entry = self._load().get(int(variable_id))
+        if not entry:
+            return None
+        cfg, overrides = entry
+        if station_id is not None:
+            return overrides.get(int(station_id), cfg)
+        return cfg
+
+    def lookup(self, variable):
+        """Resolve a request parameter (variable id or name) to its default thresholds.
+
+        Only thresholds of the variable ids the parameter resolves to count, so a
+        result means `severity_case()` classifies those ids; None otherwise.
+        """
+        if variable is None or variable == '':
+            return None
+        for v_id in variable_catalog.resolve(variable):
+            cfg = self.for_variable(v_id)
+            if cfg:
+                return cfg
+        return None
+
+    def variable_ids(self):
+        return list(self._load().keys())
+
+    def severity_case(self, variable_ids=None, field='m_value'):
+        """Build a `CASE` expression returning the severity of each measurement row.
+
+        Rows below every threshold evaluate to NULL, so filtering on
+        `severity__isnull=False` keeps only exceedances in the query. `field` is the
+        value compared, e.g. an annotation holding the calibrated value.
+        """
+        gte = f'{field}__gte'
+        whens = []
+        for v_id, (cfg, overrides) in self._load().items():
+            if variable_ids is not None and v_id not in variable_ids:
+                continue
+            for station_id, station_cfg in overrides.items():
+                for sev in SEVERITIES:
+                    whens.append(When(
+                        Q(variable_id=v_id, sensor__station_id=station_id, **{gte: station_cfg[sev]}),
+                        then=Value(sev),
+                    ))
+            for sev in SEVERITIES:
+                if overrides:
+                    cond = Q(variable_id=v_id, **{gte: cfg[sev]}) & ~Q(sensor__station_id__in=list(overrides))
+                else:
+                    cond = Q(variable_id=v_id, **{gte: cfg[sev]})
+                whens.append(When(cond, then=Value(sev)))
+        return Case(*whens, default=None, output_field=CharField())
+
+
+registry = ThresholdRegistry(THRESHOLDS, ALIASES, STATION_OVERRIDES)
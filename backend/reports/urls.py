@@ -1,10 +1,21 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
-urlpatterns = [
-    path('air_quality/', views.AirQualityReportView.as_view(), name='reports-air-quality'),
-    path('trends/', views.TrendsReportView.as_view(), name='reports-trends'),
-    path('alerts/', views.AlertsReportView.as_view(), name='reports-alerts'),
-    path('projection/', views.ProjectionReportView.as_view(), name='reports-projection'),
-    path('infrastructure/', views.InfrastructureReportView.as_view(), name='reports-infrastructure'),
-]
+if getattr(settings, 'REPORTS_ASYNC', False):
+    # under ASGI the async views serve the same routes (see reports/concurrent.py)
+    urlpatterns = [
+        path('air_quality/', views.air_quality_report, name='reports-air-quality'),
+        path('trends/', views.trends_report, name='reports-trends'),
+        path('alerts/', views.alerts_report, name='reports-alerts'),
+        path('projection/', views.projection_report, name='reports-projection'),
+        path('infrastructure/', views.infrastructure_report, name='reports-infrastructure'),
+    ]
+else:
+    urlpatterns = [
+        path('air_quality/', views.AirQualityReportView.as_view(), name='reports-air-quality'),
+        path('trends/', views.TrendsReportView.as_view(), name='reports-trends'),
+        path('alerts/', views.AlertsReportView.as_view(), name='reports-alerts'),
+        path('projection/', views.ProjectionReportView.as_view(), name='reports-projection'),
+        path('infrastructure/', views.InfrastructureReportView.as_view(), name='reports-infrastructure'),
+    ]
@@ -1,289 +1,569 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Avg, Max, Min, Count
-from django.utils.dateparse import parse_datetime
-from datetime import datetime, timedelta
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.db.models import Avg, Max, Min, Count, F, StdDev, Window
+from datetime import datetime, timedelta, timezone as dt_timezone
 
+from measurements import rollups
 from measurements.models import Measurement
-from variables.models import Variable
+from measurements.series_cache import concat, np
+from sensors.calibration import registry as calibration
 from stations.models import Station
-from .thresholds import THRESHOLDS
+from variables.catalog import catalog as variable_catalog
+from vrisa_backend import timing
+from vrisa_backend.renderers import stream_json_object
+from . import concurrent, planner
+from .models import AlertEvent
+from .thresholds import SEVERITIES, registry as threshold_registry
+import asyncio
 import math
+import time
+
+
+def _variable_name(v_id):
+    var = variable_catalog.get(v_id)
+    return var['v_name'] if var else None
+
+
+def _hour_label(ts):
+    return time.strftime('%Y-%m-%d %H:00', time.gmtime(ts))
+
+
+def _query_parts(qs):
+    """Group a measurement queryset into (station_id, variable_id, ts, values) arrays of calibrated values."""
+    grouped = {}
+    rows = qs.annotate(value=calibration.corrected()).order_by('m_date').values_list('m_date', 'value', 'sensor__station_id', 'variable_id')
+    for m_date, value, s_id, v_id in rows:
+        ts_list, val_list = grouped.setdefault((s_id, v_id), ([], []))
+        ts_list.append(int(m_date.timestamp()))
+        val_list.append(float(value))
+    return [
+        (s_id, v_id, np.asarray(ts_list, dtype=np.int64), np.asarray(val_list, dtype=np.float64))
+        for (s_id, v_id), (ts_list, val_list) in grouped.items()
+    ]
+
+
+def _station_names(station_ids):
+    return dict(Station.objects.filter(station_id__in=[int(s) for s in station_ids]).values_list('station_id', 's_name'))
+
+
+def _summarize_parts(parts):
+    """Summary and hotspot rows (same keys as the ORM aggregates) from cached arrays."""
+    by_variable, by_station = {}, {}
+    for s_id, v_id, _ts, values in parts:
+        n, total = len(values), float(values.sum())
+        v = by_variable.setdefault(v_id, {'samples': 0, 'total': 0.0, 'minimum': None, 'maximum': None})
+        v['samples'] += n
+        v['total'] += total
+        lo, hi = float(values.min()), float(values.max())
+        v['minimum'] = lo if v['minimum'] is None else min(v['minimum'], lo)
+        v['maximum'] = hi if v['maximum'] is None else max(v['maximum'], hi)
+        st = by_station.setdefault(s_id, {'samples': 0, 'total': 0.0})
+        st['samples'] += n
+        st['total'] += total
+    summary = []
+    for v_id, t in by_variable.items():
+        var = variable_catalog.get(v_id) or {}
+        summary.append({
+            'variable__v_id': v_id, 'variable__v_name': var.get('v_name'), 'variable__v_unit': var.get('v_unit'),
+            'avg': t['total'] / t['samples'], 'maximum': t['maximum'], 'minimum': t['minimum'], 'samples': t['samples'],
+        })
+    hotspots = []
+    for row in Station.objects.filter(station_id__in=list(by_station)).values('station_id', 's_name', 'lat', 'lon'):
+        t = by_station[row['station_id']]
+        hotspots.append({
+            'sensor__station__station_id': row['station_id'], 'sensor__station__s_name': row['s_name'],
+            'sensor__station__lat': row['lat'], 'sensor__station__lon': row['lon'],
+            'avg_value': t['total'] / t['samples'], 'samples': t['samples'],
+        })
+    summary.sort(key=lambda r: r['avg'], reverse=True)
+    hotspots.sort(key=lambda r: r['avg_value'], reverse=True)
+    return summary, hotspots
+
+
+def _merge_summary(summary, compacted):
+    """Fold per-variable totals from the compacted tier into the raw summary rows."""
+    by_id = {row['variable__v_id']: row for row in summary}
+    for v_id, t in compacted.items():
+        row = by_id.get(v_id)
+        if row is None:
+            var = variable_catalog.get(v_id) or {}
+            by_id[v_id] = {
+                'variable__v_id': v_id, 'variable__v_name': var.get('v_name'), 'variable__v_unit': var.get('v_unit'),
+                'avg': t['total'] / t['samples'], 'maximum': t['maximum'], 'minimum': t['minimum'], 'samples': t['samples'],
+            }
+            continue
+        samples = row['samples'] + t['samples']
+        row['avg'] = (float(row['avg']) * row['samples'] + float(t['total'])) / samples
+        row['maximum'] = max(float(row['maximum']), float(t['maximum']))
+        row['minimum'] = min(float(row['minimum']), float(t['minimum']))
+        row['samples'] = samples
+    return sorted(by_id.values(), key=lambda r: r['avg'], reverse=True)
+
+
+def _merge_station_avgs(station_avgs, compacted):
+    by_id = {row['sensor__station__station_id']: dict(row) for row in station_avgs}
+    for station_id, t in compacted.items():
+        row = by_id.get(station_id)
+        if row is None:
+            row = {k: t[k] for k in ('sensor__station__station_id', 'sensor__station__s_name', 'sensor__station__lat', 'sensor__station__lon')}
+            row.update(avg_value=t['total'] / t['samples'], samples=t['samples'])
+            by_id[station_id] = row
+            continue
+        samples = row['samples'] + t['samples']
+        row['avg_value'] = (float(row['avg_value']) * row['samples'] + float(t['total'])) / samples
+        row['samples'] = samples
+    return sorted(by_id.values(), key=lambda r: r['avg_value'], reverse=True)
+
+
+def _summary(plan, agg=None):
+    """Per-variable averages over every tier of the plan; `agg` is the raw slice's, if already computed."""
+    stations, variable_ids = plan.window.stations, plan.window.variable_ids
+    if agg is None:
+        value = calibration.corrected()
+        # Aggregate averages per variable (names come from the variable catalog, no JOIN)
+        agg = []
+        for row in (
+            plan.queryset().values('variable_id')
+            .annotate(avg=Avg(value), maximum=Max(value), minimum=Min(value), samples=Count('m_id'))
+            .order_by('-avg')
+        ):
+            v_id = row.pop('variable_id')
+            var = variable_catalog.get(v_id) or {}
+            agg.append({'variable__v_id': v_id, 'variable__v_name': var.get('v_name'), 'variable__v_unit': var.get('v_unit'), **row})
+
+    # Older parts of the window may only exist in the compacted tier or the archive
+    if plan.compacted:
+        tier_start, tier_end = plan.rollup_range()
+        agg = _merge_summary(agg, rollups.totals_by_variable(tier_start, tier_end, stations, variable_ids))
+    if plan.archive is not None:
+        agg = _merge_summary(agg, plan.archive.totals_by_variable(stations, variable_ids))
+    return list(agg)
+
+
+def _summary_samples(summary):
+    return sum(row['samples'] or 0 for row in summary)
+
+
+def _hotspots(plan, station_avgs=None):
+    """(hotspots, heatmap): the 200 stations with the highest average over every tier, binned
+    into a grid; `station_avgs` is the raw slice's, if already computed."""
+    stations, variable_ids = plan.window.stations, plan.window.variable_ids
+    if station_avgs is None:
+        value = calibration.corrected()
+        # Hotspots: stations with highest average for their top pollutant
+        station_avgs = (
+            plan.queryset().values('sensor__station__station_id', 'sensor__station__s_name', 'sensor__station__lat', 'sensor__station__lon')
+            .annotate(avg_value=Avg(value), samples=Count('m_id'))
+            .order_by('-avg_value')
+        )
 
-
-def _parse_float(v):
-    try:
-        return float(v)
-    except Exception:
-        return None
+    if plan.compacted:
+        tier_start, tier_end = plan.rollup_range()
+        station_avgs = _merge_station_avgs(station_avgs, rollups.totals_by_station(tier_start, tier_end, stations, variable_ids))
+    if plan.archive is not None:
+        station_avgs = _merge_station_avgs(station_avgs, plan.archive.totals_by_station(stations, variable_ids))
+    station_avgs = list(station_avgs[:200])
+
+    # Build simple heatmap by binning the numeric station coordinates into grid cells
+    coords = {
+        station_id: (lat, lon)
+        for station_id, lat, lon in Station.objects.filter(
+            station_id__in=[s['sensor__station__station_id'] for s in station_avgs], latitude__isnull=False,
+        ).values_list('station_id', 'latitude', 'longitude')
+    }
+    cell_size = 0.01  # ~1km scale depending on latitude
+    grid = {}
+    for s in station_avgs:
+        if s['sensor__station__station_id'] not in coords:
+            continue
+        lat, lon = coords[s['sensor__station__station_id']]
+        cell_lat = round(lat / cell_size) * cell_size
+        cell_lon = round(lon / cell_size) * cell_size
+        key = f"{cell_lat}:{cell_lon}"
+        entry = grid.setdefault(key, {'sum': 0.0, 'count': 0, 'lat_sum': 0.0, 'lon_sum': 0.0})
+        entry['sum'] += float(s.get('avg_value') or 0)
+        entry['count'] += 1
+        entry['lat_sum'] += lat
+        entry['lon_sum'] += lon
+
+    heatmap = []
+    for k, v in grid.items():
+        avg_intensity = v['sum'] / max(1, v['count'])
+        heatmap.append({'lat': v['lat_sum'] / v['count'], 'lon': v['lon_sum'] / v['count'], 'intensity': avg_intensity})
+    return station_avgs, heatmap
 
 
 class AirQualityReportView(APIView):
     """Return aggregated air quality summary for city or a station."""
 
     def get(self, request):
-        station_id = request.query_params.get('station_id')
-        start = request.query_params.get('start_date')
-        end = request.query_params.get('end_date')
-        days_param = request.query_params.get('days')
-
-        try:
-            if end:
-                end_dt = parse_datetime(end) or datetime.fromisoformat(end)
-            else:
-                end_dt = datetime.utcnow()
-        except Exception:
-            end_dt = datetime.utcnow()
-
-        # If client explicitly requested all data, do not apply a time window
-        if days_param == 'all':
-            qs = Measurement.objects.all()
-        else:
-            try:
-                if start:
-                    start_dt = parse_datetime(start) or datetime.fromisoformat(start)
-                else:
-                    start_dt = end_dt - timedelta(hours=24)
-            except Exception:
-                start_dt = end_dt - timedelta(hours=24)
-
-            qs = Measurement.objects.filter(m_date__gte=start_dt, m_date__lte=end_dt)
-        if station_id:
-            qs = qs.filter(sensor__station__station_id=station_id)
-
-        # Aggregate averages per variable
-        agg = (
-            qs.values('variable__v_id', 'variable__v_name', 'variable__v_unit')
-            .annotate(avg=Avg('m_value'), maximum=Max('m_value'), minimum=Min('m_value'), samples=Count('m_id'))
-            .order_by('-avg')
+        plan = planner.plan(request, 'summary', default=timedelta(hours=24))
+        agg = station_avgs = None
+        if plan.cached is not None:
+            agg, station_avgs = _summarize_parts(plan.cached)
+        summary = _summary(plan, agg)
+        hotspots, heatmap = _hotspots(plan, station_avgs)
+        return plan.response(
+            {'summary': summary, 'hotspots': hotspots, 'heatmap': heatmap}, rows=_summary_samples(summary),
         )
 
-        # Hotspots: stations with highest average for their top pollutant
-        station_avgs = (
-            qs.values('sensor__station__station_id', 'sensor__station__s_name', 'sensor__station__lat', 'sensor__station__lon')
-            .annotate(avg_value=Avg('m_value'))
-            .order_by('-avg_value')[:200]
-        )
 
-        # Build simple heatmap by binning lat/lon into grid cells
-        cell_size = 0.01  # ~1km scale depending on latitude
-        grid = {}
-        for s in station_avgs:
-            lat = _parse_float(s.get('sensor__station__lat'))
-            lon = _parse_float(s.get('sensor__station__lon'))
-            if lat is None or lon is None:
-                continue
-            cell_lat = round(lat / cell_size) * cell_size
-            cell_lon = round(lon / cell_size) * cell_size
-            key = f"{cell_lat}:{cell_lon}"
-            entry = grid.setdefault(key, {'sum': 0.0, 'count': 0, 'lat_sum': 0.0, 'lon_sum': 0.0})
-            entry['sum'] += float(s.get('avg_value') or 0)
-            entry['count'] += 1
-            entry['lat_sum'] += lat
-            entry['lon_sum'] += lon
+def _trend_series(plan):
+    """{hour label: {time, count, sum}} of the raw slice (cache or `measurement`)."""
+    series = {}
+    if plan.cached is not None:
+        ts, values, _, _ = concat(plan.cached)
+        hours, inverse = np.unique(ts // 3600, return_inverse=True)
+        sums = np.bincount(inverse, weights=values, minlength=len(hours))
+        counts = np.bincount(inverse, minlength=len(hours))
+        for h, total, n in zip(hours, sums, counts):
+            key = _hour_label(int(h) * 3600)
+            series[key] = {'time': key, 'count': int(n), 'sum': float(total)}
+    else:
+        # Simple hourly aggregation
+        rows = plan.queryset().annotate(value=calibration.corrected()).order_by('m_date').values_list('m_date', 'value')
+        for m_date, value in rows:
+            hour = m_date.strftime('%Y-%m-%d %H:00')
+            key = hour
+            if key not in series:
+                series[key] = {'time': key, 'count': 0, 'sum': 0}
+            series[key]['count'] += 1
+            series[key]['sum'] += float(value)
+    return series
 
-        heatmap = []
-        for k, v in grid.items():
-            avg_intensity = v['sum'] / max(1, v['count'])
-            heatmap.append({'lat': v['lat_sum'] / v['count'], 'lon': v['lon_sum'] / v['count'], 'intensity': avg_intensity})
 
-        return Response({'summary': list(agg), 'hotspots': list(station_avgs), 'heatmap': heatmap})
+def _rollup_buckets(plan):
+    """(bucket, samples, total) of the hours (or days, for very old data) compacted out of the raw table."""
+    tier_start, tier_end = plan.rollup_range()
+    return list(rollups.hourly_buckets(tier_start, tier_end, plan.window.variable_ids, plan.window.stations))
 
 
-class TrendsReportView(APIView):
-    """Return time-series trends for a variable and station grouped by hour/day."""
+def _archive_buckets(plan):
+    """(bucket, samples, total) of the months kept in the columnar archive, for the whole history."""
+    return list(plan.archive.hourly_buckets(plan.window.variable_ids, plan.window.stations))
 
-    def get(self, request):
-        variable = request.query_params.get('variable')  # accept id or code/name
-        station_id = request.query_params.get('station_id')
-        days_param = request.query_params.get('days')
-
-        end_dt = datetime.utcnow()
-        # If client requested all data, do not constrain by dates
-        if days_param == 'all':
-            qs = Measurement.objects.all()
-        else:
-            range_days = int(days_param or 7)
-            start_dt = end_dt - timedelta(days=range_days)
-            qs = Measurement.objects.filter(m_date__gte=start_dt, m_date__lte=end_dt)
-        if variable:
-            try:
-                # try numeric id
-                vid = int(variable)
-                qs = qs.filter(variable__v_id=vid)
-            except Exception:
-                qs = qs.filter(variable__v_name__icontains=variable)
-        if station_id:
-            qs = qs.filter(sensor__station__station_id=station_id)
 
-        # Simple hourly aggregation
-        # Build a dict grouped by hour
-        series = {}
-        for m in qs.order_by('m_date'):
-            hour = m.m_date.strftime('%Y-%m-%d %H:00')
-            key = hour
-            if key not in series:
-                series[key] = {'time': key, 'count': 0, 'sum': 0}
-            series[key]['count'] += 1
-            series[key]['sum'] += float(m.m_value)
+def _trend_data(series, older):
+    """Merge the older tiers' buckets into the raw series; returns (data, readings)."""
+    for buckets in older:
+        for bucket, samples, total in buckets:
+            key = bucket.strftime('%Y-%m-%d %H:00')
+            entry = series.setdefault(key, {'time': key, 'count': 0, 'sum': 0})
+            entry['count'] += samples
+            entry['sum'] += total
+    if older:
+        series = dict(sorted(series.items()))
+
+    data = []
+    for k, v in series.items():
+        data.append({'time': v['time'], 'value': v['sum'] / max(1, v['count'])})
+    return data, sum(v['count'] for v in series.values())
 
-        data = []
-        for k, v in series.items():
-            data.append({'time': v['time'], 'value': v['sum'] / max(1, v['count'])})
 
-        return Response({'series': data})
+class TrendsReportView(APIView):
+    """Return time-series trends for a variable and station grouped by hour/day."""
+
+    def get(self, request):
+        plan = planner.plan(request, 'hourly')
+        series = _trend_series(plan)
+        older = []
+        if plan.compacted:
+            older.append(_rollup_buckets(plan))
+        if plan.archive is not None:
+            older.append(_archive_buckets(plan))
+        data, readings = _trend_data(series, older)
+        return plan.response({'series': data}, rows=readings)
+
+
+def _alert_events(window):
+    """`alert_event` rows overlapping the window."""
+    events = AlertEvent.objects.all()
+    if window.start is not None:
+        events = events.filter(last_seen__gte=window.start)
+    if window.variable_ids is not None:
+        events = events.filter(variable_id__in=window.variable_ids)
+    if window.stations is not None:
+        events = events.filter(station_id__in=window.stations)
+    return events
+
+
+def _alert_event_counts(events):
+    counts = {sev: 0 for sev in SEVERITIES}
+    for row in events.values('severity').annotate(n=Count('event_id')).order_by():
+        counts[row['severity']] = row['n']
+    return counts
+
+
+def _alert_event_rows(events):
+    return events.order_by('-last_seen').values(
+        'event_id', 'first_seen', 'last_seen', 'peak_value', 'samples', 'severity',
+        'station_id', 'station__s_name', 'variable_id',
+    )
+
+
+def _alert_event_dicts(rows):
+    return [{
+        'event_id': ev['event_id'],
+        'datetime': ev['last_seen'],
+        'first_seen': ev['first_seen'],
+        'last_seen': ev['last_seen'],
+        'value': float(ev['peak_value']),
+        'samples': ev['samples'],
+        'station': ev['station__s_name'],
+        'station_id': ev['station_id'],
+        'severity': ev['severity'],
+        'variable': _variable_name(ev['variable_id']),
+        'variable_id': ev['variable_id'],
+    } for ev in rows]
+
+
+def _alert_event_list(events):
+    return _alert_event_dicts(_alert_event_rows(events))
+
+
+def _scan_parts(parts, threshold_cfg):
+    """Same answers as the SQL scan, computed on (station, variable, ts, values) arrays
+    from the recent-series cache or the columnar archive; returns (data, readings)."""
+    parts = list(parts)
+    hits = []
+    if threshold_cfg:
+        counts = {sev: 0 for sev in SEVERITIES}
+        for station_id, variable_id, ts, values in parts:
+            cfg = threshold_registry.for_variable(variable_id, station_id)
+            if not cfg:
+                continue
+            levels = np.select([values >= cfg[sev] for sev in SEVERITIES], range(len(SEVERITIES)), default=-1)
+            for i in np.flatnonzero(levels >= 0):
+                severity = SEVERITIES[levels[i]]
+                counts[severity] += 1
+                hits.append((int(ts[i]), float(values[i]), station_id, severity, variable_id))
+        result = {'mode': 'thresholds', 'thresholds': threshold_cfg, 'counts': counts}
+    else:
+        samples = sum(len(p[3]) for p in parts)
+        if not samples:
+            return {'alerts': []}, 0
+        # population standard deviation, like Postgres' stddev_pop used by the SQL path
+        mean = sum(float(p[3].sum(dtype=np.float64)) for p in parts) / samples
+        variance = sum(float(np.square(p[3].astype(np.float64) - mean).sum()) for p in parts) / samples
+        threshold = mean + 2 * math.sqrt(variance)
+        for station_id, variable_id, ts, values in parts:
+            for i in np.flatnonzero(values >= threshold):
+                hits.append((int(ts[i]), float(values[i]), station_id, 'statistical', variable_id))
+        result = {'mode': 'statistical', 'threshold': threshold}
+
+    names = _station_names({h[2] for h in hits})
+    hits.sort(key=lambda h: h[0])
+    result['alerts'] = [
+        {
+            'datetime': datetime.fromtimestamp(ts, dt_timezone.utc),
+            'value': round(value, 4),
+            'station': names.get(station_id),
+            'severity': severity,
+            'variable': _variable_name(variable_id),
+            'variable_id': variable_id
+        }
+        for ts, value, station_id, severity, variable_id in hits
+    ]
+    return result, sum(len(p[2]) for p in parts)
+
+
+def _alert_scan(plan, threshold_cfg):
+    """Classify the measurements of the window; returns (data, readings or None)."""
+    if plan.cached is not None:
+        return _scan_parts(plan.cached, threshold_cfg)
+    if plan.archive is not None:
+        parts = list(plan.archive.parts(plan.window.variable_ids, plan.window.stations)) + _query_parts(plan.queryset())
+        return _scan_parts(parts, threshold_cfg)
+    # classify and report calibrated values
+    qs = plan.queryset().annotate(value=calibration.corrected())
+
+    alerts = []
+    # If the registry has thresholds for the variable, use them; otherwise fallback to statistical method
+    if threshold_cfg:
+        # Classification happens in SQL: the CASE yields NULL below every threshold,
+        # so only exceedances (with per-severity counts via a window) leave Postgres.
+        # Use values() to avoid fetching related Station model instances
+        # (which can trigger DB queries that reference missing columns).
+        severity = threshold_registry.severity_case(field='value')
+        rows = (
+            qs.annotate(severity=severity)
+            .filter(severity__isnull=False)
+            .annotate(severity_count=Window(Count('m_id'), partition_by=[F('severity')]))
+            .order_by('m_date')
+            .values('m_date', 'value', 'severity', 'severity_count', 'sensor__station__s_name', 'variable_id')
+        )
+        counts = {sev: 0 for sev in SEVERITIES}
+        for m in rows:
+            counts[m['severity']] = m['severity_count']
+            alerts.append({
+                'datetime': m.get('m_date'),
+                'value': float(m.get('value') or 0),
+                'station': m.get('sensor__station__s_name'),
+                'severity': m.get('severity'),
+                'variable': _variable_name(m['variable_id']),
+                'variable_id': m['variable_id']
+            })
+        return {'mode': 'thresholds', 'thresholds': threshold_cfg, 'counts': counts, 'alerts': alerts}, None
+
+    # fallback statistical: mean/stdev are computed by Postgres as well
+    stats = qs.aggregate(mean=Avg('value'), stdev=StdDev('value'), samples=Count('m_id'))
+    if not stats['samples']:
+        return {'alerts': []}, 0
+
+    mean = float(stats['mean'])
+    stdev = float(stats['stdev'] or 0)
+    threshold = mean + 2 * stdev
+
+    # Include values equal to the threshold
+    for m in qs.filter(value__gte=threshold).order_by('m_date').values('m_date', 'value', 'sensor__station__s_name', 'variable_id'):
+        alerts.append({
+            'datetime': m.get('m_date'),
+            'value': float(m.get('value') or 0),
+            'station': m.get('sensor__station__s_name'),
+            'severity': 'statistical',
+            'variable': _variable_name(m['variable_id']),
+            'variable_id': m['variable_id']
+        })
+
+    return {'mode': 'statistical', 'threshold': threshold, 'alerts': alerts}, stats['samples']
+
+
+def _alert_mode(request, plan):
+    """(use the event table, threshold config) for an alerts request."""
+    variable = plan.window.variable
+    threshold_cfg = threshold_registry.lookup(variable) if variable else None
+    return request.GET.get('mode') != 'scan' and (threshold_cfg or not variable), threshold_cfg
 
 
 class AlertsReportView(APIView):
-    """Compute alert episodes using simple statistical thresholds."""
+    """Return alert episodes for a window.
+
+    By default this is an indexed read of `alert_event`, which is maintained at ingest
+    time. `mode=scan` classifies the raw measurements of the window instead, and
+    variables without configured thresholds use a simple statistical method.
+    """
 
     def get(self, request):
-        variable = request.query_params.get('variable')
-        station_id = request.query_params.get('station_id')
-        days_param = request.query_params.get('days')
-
-        end_dt = datetime.utcnow()
-        # support requesting all data via days='all'
-        if days_param == 'all':
-            qs = Measurement.objects.all()
+        plan = planner.plan(request, 'samples')
+        use_events, threshold_cfg = _alert_mode(request, plan)
+        if use_events:
+            events = _alert_events(plan.window)
+            head = {'mode': 'events', 'thresholds': threshold_cfg, 'counts': _alert_event_counts(events)}
+            if request.accepted_renderer.format != 'json':
+                return plan.response({**head, 'alerts': _alert_event_list(events)}, tiers=['events'])
+            rows = _alert_event_rows(events).iterator(chunk_size=settings.JSON_STREAM_CHUNK_ROWS)
+            return stream_json_object(request, head, 'alerts', rows, _alert_event_dicts, headers=plan.headers(['events']))
+        data, readings = _alert_scan(plan, threshold_cfg)
+        return plan.response(data, rows=readings)
+
+
+def _projection_plan(request):
+    """(plan, hours, points) of a projection request: the last 7 days of a variable and station."""
+    variable = request.GET.get('variable')
+    station_id = request.GET.get('station_id')
+    hours = int(request.GET.get('hours') or 24)
+    points = int(request.GET.get('points') or hours)
+
+    end_dt = datetime.utcnow()
+    start_dt = end_dt - timedelta(days=7)  # use last 7 days by default
+    return planner.ReportPlan(planner.ReportWindow(start_dt, end_dt, station_id, variable), 'samples'), hours, points
+
+
+def _projection(plan, hours, points):
+    """Least-squares line through the window's readings; returns (data, status, readings)."""
+    if plan.cached is not None:
+        ts, values, _, _ = concat(plan.cached)
+        if len(ts) < 3:
+            return {'error': 'Not enough data to project', 'available': int(len(ts))}, 400, len(ts)
+        xs = (ts - ts[0]).astype(np.float64)
+        if np.ptp(xs) == 0:
+            slope, intercept = 0.0, float(values.mean())
         else:
-            days = int(days_param or 7)
-            start_dt = end_dt - timedelta(days=days)
-            qs = Measurement.objects.filter(m_date__gte=start_dt, m_date__lte=end_dt)
-        if variable:
-            try:
-                vid = int(variable)
-                qs = qs.filter(variable__v_id=vid)
-            except Exception:
-                qs = qs.filter(variable__v_name__icontains=variable)
-        if station_id:
-            qs = qs.filter(sensor__station__station_id=station_id)
-
-        alerts = []
-        # If THRESHOLDS contains an entry for the variable, use it; otherwise fallback to statistical method
-        threshold_cfg = None
-        if variable:
-            # try exact match by name
-            threshold_cfg = THRESHOLDS.get(variable)
-            # try common variants
-            if not threshold_cfg:
-                threshold_cfg = THRESHOLDS.get(variable.replace(' ', '').upper()) or THRESHOLDS.get(variable.upper())
-
-        if threshold_cfg:
-            # Use values() to avoid fetching related Station model instances
-            # (which can trigger DB queries that reference missing columns).
-            for m in qs.order_by('m_date').values('m_date', 'm_value', 'sensor__station__s_name', 'variable__v_name', 'variable__v_id'):
-                try:
-                    val = float(m.get('m_value') or 0)
-                except Exception:
-                    continue
-                sev = None
-                if val >= threshold_cfg.get('critical'):
-                    sev = 'critical'
-                elif val >= threshold_cfg.get('warning'):
-                    sev = 'warning'
-                elif val >= threshold_cfg.get('info'):
-                    sev = 'info'
-                if sev:
-                    alerts.append({
-                        'datetime': m.get('m_date'),
-                        'value': val,
-                        'station': m.get('sensor__station__s_name'),
-                        'severity': sev,
-                        'variable': m.get('variable__v_name'),
-                        'variable_id': m.get('variable__v_id')
-                    })
-            return Response({'mode': 'thresholds', 'thresholds': threshold_cfg, 'alerts': alerts})
-
-        # fallback statistical
-        values = [float(m.m_value) for m in qs]
-        if not values:
-            return Response({'alerts': []})
-
-        import statistics
-
-        mean = statistics.mean(values)
-        stdev = statistics.pstdev(values) if len(values) > 1 else 0
-        threshold = mean + 2 * stdev
-
-        for m in qs.order_by('m_date').values('m_date', 'm_value', 'sensor__station__s_name', 'variable__v_name', 'variable__v_id'):
-            try:
-                mv = float(m.get('m_value') or 0)
-            except Exception:
-                continue
-            # Include values equal to the threshold
-            if mv >= threshold:
-                alerts.append({
-                    'datetime': m.get('m_date'),
-                    'value': mv,
-                    'station': m.get('sensor__station__s_name'),
-                    'severity': 'statistical',
-                    'variable': m.get('variable__v_name'),
-                    'variable_id': m.get('variable__v_id')
-                })
-
-        return Response({'mode': 'statistical', 'threshold': threshold, 'alerts': alerts})
+            slope, intercept = (float(c) for c in np.polyfit(xs, values, 1))
+        step = (hours * 3600) / max(1, points)
+        proj_ts = ts[-1] + step * np.arange(1, points + 1)
+        proj_y = intercept + slope * (proj_ts - ts[0])
+        proj = [
+            {'time': datetime.fromtimestamp(float(t), dt_timezone.utc).replace(tzinfo=None).isoformat(), 'value': float(y)}
+            for t, y in zip(proj_ts, proj_y)
+        ]
+        return {'slope': slope, 'intercept': intercept, 'projection': proj}, 200, len(ts)
+
+    qs = plan.queryset()
+
+    data = list(qs.annotate(value=calibration.corrected()).order_by('m_date').values_list('m_date', 'value'))
+    if len(data) < 3:
+        return {'error': 'Not enough data to project', 'available': len(data)}, 400, len(data)
+
+    # build arrays of t (seconds) and y
+    t0 = data[0][0].timestamp()
+    xs = [m_date.timestamp() - t0 for m_date, _value in data]
+    ys = [float(value) for _m_date, value in data]
+
+    # linear regression (least squares)
+    n = len(xs)
+    sum_x = sum(xs)
+    sum_y = sum(ys)
+    sum_xx = sum(x * x for x in xs)
+    sum_xy = sum(x * y for x, y in zip(xs, ys))
+    denom = (n * sum_xx - sum_x * sum_x)
+    if denom == 0:
+        slope = 0.0
+    else:
+        slope = (n * sum_xy - sum_x * sum_y) / denom
+    intercept = (sum_y - slope * sum_x) / n
+
+    # generate projection points equally spaced over `hours`
+    proj = []
+    last_ts = data[-1][0].timestamp()
+    step = (hours * 3600) / max(1, points)
+    for i in range(1, points + 1):
+        ts = last_ts + i * step
+        x = ts - t0
+        y = intercept + slope * x
+        proj.append({'time': datetime.utcfromtimestamp(ts).isoformat(), 'value': y})
+
+    return {'slope': slope, 'intercept': intercept, 'projection': proj}, 200, n
 
 
 class ProjectionReportView(APIView):
     """Return a simple linear projection for a variable over the next N hours.
 
-    Uses a least-squares linear fit on recent measurements (no external deps).
+    Uses a least-squares linear fit on recent measurements, on the cached arrays when
+    the recent-series cache holds the window.
     """
 
     def get(self, request):
-        variable = request.query_params.get('variable')
-        station_id = request.query_params.get('station_id')
-        hours = int(request.query_params.get('hours') or 24)
-        points = int(request.query_params.get('points') or hours)
-
-        end_dt = datetime.utcnow()
-        start_dt = end_dt - timedelta(days=7)  # use last 7 days by default
-
-        qs = Measurement.objects.filter(m_date__gte=start_dt, m_date__lte=end_dt)
-        if variable:
-            try:
-                vid = int(variable)
-                qs = qs.filter(variable__v_id=vid)
-            except Exception:
-                qs = qs.filter(variable__v_name__icontains=variable)
-        if station_id:
-            qs = qs.filter(sensor__station__station_id=station_id)
-
-        data = list(qs.order_by('m_date'))
-        if len(data) < 3:
-            return Response({'error': 'Not enough data to project', 'available': len(data)}, status=400)
-
-        # build arrays of t (seconds) and y
-        t0 = data[0].m_date.timestamp()
-        xs = [m.m_date.timestamp() - t0 for m in data]
-        ys = [float(m.m_value) for m in data]
-
-        # linear regression (least squares)
-        n = len(xs)
-        sum_x = sum(xs)
-        sum_y = sum(ys)
-        sum_xx = sum(x * x for x in xs)
-        sum_xy = sum(x * y for x, y in zip(xs, ys))
-        denom = (n * sum_xx - sum_x * sum_x)
-        if denom == 0:
-            slope = 0.0
-        else:
-            slope = (n * sum_xy - sum_x * sum_y) / denom
-        intercept = (sum_y - slope * sum_x) / n
+        plan, hours, points = _projection_plan(request)
+        data, code, readings = _projection(plan, hours, points)
+        return plan.response(data, status=code, rows=readings)
 
-        # generate projection points equally spaced over `hours`
-        proj = []
-        last_ts = data[-1].m_date.timestamp()
-        step = (hours * 3600) / max(1, points)
-        for i in range(1, points + 1):
-            ts = last_ts + i * step
-            x = ts - t0
-            y = intercept + slope * x
-            proj.append({'time': datetime.utcfromtimestamp(ts).isoformat(), 'value': y})
 
-        return Response({'slope': slope, 'intercept': intercept, 'projection': proj})
+def _infrastructure_stations():
+    # Use values() to avoid selecting model fields that may not exist in DB
+    return list(Station.objects.values('station_id', 's_name', 'lat', 'lon', 'calibration_certificate', 'maintenance_date'))
+
+
+def _last_measurements():
+    """{station_id: newest m_date}, from one grouped query."""
+    rows = Measurement.objects.values('sensor__station_id').annotate(last=Max('m_date')).order_by()
+    return {row['sensor__station_id']: row['last'] for row in rows}
+
+
+def _infrastructure_row(s, last_meas_date):
+    maintenance_date = s.get('maintenance_date').isoformat() if s.get('maintenance_date') else None
+    return {
+        'station_id': s.get('station_id'),
+        'name': s.get('s_name'),
+        'lat': s.get('lat'),
+        'lon': s.get('lon'),
+        'calibration_certificate': s.get('calibration_certificate'),
+        'maintenance_date': maintenance_date,
+        'last_measurement': last_meas_date.isoformat() if last_meas_date else None,
+    }
 
 
 class InfrastructureReportView(APIView):
@@ -291,24 +571,109 @@ class InfrastructureReportView(APIView):
 
     def get(self, request):
         try:
-            # Use values() to avoid selecting model fields that may not exist in DB
-            stations_qs = Station.objects.values('station_id', 's_name', 'lat', 'lon', 'calibration_certificate', 'maintenance_date')
-            out = []
-            for s in stations_qs:
-                # find last measurement by station_id
-                last_meas = Measurement.objects.filter(sensor__station__station_id=s.get('station_id')).order_by('-m_date').first()
-                maintenance_date = s.get('maintenance_date').isoformat() if s.get('maintenance_date') else None
-                last_meas_dt = last_meas.m_date.isoformat() if getattr(last_meas, 'm_date', None) else None
-                out.append({
-                    'station_id': s.get('station_id'),
-                    'name': s.get('s_name'),
-                    'lat': s.get('lat'),
-                    'lon': s.get('lon'),
-                    'calibration_certificate': s.get('calibration_certificate'),
-                    'maintenance_date': maintenance_date,
-                    'last_measurement': last_meas_dt,
-                })
-
+            lasts = _last_measurements()
+            out = [_infrastructure_row(s, lasts.get(s.get('station_id'))) for s in _infrastructure_stations()]
             return Response({'stations': out})
         except Exception as exc:
             return Response({'error': str(exc)}, status=500)
+
+
+# Async versions of the views above, routed instead of them under ASGI (reports/urls.py).
+# They share the helpers above; independent parts of a report run concurrently on
+# the report query pool (reports/concurrent.py).
+
+async def _plan_or_error(build, *args):
+    """(plan, None) or (None, 400 response) for invalid window parameters."""
+    try:
+        return await concurrent.run(build, *args), None
+    except ValidationError as exc:
+        return None, concurrent.json_response(exc.detail, status=400)
+
+
+def _summary_members(plan, agg):
+    summary = _summary(plan, agg)
+    timing.note('rows', _summary_samples(summary))
+    return {'summary': summary}
+
+
+def _hotspot_members(plan, station_avgs):
+    hotspots, heatmap = _hotspots(plan, station_avgs)
+    return {'hotspots': hotspots, 'heatmap': heatmap}
+
+
+async def air_quality_report(request):
+    """Async `AirQualityReportView`: the per-variable summary and the per-station hotspots run concurrently."""
+    plan, error = await _plan_or_error(planner.cached_plan, request, 'summary', timedelta(hours=24))
+    if error:
+        return error
+    agg = station_avgs = None
+    if plan.cached is not None:
+        agg, station_avgs = await concurrent.run(_summarize_parts, plan.cached)
+    return await concurrent.object_response(
+        [concurrent.run(_summary_members, plan, agg), concurrent.run(_hotspot_members, plan, station_avgs)],
+        headers=plan.headers(),
+    )
+
+
+async def trends_report(request):
+    """Async `TrendsReportView`: the raw slice, the rollups and the archive are read concurrently."""
+    plan, error = await _plan_or_error(planner.cached_plan, request, 'hourly')
+    if error:
+        return error
+    parts = [concurrent.run(_trend_series, plan)]
+    if plan.compacted:
+        parts.append(concurrent.run(_rollup_buckets, plan))
+    if plan.archive is not None:
+        parts.append(concurrent.run(_archive_buckets, plan))
+    series, *older = await asyncio.gather(*parts)
+    data, readings = _trend_data(series, older)
+    timing.note('rows', readings)
+    return concurrent.json_response({'series': data}, headers=plan.headers())
+
+
+def _alerts_setup(request):
+    plan = planner.plan(request, 'samples')
+    return (plan, *_alert_mode(request, plan))
+
+
+async def alerts_report(request):
+    """Async `AlertsReportView`: in events mode the counts come first and the episode list is
+    streamed a chunk at a time, as the sync view does."""
+    setup, error = await _plan_or_error(_alerts_setup, request)
+    if error:
+        return error
+    plan, use_events, threshold_cfg = setup
+    if use_events:
+        events = _alert_events(plan.window)
+        counts = await concurrent.run(_alert_event_counts, events)
+        head = {'mode': 'events', 'thresholds': threshold_cfg, 'counts': counts}
+        rows = _alert_event_rows(events).iterator(chunk_size=settings.JSON_STREAM_CHUNK_ROWS)
+        return stream_json_object(request, head, 'alerts', rows, _alert_event_dicts, headers=plan.headers(['events']))
+    data, readings = await concurrent.run(_alert_scan, plan, threshold_cfg)
+    if readings is not None:
+        timing.note('rows', readings)
+    return concurrent.json_response(data, headers=plan.headers())
+
+
+async def projection_report(request):
+    """Async `ProjectionReportView`: a single query, run off the event loop."""
+    setup, error = await _plan_or_error(_projection_plan, request)
+    if error:
+        return error
+    plan, hours, points = setup
+    data, code, readings = await concurrent.run(_projection, plan, hours, points)
+    timing.note('rows', readings)
+    return concurrent.json_response(data, status=code, headers=plan.headers())
+
+
+async def infrastructure_report(request):
+    """Async `InfrastructureReportView`: the station list and the last-measurement query run concurrently."""
+    try:
+        stations, lasts = await asyncio.gather(
+            concurrent.run(_infrastructure_stations), concurrent.run(_last_measurements),
+        )
+        return concurrent.json_response(
+            {'stations': [_infrastructure_row(s, lasts.get(s.get('station_id'))) for s in stations]}
+        )
+    except Exception as exc:
+        return concurrent.json_response({'error': str(exc)}, status=500)
@@ -1,9 +1,14 @@
 from django.contrib import admin
-from .models import Sensor
+from .models import CalibrationCorrection, Sensor
 
 
 @admin.register(Sensor)
 class SensorAdmin(admin.ModelAdmin):
     list_display = ('sensor_id', 's_type', 'installment_date', 's_state', 'station', 'last_calibration_date')
     search_fields = ('s_type',)
-    list_filter = ('s_state', 'station')
\ No newline at end of file
+    list_filter = ('s_state', 'station')
+
+@admin.register(CalibrationCorrection)
+class CalibrationCorrectionAdmin(admin.ModelAdmin):
+    list_display = ('correction_id', 'sensor', 'variable', 'valid_from', 'valid_to', 'gain', 'value_offset', 'created_at', 'revoked_at')
+    list_filter = ('sensor', 'variable')
@@ -4,4 +4,22 @@ from django.apps import AppConfig
 class SensorsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sensors'
-    verbose_name = 'Sensores'
\ No newline at end of file
+    verbose_name = 'Sensores'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .calibration import reevaluate_alerts, registry
+        from .models import CalibrationCorrection, Sensor
+
+        def invalidate_calibration(sender, **kwargs):
+            registry.invalidate()
+
+        def correction_changed(sender, instance, raw=False, **kwargs):
+            if not raw:
+                reevaluate_alerts(instance.sensor_id, instance.variable_id, instance.valid_from, instance.valid_to)
+
+        for model in (CalibrationCorrection, Sensor):
+            post_save.connect(invalidate_calibration, sender=model, dispatch_uid=f'sensors.calibration.save.{model.__name__}')
+            post_delete.connect(invalidate_calibration, sender=model, dispatch_uid=f'sensors.calibration.delete.{model.__name__}')
+        post_save.connect(correction_changed, sender=CalibrationCorrection, dispatch_uid='sensors.calibration.alerts.save')
+        post_delete.connect(correction_changed, sender=CalibrationCorrection, dispatch_uid='sensors.calibration.alerts.delete')
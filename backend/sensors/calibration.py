@@ -0,0 +1,167 @@
+"""Calibration corrections applied when measurements are read.
+
+A `CalibrationCorrection` says that the readings of a sensor (optionally of one
+variable) between `valid_from` and `valid_to` should read `gain * value +
+value_offset`. Raw rows in `measurement` are never rewritten, so adding, replacing
+or revoking a correction takes effect at once and can be undone. When several
+corrections cover a reading, the newest one wins.
+
+`registry` keeps the active corrections in memory (there are few of them) and
+applies them on every read path the reports use:
+
+- SQL: `corrected()` is a `CASE` over the corrections, used in place of `m_value`
+  inside aggregates; with no corrections it is plain `m_value`
+- rollups: `corrected('value_sum', 'bucket', samples='samples')` and friends; a
+  bucket is corrected when its start lies in the correction's range
+- single rows (measurement API): `value_for()`
+- NumPy (series cache, columnar archive): `correct()` computes gain and offset
+  arrays per sensor series and corrects the values in one vectorized step
+
+Every path matches a correction on its sensor, so a station with several sensors
+for a variable gets the same values from every storage tier.
+
+Saving or deleting a correction invalidates the registry (see `SensorsConfig.ready`);
+other workers pick up changes after `CALIBRATION_TTL` seconds. Alert episodes are
+classified on corrected values, so `reevaluate_alerts` rebuilds the ones a created
+or revoked correction covers.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Q, Value, When
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def _epoch(dt):
+    return math.inf if dt is None else dt.timestamp()
+
+
+class CalibrationRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (corrections newest first, {(sensor_id, variable_id or None): [rules oldest first]},
+        #  {sensor_id: [corrections newest first]})
+        self._state = None
+        self._loaded_at = 0.0
+
+    def _load(self):
+        ttl = getattr(settings, 'CALIBRATION_TTL', 60)
+        if self._state is not None and time.monotonic() - self._loaded_at < ttl:
+            return self._state
+        with self._lock:
+            if self._state is not None and time.monotonic() - self._loaded_at < ttl:
+                return self._state
+            from .models import CalibrationCorrection
+
+            corrections = list(
+                CalibrationCorrection.objects.filter(revoked_at__isnull=True)
+                .values('correction_id', 'sensor_id', 'variable_id', 'valid_from', 'valid_to', 'gain', 'value_offset')
+                .order_by('-correction_id')
+            )
+            self._state = self.index(corrections)
+            self._loaded_at = time.monotonic()
+            return self._state
+
+    @staticmethod
+    def index(corrections):
+        """Registry state for `corrections` (dicts of correction rows, newest first)."""
+        by_series, by_sensor = {}, {}
+        for c in corrections:
+            by_sensor.setdefault(c['sensor_id'], []).append(c)
+        for c in reversed(corrections):
+            by_series.setdefault((c['sensor_id'], c['variable_id']), []).append((
+                c['correction_id'], _epoch(c['valid_from']), _epoch(c['valid_to']), c['gain'], c['value_offset'],
+            ))
+        return corrections, by_series, by_sensor
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def corrected(self, value='m_value', date='m_date', samples=None):
+        """Expression for the corrected `value` column of measurement or rollup rows.
+
+        `date` is the row's time column; for sums over rollups pass `samples` so the
+        offset is added once per aggregated reading.
+        """
+        corrections = self._load()[0]
+        if not corrections:
+            return F(value)
+        whens = []
+        for c in corrections:
+            cond = Q(sensor_id=c['sensor_id'], **{f'{date}__gte': c['valid_from']})
+            if c['valid_to'] is not None:
+                cond &= Q(**{f'{date}__lt': c['valid_to']})
+            if c['variable_id'] is not None:
+                cond &= Q(variable_id=c['variable_id'])
+            offset = Value(c['value_offset']) if samples is None else Value(c['value_offset']) * F(samples)
+            whens.append(When(cond, then=ExpressionWrapper(F(value) * Value(c['gain']) + offset, output_field=FloatField())))
+        return Case(*whens, default=F(value), output_field=FloatField())
+
+    def value_for(self, sensor_id, variable_id, when, value):
+        """Corrected value of a single reading (`when` is its aware datetime)."""
+        for c in self._load()[2].get(sensor_id, ()):
+            if c['variable_id'] not in (None, variable_id) or when < c['valid_from']:
+                continue
+            if c['valid_to'] is None or when < c['valid_to']:
+                return float(value) * c['gain'] + c['value_offset']
+        return value
+
+    def correct(self, sensor_id, variable_id, ts, values):
+        """Corrected copy of one sensor's series `values` (epoch-second `ts`), or `values` itself if untouched."""
+        by_series = self._load()[1]
+        rules = by_series.get((sensor_id, variable_id), []) + by_series.get((sensor_id, None), [])
+        if not rules or not len(ts):
+            return values
+        first, last = ts[0], ts[-1]
+        rules = [r for r in rules if r[1] <= last and r[2] > first]
+        if not rules:
+            return values
+        gain = np.ones(len(values))
+        offset = np.zeros(len(values))
+        # oldest first, so the newest correction covering a reading is written last
+        for _id, start, end, g, o in sorted(rules):
+            mask = (ts >= start) & (ts < end)
+            gain[mask] = g
+            offset[mask] = o
+        return values * gain + offset
+
+
+registry = CalibrationRegistry()
+
+
+def _reevaluate(sensor_id, variable_id, valid_from, valid_to):
+    from reports.alerting import reevaluate
+
+    try:
+        reevaluate(sensor_id, valid_from, valid_to, variable_id=variable_id)
+    except Exception:
+        logger.exception('Alert re-evaluation failed for the corrections of sensor %s', sensor_id)
+    finally:
+        connection.close()
+
+
+def reevaluate_alerts(sensor_id, variable_id, valid_from, valid_to):
+    """Rebuild the alert episodes over a correction's range once the transaction commits.
+
+    Runs in a background thread: a correction can cover months of readings.
+    """
+    def start():
+        registry.invalidate()
+        threading.Thread(
+            target=_reevaluate, args=(sensor_id, variable_id, valid_from, valid_to),
+            name='calibration-alerts', daemon=True,
+        ).start()
+
+    transaction.on_commit(start)
@@ -0,0 +1,191 @@
+"""Calibration drift of sensors measured against co-located neighbours.
+
+`python manage.py check_sensor_drift` (run nightly) loads the hourly means of every
+sensor/variable series over the last `DRIFT_WINDOW_DAYS` days in one query and lays
+them out as a NumPy matrix (series x hours). Each series is paired with the same
+variable at up to `DRIFT_NEIGHBOURS` of the nearest other stations (from the station
+KD-tree, within `DRIFT_RADIUS_KM`), and for every pair at once:
+
+- the hourly difference target - neighbour is averaged per day (days with fewer than
+  `DRIFT_MIN_HOURS` overlapping hours are left out)
+- a least-squares line through the daily biases gives the bias trend per day
+- the trend over the whole window, relative to the neighbour's mean level, is the
+  pair's relative drift
+
+A sensor's result is the median over its pairs. It is flagged when the relative drift
+passes `DRIFT_RELATIVE_LIMIT` and at least `DRIFT_MIN_PAIRS` pairs were usable: with
+three pairs or more one faulty neighbour cannot move the median, while with two the
+median is their mean. Hours before the sensor's `last_calibration_date` are ignored.
+Results replace the `sensor_drift` rows of the previous run.
+"""
+from datetime import timedelta, timezone as dt_timezone
+import logging
+import warnings
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Sensor, SensorDrift
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+HOURLY_SQL = """
+    SELECT m.sensor_id, s.station_id, m.variable_id,
+           (extract(epoch FROM date_trunc('hour', m.m_date)) / 3600)::bigint, AVG(m.m_value)::float8
+      FROM measurement m
+      JOIN sensor s ON s.sensor_id = m.sensor_id
+     WHERE m.m_date >= %s AND m.m_date < %s
+     GROUP BY 1, 2, 3, 4
+"""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _load(start, end):
+    """(keys [(sensor_id, station_id, variable_id)], matrix of hourly means with NaN gaps)."""
+    with connection.cursor() as cur:
+        cur.execute(HOURLY_SQL, [start, end])
+        rows = cur.fetchall()
+    hours = int((end - start).total_seconds() // 3600)
+    if not rows:
+        return [], np.empty((0, hours))
+    data = np.asarray(rows, dtype=np.float64)
+    keys, series = np.unique(data[:, :3].astype(np.int64), axis=0, return_inverse=True)
+    hour = data[:, 3].astype(np.int64) - int(start.timestamp()) // 3600
+    matrix = np.full((len(keys), hours), np.nan)
+    matrix[series.ravel(), hour] = data[:, 4]
+    return [tuple(int(v) for v in key) for key in keys], matrix
+
+
+def _neighbours(keys):
+    """(series x DRIFT_NEIGHBOURS) matrix of neighbour series indices, -1 where there are none."""
+    from stations.nearest import station_index
+
+    limit = _setting('DRIFT_NEIGHBOURS', 3)
+    by_station = {}
+    for i, (_sensor, station, variable) in enumerate(keys):
+        by_station.setdefault((station, variable), i)
+    out = np.full((len(keys), limit), -1, dtype=np.int64)
+    candidates = {}
+    for i, (_sensor, station, variable) in enumerate(keys):
+        if station not in candidates:
+            row = station_index.get(station)
+            hits = [] if row is None else station_index.nearest(
+                row['latitude'], row['longitude'],
+                _setting('DRIFT_CANDIDATES', 15), _setting('DRIFT_RADIUS_KM', 25),
+            )
+            candidates[station] = [hit['station_id'] for hit, _km in hits if hit['station_id'] != station]
+        found = [by_station[(s, variable)] for s in candidates[station] if (s, variable) in by_station][:limit]
+        out[i, :len(found)] = found
+    return out
+
+
+def compare(matrix, neighbours, days):
+    """Bias trend of every series against its neighbours; all arrays are per series.
+
+    `matrix` holds `days * 24` hourly means per series; `neighbours` indexes its rows.
+    Returns (pairs, bias, slope, level, relative): the number of usable pairs, the
+    mean bias over the last `DRIFT_RECENT_DAYS`, the bias trend per day, the
+    neighbours' mean level and the relative drift over the window (NaN when unknown).
+    """
+    n, k = neighbours.shape
+    target = np.broadcast_to(matrix[:, None, :], (n, k, matrix.shape[1]))
+    other = np.where((neighbours >= 0)[:, :, None], matrix[np.maximum(neighbours, 0)], np.nan)
+    diff = (target - other).reshape(n, k, days, 24)
+
+    valid = ~np.isnan(diff)
+    count = valid.sum(axis=3)
+    # all-NaN rows (no overlap, no neighbour) are expected and come out as NaN
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        daily = np.where(count >= _setting('DRIFT_MIN_HOURS', 12), np.nansum(diff, axis=3) / count, np.nan)
+        level = np.nanmean(np.where(np.isnan(target), np.nan, other), axis=2)
+
+        # least squares per pair over the days with a bias, in closed form
+        x = np.arange(days, dtype=np.float64)
+        ok = ~np.isnan(daily)
+        m = ok.sum(axis=2)
+        y = np.where(ok, daily, 0.0)
+        xs = np.where(ok, x, 0.0)
+        sx, sy = xs.sum(axis=2), y.sum(axis=2)
+        sxx, sxy = (xs * xs).sum(axis=2), (xs * y).sum(axis=2)
+        slope = (m * sxy - sx * sy) / (m * sxx - sx * sx)
+        slope[m < _setting('DRIFT_MIN_DAYS', 7)] = np.nan
+
+        recent = daily[:, :, -_setting('DRIFT_RECENT_DAYS', 7):]
+        bias = np.nanmean(recent, axis=2)
+        relative = slope * days / np.abs(level)
+        relative[~np.isfinite(relative)] = np.nan
+
+        usable = ~np.isnan(relative)
+        pairs = usable.sum(axis=1)
+        pick = lambda a: np.nanmedian(np.where(usable, a, np.nan), axis=1)  # noqa: E731
+        return pairs, pick(bias), pick(slope), pick(level), pick(relative)
+
+
+def flagged(pairs, relative):
+    """Which series drift: enough usable pairs and a relative drift past the limit."""
+    with np.errstate(invalid='ignore'):
+        return (pairs >= _setting('DRIFT_MIN_PAIRS', 3)) & (np.abs(relative) > _setting('DRIFT_RELATIVE_LIMIT', 0.1))
+
+
+def _none(value):
+    return None if np.isnan(value) else float(value)
+
+
+def run(now=None, log=None):
+    """Compare every series with its neighbours and replace `sensor_drift`; returns a summary dict."""
+    if np is None:
+        raise RuntimeError('numpy is required for sensor drift checks')
+    now = now or timezone.now()
+    days = _setting('DRIFT_WINDOW_DAYS', 30)
+    end = now.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    keys, matrix = _load(start, end)
+
+    # a recalibration resets the drift: only compare the sensor's readings after it
+    start_ts = start.timestamp()
+    calibrated = dict(Sensor.objects.filter(last_calibration_date__gt=start).values_list('sensor_id', 'last_calibration_date'))
+    for i, (sensor, _station, _variable) in enumerate(keys):
+        when = calibrated.get(sensor)
+        if when is not None:
+            if timezone.is_naive(when):
+                when = when.replace(tzinfo=dt_timezone.utc)
+            matrix[i, :int((when.timestamp() - start_ts) // 3600) + 1] = np.nan
+
+    neighbours = _neighbours(keys)
+    if keys:
+        pairs, bias, slope, level, relative = compare(matrix, neighbours, days)
+        drifting = flagged(pairs, relative)
+    results = []
+    for i, (sensor, _station, variable) in enumerate(keys):
+        if not pairs[i]:
+            continue
+        results.append(SensorDrift(
+            sensor_id=sensor, variable_id=variable, computed_at=now,
+            window_start=start, window_end=end, neighbours=int(pairs[i]),
+            bias=_none(bias[i]), slope_per_day=_none(slope[i]), level=_none(level[i]),
+            relative_drift=_none(relative[i]), flagged=bool(drifting[i]),
+        ))
+
+    with transaction.atomic():
+        SensorDrift.objects.all().delete()
+        SensorDrift.objects.bulk_create(results)
+
+    summary = {
+        'series': len(keys),
+        'compared': len(results),
+        'flagged': sum(1 for r in results if r.flagged),
+    }
+    if log:
+        log(f"Compared {summary['compared']} of {summary['series']} series with their neighbours; "
+            f"{summary['flagged']} drifting")
+    return summary
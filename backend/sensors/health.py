@@ -0,0 +1,304 @@
+"""Sensor health: flatline, spike and dropout detection over recent series.
+
+`python manage.py check_sensor_health` (run e.g. every few minutes from cron) reads, for
+every sensor/variable series, the readings after its `sensor_health.checked_until`
+checkpoint plus a few readings of context before it, and runs three checks on the
+NumPy arrays of each series:
+
+- flatline: the rolling standard deviation over `HEALTH_FLATLINE_SAMPLES` readings is
+  at most `HEALTH_FLATLINE_EPSILON` (the sensor is stuck at one value); runs at one of
+  `HEALTH_FLATLINE_ALLOWED_VALUES` (e.g. no rain) are normal
+- spike: Hampel filter; a reading is more than `HEALTH_SPIKE_SIGMAS` robust standard
+  deviations (1.4826 * MAD) away from the median of the `HEALTH_SPIKE_WINDOW` readings
+  before it
+- dropout: two readings are more than `HEALTH_DROPOUT_FACTOR` times the series'
+  median cadence apart, or the series has been silent that long
+
+Findings are stored as `sensor_health_event` rows (episodes still going on have no
+`ended_at`) and the current status of every series in `sensor_health`.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import SensorHealth, SensorHealthEvent
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+MAD_SCALE = 1.4826
+# worst first; the status of a sensor is the worst status of its series
+STATUS_ORDER = ('dropout', 'flatline', 'spike', 'ok')
+
+# Series with a checkpoint are read through measurement_sensor_date_idx from a few
+# readings before it (a silent sensor costs one index probe per partition); series
+# never scanned are bounded by `since`, which prunes partitions.
+LOAD_SQL = """
+    SELECT h.sensor_id, h.variable_id, extract(epoch FROM m.m_date)::bigint, m.m_value::float8
+      FROM sensor_health h
+     CROSS JOIN LATERAL (
+            SELECT m_date, m_value
+              FROM measurement
+             WHERE sensor_id = h.sensor_id AND variable_id = h.variable_id
+               AND m_date > h.checked_until - make_interval(secs => COALESCE(h.cadence_seconds, %s) * %s)
+           ) m
+     WHERE h.checked_until IS NOT NULL
+    UNION ALL
+    SELECT m.sensor_id, m.variable_id, extract(epoch FROM m.m_date)::bigint, m.m_value::float8
+      FROM measurement m
+     WHERE m.m_date >= %s
+       AND NOT EXISTS (
+            SELECT 1 FROM sensor_health h
+             WHERE h.sensor_id = m.sensor_id AND h.variable_id = m.variable_id AND h.checked_until IS NOT NULL
+           )
+     ORDER BY 1, 2, 3
+"""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _dt(ts):
+    return datetime.fromtimestamp(int(ts), dt_timezone.utc)
+
+
+def _ts(dt):
+    if dt is None:
+        return None
+    if timezone.is_naive(dt):
+        dt = dt.replace(tzinfo=dt_timezone.utc)
+    return int(dt.timestamp())
+
+
+def worst_status(statuses):
+    statuses = set(statuses)
+    for status in STATUS_ORDER:
+        if status in statuses:
+            return status
+    return 'unknown'
+
+
+def analyze(ts, values, checkpoint=None, cadence=None, now_ts=None):
+    """Run the three checks on one time-ordered series.
+
+    `ts` are epoch seconds; readings at or before `checkpoint` are context from the
+    previous scan and are not reported again. Returns a dict with `cadence`,
+    `spikes` [(ts, value, score)], `flat_runs` [(start_ts, end_ts or None if ongoing,
+    continues_context, value)], `gaps` [(last_ts_before, first_ts_after)] and
+    `silent_since` (ts of the last reading when the series is silent, else None).
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    new = ts > checkpoint if checkpoint is not None else np.ones(len(ts), dtype=bool)
+    diffs = np.diff(ts)
+    positive = diffs[diffs > 0]
+    if len(positive) >= 2:
+        cadence = float(np.median(positive))
+    out = {'cadence': cadence, 'spikes': [], 'flat_runs': [], 'gaps': [], 'silent_since': None}
+
+    k = _setting('HEALTH_SPIKE_WINDOW', 30)
+    if len(values) > k:
+        # windows[j] holds the k readings before values[j + k]
+        windows = sliding_window_view(values[:-1], k)
+        med = np.median(windows, axis=1)
+        mad = np.median(np.abs(windows - med[:, None]), axis=1) * MAD_SCALE
+        dev = np.abs(values[k:] - med)
+        score = np.divide(dev, mad, out=np.zeros_like(dev), where=mad > 0)
+        hits = np.flatnonzero((score > _setting('HEALTH_SPIKE_SIGMAS', 6.0)) & new[k:])
+        out['spikes'] = [(int(ts[j + k]), float(values[j + k]), float(score[j])) for j in hits]
+
+    n = _setting('HEALTH_FLATLINE_SAMPLES', 30)
+    if len(values) >= n:
+        flat = sliding_window_view(values, n).std(axis=1) <= _setting('HEALTH_FLATLINE_EPSILON', 1e-6)
+        edges = np.diff(np.concatenate(([0], flat.astype(np.int8), [0])))
+        last = len(flat) - 1
+        allowed = set(_setting('HEALTH_FLATLINE_ALLOWED_VALUES', (0,)))
+        for s, e in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1):
+            end_ts = int(ts[e + n - 1])
+            ongoing = e == last
+            if not ongoing and checkpoint is not None and end_ts <= checkpoint:
+                continue
+            if float(values[s]) in allowed:
+                continue
+            out['flat_runs'].append((int(ts[s]), None if ongoing else end_ts, bool(s == 0), float(values[s])))
+
+    if cadence:
+        limit = _setting('HEALTH_DROPOUT_FACTOR', 5) * cadence
+        for i in np.flatnonzero(diffs > limit):
+            if checkpoint is None or ts[i + 1] > checkpoint:
+                out['gaps'].append((int(ts[i]), int(ts[i + 1])))
+        if now_ts is not None and len(ts) and now_ts - ts[-1] > limit:
+            out['silent_since'] = int(ts[-1])
+    return out
+
+
+def _load(since, context):
+    """{(sensor_id, variable_id): (ts, values)} of the readings each series has to scan.
+
+    Series with a checkpoint are read from a few readings before it however old it
+    is; `since` only bounds series that were never scanned.
+    """
+    default_cadence = _setting('HEALTH_DEFAULT_CADENCE_SECONDS', 60)
+    with connection.cursor() as cur:
+        cur.execute(LOAD_SQL, [default_cadence, context, since])
+        rows = cur.fetchall()
+    if not rows:
+        return {}
+    data = np.asarray(rows, dtype=np.float64)
+    keys = data[:, :2].astype(np.int64)
+    ts = data[:, 2].astype(np.int64)
+    values = data[:, 3]
+    bounds = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+    series = {}
+    for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(rows)]))):
+        series[(int(keys[start, 0]), int(keys[start, 1]))] = (ts[start:end], values[start:end])
+    return series
+
+
+class _Series:
+    """Applies the findings of one series to its state row and events."""
+
+    def __init__(self, key, state, open_events, now):
+        self.key = key
+        self.state = state
+        self.open = open_events
+        self.now = now
+        self.created = []
+        self.closed = []
+
+    def _event(self, kind, start, end=None, value=None, score=None):
+        ev = SensorHealthEvent(
+            sensor_id=self.key[0], variable_id=self.key[1], kind=kind,
+            started_at=_dt(start), ended_at=_dt(end) if end is not None else None, value=value, score=score,
+        )
+        self.created.append(ev)
+        return ev
+
+    def _close(self, kind, end_ts):
+        ev = self.open.pop(kind, None)
+        if ev is not None:
+            ev.ended_at = _dt(end_ts)
+            self.closed.append(ev)
+
+    def apply(self, found, first_new):
+        state = self.state
+        for ts, value, score in found['spikes']:
+            self._event('spike', ts, ts, value, score)
+            state.last_spike_at = _dt(ts)
+
+        runs = found['flat_runs']
+        if 'flatline' in self.open and first_new is not None and not (runs and runs[0][2]):
+            self._close('flatline', first_new)
+        state.flatline_since = None
+        for start, end, continues, value in runs:
+            if continues and 'flatline' in self.open:
+                if end is None:
+                    state.flatline_since = self.open['flatline'].started_at
+                else:
+                    self._close('flatline', end)
+                continue
+            ev = self._event('flatline', start, end, value)
+            if end is None:
+                self.open['flatline'] = ev
+                state.flatline_since = ev.started_at
+
+        dropout = self.open.get('dropout')
+        if dropout is not None and first_new is not None:
+            self._close('dropout', first_new)
+        for start, end in found['gaps']:
+            if dropout is not None and _ts(dropout.started_at) == start:
+                continue
+            self._event('dropout', start, end)
+        self.silent(found['silent_since'])
+        if found['cadence']:
+            state.cadence_seconds = found['cadence']
+
+    def silent(self, since_ts):
+        if since_ts is not None and 'dropout' not in self.open:
+            self.open['dropout'] = self._event('dropout', since_ts)
+
+    def finish(self, checked_until):
+        state = self.state
+        state.checked_until = checked_until
+        state.updated_at = self.now
+        recent = self.now - timedelta(hours=_setting('HEALTH_SPIKE_RECENT_HOURS', 6))
+        if 'dropout' in self.open:
+            state.status = 'dropout'
+        elif state.flatline_since is not None:
+            state.status = 'flatline'
+        elif state.last_spike_at is not None and state.last_spike_at >= recent:
+            state.status = 'spike'
+        else:
+            state.status = 'ok'
+
+
+def run(now=None, log=None):
+    """Scan every series from its checkpoint; returns a summary dict."""
+    if np is None:
+        raise RuntimeError('numpy is required for sensor health checks')
+    now = now or timezone.now()
+    now_ts = _ts(now)
+    since = now - timedelta(hours=_setting('HEALTH_INITIAL_HOURS', 24))
+    context = max(_setting('HEALTH_SPIKE_WINDOW', 30), _setting('HEALTH_FLATLINE_SAMPLES', 30))
+    series = _load(since, context)
+    states = {(s.sensor_id, s.variable_id): s for s in SensorHealth.objects.all()}
+    open_events = {}
+    for ev in SensorHealthEvent.objects.filter(ended_at__isnull=True).order_by('started_at'):
+        open_events.setdefault((ev.sensor_id, ev.variable_id), {})[ev.kind] = ev
+
+    touched = []
+    for key in set(series) | set(states):
+        state = states.get(key) or SensorHealth(sensor_id=key[0], variable_id=key[1])
+        item = _Series(key, state, open_events.get(key, {}), now)
+        checkpoint = _ts(state.checked_until)
+        ts, values = series.get(key, (None, None))
+        fresh = ts is not None and (checkpoint is None or ts[-1] > checkpoint)
+        if fresh:
+            found = analyze(ts, values, checkpoint, state.cadence_seconds, now_ts)
+            first_new = ts[ts > checkpoint][0] if checkpoint is not None else ts[0]
+            item.apply(found, int(first_new))
+            item.finish(_dt(ts[-1]))
+        else:
+            # no new readings: the series can only have gone silent
+            cadence = state.cadence_seconds or _setting('HEALTH_DEFAULT_CADENCE_SECONDS', 60)
+            limit = _setting('HEALTH_DROPOUT_FACTOR', 5) * cadence
+            item.silent(checkpoint if now_ts - checkpoint > limit else None)
+            item.finish(state.checked_until)
+        touched.append(item)
+
+    created = [ev for item in touched for ev in item.created]
+    closed = [ev for item in touched for ev in item.closed if ev.pk is not None]
+    with transaction.atomic():
+        SensorHealthEvent.objects.bulk_create(created)
+        SensorHealthEvent.objects.bulk_update(closed, ['ended_at'])
+        SensorHealth.objects.bulk_create(
+            [item.state for item in touched],
+            update_conflicts=True,
+            unique_fields=['sensor', 'variable'],
+            update_fields=['status', 'checked_until', 'cadence_seconds', 'flatline_since', 'last_spike_at', 'updated_at'],
+        )
+        retention = _setting('HEALTH_EVENT_RETENTION_DAYS', 90)
+        pruned = 0
+        if retention:
+            pruned, _ = SensorHealthEvent.objects.filter(ended_at__lt=now - timedelta(days=retention)).delete()
+
+    summary = {
+        'series': len(touched),
+        'events': len(created),
+        'closed': len(closed),
+        'pruned': pruned,
+        'status': {s: sum(1 for item in touched if item.state.status == s) for s in STATUS_ORDER},
+    }
+    if log:
+        log(f"Scanned {summary['series']} series: {summary['events']} new events, {summary['closed']} closed, "
+            f"{summary['pruned']} pruned; status {summary['status']}")
+    return summary
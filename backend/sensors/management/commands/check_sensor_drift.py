@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sensors.drift import run
+
+
+class Command(BaseCommand):
+    help = 'Compare every sensor with the same variable at neighbouring stations and flag calibration drift (see sensors/drift.py).'
+
+    def handle(self, *args, **options):
+        summary = run(log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Flagged {summary['flagged']} drifting series"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from sensors.health import run
+
+
+class Command(BaseCommand):
+    help = 'Scan recent readings of every sensor for flatlines, spikes and dropouts (see sensors/health.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Forget every checkpoint and health event first.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            from sensors.models import SensorHealth, SensorHealthEvent
+
+            SensorHealthEvent.objects.all().delete()
+            SensorHealth.objects.all().delete()
+            self.stdout.write('Cleared sensor health state')
+        summary = run(log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Checked {summary['series']} series"))
@@ -16,4 +16,105 @@ class Sensor(models.Model):
         verbose_name_plural = _('Sensores')
 
     def __str__(self):
-        return f"{self.sensor_id} ({self.s_type})"
\ No newline at end of file
+        return f"{self.sensor_id} ({self.s_type})"
+
+class SensorHealth(models.Model):
+    """Current health of one sensor/variable series and the checkpoint of its last scan (see sensors/health.py)."""
+    STATUS_CHOICES = (
+        ('ok', 'OK'),
+        ('spike', 'Spike'),
+        ('flatline', 'Flatline'),
+        ('dropout', 'Dropout'),
+    )
+
+    pk = models.CompositePrimaryKey('sensor_id', 'variable_id')
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, db_column='sensor_id', verbose_name=_('Sensor'))
+    variable = models.ForeignKey('variables.Variable', on_delete=models.RESTRICT, db_column='variable_id', verbose_name=_('Variable'))
+    status = models.CharField(_('Estado'), max_length=20, choices=STATUS_CHOICES, default='ok')
+    checked_until = models.DateTimeField(_('Analizado hasta'))
+    cadence_seconds = models.FloatField(_('Cadencia (s)'), null=True, blank=True)
+    flatline_since = models.DateTimeField(_('Valor constante desde'), null=True, blank=True)
+    last_spike_at = models.DateTimeField(_('Último pico'), null=True, blank=True)
+    updated_at = models.DateTimeField(_('Actualizado'))
+
+    class Meta:
+        db_table = 'sensor_health'
+        verbose_name = _('Salud de sensor')
+        verbose_name_plural = _('Salud de sensores')
+
+
+class SensorHealthEvent(models.Model):
+    """A flatline or dropout episode, or a single spike; `ended_at` is NULL while an episode is ongoing."""
+    KIND_CHOICES = (
+        ('spike', 'Spike'),
+        ('flatline', 'Flatline'),
+        ('dropout', 'Dropout'),
+    )
+
+    event_id = models.BigAutoField(primary_key=True)
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, db_column='sensor_id', verbose_name=_('Sensor'))
+    variable = models.ForeignKey('variables.Variable', on_delete=models.RESTRICT, db_column='variable_id', verbose_name=_('Variable'))
+    kind = models.CharField(_('Tipo'), max_length=20, choices=KIND_CHOICES)
+    started_at = models.DateTimeField(_('Inicio'))
+    ended_at = models.DateTimeField(_('Fin'), null=True, blank=True)
+    value = models.FloatField(_('Valor'), null=True, blank=True)
+    score = models.FloatField(_('Puntaje'), null=True, blank=True)
+
+    class Meta:
+        db_table = 'sensor_health_event'
+        verbose_name = _('Evento de salud de sensor')
+        verbose_name_plural = _('Eventos de salud de sensores')
+        indexes = [
+            models.Index(fields=['sensor', '-started_at'], name='sensor_health_event_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.sensor_id}/{self.variable_id} {self.started_at}"
+
+
+class SensorDrift(models.Model):
+    """Bias trend of one sensor/variable series against neighbouring stations, from the last drift run (see sensors/drift.py)."""
+    pk = models.CompositePrimaryKey('sensor_id', 'variable_id')
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, db_column='sensor_id', verbose_name=_('Sensor'))
+    variable = models.ForeignKey('variables.Variable', on_delete=models.RESTRICT, db_column='variable_id', verbose_name=_('Variable'))
+    computed_at = models.DateTimeField(_('Calculado'))
+    window_start = models.DateTimeField(_('Inicio de ventana'))
+    window_end = models.DateTimeField(_('Fin de ventana'))
+    neighbours = models.IntegerField(_('Vecinos comparados'))
+    bias = models.FloatField(_('Sesgo reciente'), null=True, blank=True)
+    slope_per_day = models.FloatField(_('Tendencia del sesgo por día'), null=True, blank=True)
+    level = models.FloatField(_('Nivel de los vecinos'), null=True, blank=True)
+    relative_drift = models.FloatField(_('Deriva relativa'), null=True, blank=True)
+    flagged = models.BooleanField(_('Con deriva'), default=False)
+
+    class Meta:
+        db_table = 'sensor_drift'
+        verbose_name = _('Deriva de sensor')
+        verbose_name_plural = _('Derivas de sensores')
+
+
+class CalibrationCorrection(models.Model):
+    """Linear correction `gain * value + value_offset` of a sensor's readings in [valid_from, valid_to).
+
+    Applied at read time (see sensors/calibration.py); `measurement` keeps the raw values.
+    Rows are never edited: a newer correction covering the same readings wins, and
+    `revoked_at` retires one.
+    """
+    correction_id = models.BigAutoField(primary_key=True)
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, db_column='sensor_id', verbose_name=_('Sensor'))
+    variable = models.ForeignKey('variables.Variable', on_delete=models.RESTRICT, db_column='variable_id', null=True, blank=True, verbose_name=_('Variable'))
+    valid_from = models.DateTimeField(_('Válida desde'))
+    valid_to = models.DateTimeField(_('Válida hasta'), null=True, blank=True)
+    gain = models.FloatField(_('Ganancia'), default=1.0)
+    value_offset = models.FloatField(_('Desplazamiento'), default=0.0)
+    note = models.TextField(_('Nota'), blank=True, null=True)
+    created_at = models.DateTimeField(_('Creada'), auto_now_add=True)
+    revoked_at = models.DateTimeField(_('Revocada'), null=True, blank=True)
+
+    class Meta:
+        db_table = 'calibration_correction'
+        verbose_name = _('Corrección de calibración')
+        verbose_name_plural = _('Correcciones de calibración')
+
+    def __str__(self):
+        return f"{self.sensor_id}: x{self.gain} {self.value_offset:+} desde {self.valid_from}"
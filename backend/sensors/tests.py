@@ -0,0 +1,203 @@
+from datetime import datetime, timezone as dt_timezone
+import time
+
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+import numpy as np
+
+from users.tokens import ClaimsUser
+from . import drift, health, views
+from .calibration import CalibrationRegistry
+
+CADENCE = 60
+
+
+def series(values, start=0, cadence=CADENCE):
+    values = np.asarray(values, dtype=np.float64)
+    return start + cadence * np.arange(len(values), dtype=np.int64), values
+
+
+def noisy(n, seed=0):
+    return 20 + np.random.default_rng(seed).normal(0, 1, n)
+
+
+@override_settings(
+    HEALTH_SPIKE_WINDOW=10, HEALTH_SPIKE_SIGMAS=6.0, HEALTH_FLATLINE_SAMPLES=5,
+    HEALTH_FLATLINE_EPSILON=1e-6, HEALTH_FLATLINE_ALLOWED_VALUES=(0,), HEALTH_DROPOUT_FACTOR=5,
+)
+class AnalyzeTests(SimpleTestCase):
+    def test_clean_series_has_no_findings(self):
+        found = health.analyze(*series(noisy(100)))
+        self.assertEqual(found['cadence'], CADENCE)
+        self.assertEqual((found['spikes'], found['flat_runs'], found['gaps'], found['silent_since']), ([], [], [], None))
+
+    def test_spike_is_reported_once_past_the_checkpoint(self):
+        values = noisy(60)
+        values[40] = 80.0
+        ts, values = series(values)
+        spikes = health.analyze(ts, values)['spikes']
+        self.assertEqual([(t, v) for t, v, _score in spikes], [(int(ts[40]), 80.0)])
+        self.assertGreater(spikes[0][2], 6.0)
+        self.assertEqual(health.analyze(ts, values, checkpoint=int(ts[45]))['spikes'], [])
+
+    def test_flatline_run_and_allowed_values(self):
+        values = noisy(50)
+        values[20:30] = 7.5
+        ts, values = series(values)
+        self.assertEqual(health.analyze(ts, values)['flat_runs'], [(int(ts[20]), int(ts[29]), False, 7.5)])
+        values[20:30] = 0.0
+        self.assertEqual(health.analyze(ts, values)['flat_runs'], [])
+
+    def test_flatline_reaching_the_end_is_ongoing(self):
+        values = noisy(30)
+        values[22:] = 3.0
+        ts, values = series(values)
+        self.assertEqual(health.analyze(ts, values)['flat_runs'], [(int(ts[22]), None, False, 3.0)])
+
+    def test_dropout_gap_and_silence(self):
+        ts, values = series(noisy(40))
+        ts[20:] += 10 * CADENCE
+        found = health.analyze(ts, values, now_ts=int(ts[-1]) + 6 * CADENCE)
+        self.assertEqual(found['gaps'], [(int(ts[19]), int(ts[20]))])
+        self.assertEqual(found['silent_since'], int(ts[-1]))
+        self.assertEqual(health.analyze(ts, values, checkpoint=int(ts[25]))['gaps'], [])
+
+    def test_worst_status(self):
+        self.assertEqual(health.worst_status(['ok', 'spike', 'flatline']), 'flatline')
+        self.assertEqual(health.worst_status([]), 'unknown')
+
+
+DAYS = 10
+
+
+def hourly(level=50.0, trend=0.0, offset=0.0):
+    """`DAYS` days of hourly means with a diurnal cycle and a linear trend over the window."""
+    h = np.arange(DAYS * 24)
+    return level + 10 * np.sin(h / 5) + offset + trend * h / len(h)
+
+
+@override_settings(DRIFT_MIN_HOURS=12, DRIFT_MIN_DAYS=7, DRIFT_RECENT_DAYS=3,
+                   DRIFT_RELATIVE_LIMIT=0.1, DRIFT_MIN_PAIRS=3)
+class DriftCompareTests(SimpleTestCase):
+    def test_drifting_sensor_is_flagged_against_three_neighbours(self):
+        matrix = np.vstack([hourly(trend=20), hourly(), hourly(offset=1), hourly(offset=-1)])
+        neighbours = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])
+        pairs, bias, slope, level, relative = drift.compare(matrix, neighbours, DAYS)
+        self.assertEqual(pairs.tolist(), [3, 3, 3, 3])
+        self.assertAlmostEqual(relative[0], 0.4, places=2)
+        self.assertAlmostEqual(slope[0], 2.0, places=2)
+        self.assertAlmostEqual(level[0], 50.0, delta=1.5)
+        self.assertEqual(drift.flagged(pairs, relative).tolist(), [True, False, False, False])
+
+    def test_one_faulty_neighbour_does_not_flag_a_sensor(self):
+        matrix = np.vstack([hourly(), hourly(trend=20), hourly(offset=1), hourly(offset=-1)])
+        neighbours = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])
+        pairs, _bias, _slope, _level, relative = drift.compare(matrix, neighbours, DAYS)
+        self.assertAlmostEqual(relative[0], 0.0, places=6)
+        self.assertEqual(drift.flagged(pairs, relative).tolist(), [False, True, False, False])
+
+    def test_two_pairs_are_not_enough_to_flag(self):
+        matrix = np.vstack([hourly(), hourly(trend=20), hourly(offset=1)])
+        neighbours = np.array([[1, 2, -1], [0, 2, -1], [0, 1, -1]])
+        pairs, _bias, _slope, _level, relative = drift.compare(matrix, neighbours, DAYS)
+        self.assertEqual(pairs.tolist(), [2, 2, 2])
+        self.assertGreater(abs(relative[0]), 0.1)
+        self.assertFalse(drift.flagged(pairs, relative).any())
+
+    def test_days_without_overlap_and_missing_neighbours_are_skipped(self):
+        target = hourly(trend=20)
+        target[:5 * 24] = np.nan
+        matrix = np.vstack([target, hourly(), hourly(offset=1)])
+        neighbours = np.array([[1, 2, -1], [-1, -1, -1], [-1, -1, -1]])
+        pairs, bias, _slope, _level, relative = drift.compare(matrix, neighbours, DAYS)
+        # five days of overlap are fewer than DRIFT_MIN_DAYS: no pair is usable
+        self.assertEqual(pairs.tolist(), [0, 0, 0])
+        self.assertTrue(np.isnan(relative).all())
+        self.assertTrue(np.isnan(bias).all())
+
+
+def instant(day):
+    return datetime(2026, 1, day, tzinfo=dt_timezone.utc)
+
+
+def correction(correction_id, sensor_id, variable_id, valid_from, valid_to, gain, value_offset):
+    return {
+        'correction_id': correction_id, 'sensor_id': sensor_id, 'variable_id': variable_id,
+        'valid_from': valid_from, 'valid_to': valid_to, 'gain': gain, 'value_offset': value_offset,
+    }
+
+
+@override_settings(CALIBRATION_TTL=3600)
+class CalibrationCorrectTests(SimpleTestCase):
+    def registry(self, *corrections):
+        registry = CalibrationRegistry()
+        registry._state = registry.index(sorted(corrections, key=lambda c: -c['correction_id']))
+        registry._loaded_at = time.monotonic()
+        return registry
+
+    def readings(self, *days):
+        return np.array([int(instant(d).timestamp()) for d in days]), np.full(len(days), 10.0)
+
+    def test_correction_applies_inside_its_validity(self):
+        registry = self.registry(correction(1, 5, 7, instant(2), instant(4), 2.0, 1.0))
+        ts, values = self.readings(1, 2, 3, 4)
+        self.assertEqual(registry.correct(5, 7, ts, values).tolist(), [10.0, 21.0, 21.0, 10.0])
+
+    def test_corrections_are_matched_by_sensor_and_variable(self):
+        registry = self.registry(correction(1, 5, 7, instant(1), None, 2.0, 0.0))
+        ts, values = self.readings(2, 3)
+        # same station, other sensor: untouched, and the very same array is returned
+        self.assertIs(registry.correct(6, 7, ts, values), values)
+        self.assertIs(registry.correct(5, 8, ts, values), values)
+        self.assertEqual(registry.correct(5, 7, ts, values).tolist(), [20.0, 20.0])
+
+    def test_sensor_wide_correction_covers_every_variable(self):
+        registry = self.registry(correction(1, 5, None, instant(1), None, 1.0, -2.0))
+        ts, values = self.readings(2)
+        self.assertEqual(registry.correct(5, 9, ts, values).tolist(), [8.0])
+
+    def test_newest_correction_wins_where_they_overlap(self):
+        registry = self.registry(
+            correction(1, 5, None, instant(1), None, 2.0, 0.0),
+            correction(2, 5, 7, instant(3), None, 1.0, 5.0),
+        )
+        ts, values = self.readings(2, 3, 4)
+        self.assertEqual(registry.correct(5, 7, ts, values).tolist(), [20.0, 15.0, 15.0])
+
+    def test_series_matches_single_reading_correction(self):
+        registry = self.registry(
+            correction(1, 5, None, instant(1), instant(5), 1.5, 0.5),
+            correction(2, 5, 7, instant(3), None, 0.5, 0.0),
+        )
+        ts, values = self.readings(1, 2, 3, 4, 5, 6)
+        expected = [registry.value_for(5, 7, instant(d), 10.0) for d in (1, 2, 3, 4, 5, 6)]
+        self.assertEqual(registry.correct(5, 7, ts, values).tolist(), expected)
+
+
+class WriteScopeTests(SimpleTestCase):
+    """`_write_denied` guards the calibration writes of sensor 1, placed at station 5 of institution 3."""
+
+    def denied(self, claims):
+        sensors = mock.Mock()
+        sensors.objects.filter.return_value.values.return_value.first.return_value = {
+            'station_id': 5, 'station__institution_id': 3,
+        }
+        request = mock.Mock(user=ClaimsUser({'user_id': 1, **claims}) if claims is not None else None)
+        with mock.patch.object(views, 'Sensor', sensors):
+            response = views._write_denied(request, 1)
+        return response and response.status_code
+
+    def test_requires_a_token(self):
+        self.assertEqual(self.denied(None), 401)
+
+    def test_admins_of_other_stations_and_institutions_are_forbidden(self):
+        self.assertEqual(self.denied({'u_type': 'station_admin', 'stations': [6]}), 403)
+        self.assertEqual(self.denied({'u_type': 'admin', 'institutions': [4]}), 403)
+        self.assertEqual(self.denied({'u_type': 'regular'}), 403)
+
+    def test_station_institution_and_super_admins_may_write(self):
+        self.assertIsNone(self.denied({'u_type': 'station_admin', 'stations': [5]}))
+        self.assertIsNone(self.denied({'u_type': 'admin', 'institutions': [3]}))
+        self.assertIsNone(self.denied({'u_type': 'super_admin'}))
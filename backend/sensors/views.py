@@ -1,8 +1,134 @@
-from rest_framework import viewsets
-from .models import Sensor
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from users.tokens import claims_user
+from variables.catalog import catalog as variable_catalog
+from .calibration import reevaluate_alerts, registry as calibration
+from .health import worst_status
+from .models import CalibrationCorrection, Sensor, SensorHealth, SensorHealthEvent
 from .serializers import SensorSerializer
 
 
+CORRECTION_FIELDS = (
+    'correction_id', 'variable_id', 'valid_from', 'valid_to', 'gain', 'value_offset', 'note', 'created_at', 'revoked_at',
+)
+
+
+def _parse_instant(value):
+    if not value:
+        return None
+    dt = parse_datetime(str(value))
+    if dt is None:
+        raise ValueError(f'fecha inválida: {value}')
+    return timezone.make_aware(dt, dt_timezone.utc) if timezone.is_naive(dt) else dt
+
+
+def _write_denied(request, pk):
+    """Error response unless the bearer token's user administers the sensor's station."""
+    user = claims_user(request)
+    if user is None:
+        return Response({'error': 'Se requiere un token de acceso'}, status=status.HTTP_401_UNAUTHORIZED)
+    sensor = Sensor.objects.filter(pk=pk).values('station_id', 'station__institution_id').first()
+    if sensor and not user.manages_station(sensor['station_id'], sensor['station__institution_id']):
+        return Response({'error': 'No administra la estación de este sensor'}, status=status.HTTP_403_FORBIDDEN)
+    return None
+
+
 class SensorViewSet(viewsets.ModelViewSet):
     queryset = Sensor.objects.all()
-    serializer_class = SensorSerializer
\ No newline at end of file
+    serializer_class = SensorSerializer
+
+    @action(detail=True, methods=['get'])
+    def health(self, request, pk=None):
+        """Health of the sensor's series from the last `check_sensor_health` scan.
+        Returns the worst status over its variables, the state of each series and the
+        flatline/spike/dropout events of the last `HEALTH_EVENT_DAYS` days plus any still open.
+        """
+        sensor = Sensor.objects.filter(pk=pk).values('sensor_id', 's_type', 's_state', 'station_id').first()
+        if not sensor:
+            return Response({'error': 'Sensor no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        series = []
+        for row in SensorHealth.objects.filter(sensor_id=pk).order_by('variable_id').values(
+            'variable_id', 'status', 'checked_until', 'cadence_seconds', 'flatline_since', 'last_spike_at', 'updated_at',
+        ):
+            variable = variable_catalog.get(row['variable_id']) or {}
+            row['variable'] = variable.get('v_name')
+            row['unit'] = variable.get('v_unit')
+            series.append(row)
+        since = timezone.now() - timedelta(days=getattr(settings, 'HEALTH_EVENT_DAYS', 7))
+        events = list(
+            SensorHealthEvent.objects.filter(sensor_id=pk)
+            .filter(Q(started_at__gte=since) | Q(ended_at__isnull=True))
+            .order_by('-started_at')
+            .values('event_id', 'variable_id', 'kind', 'started_at', 'ended_at', 'value', 'score')[:200]
+        )
+        return Response({
+            **sensor,
+            'status': worst_status(s['status'] for s in series),
+            'series': series,
+            'events': events,
+        })
+
+    @action(detail=True, methods=['get', 'post'])
+    def calibrations(self, request, pk=None):
+        """List the sensor's calibration corrections (newest first), or add one.
+        Payload: { "valid_from": "...", "valid_to": null, "gain": 1.02, "value_offset": -0.4,
+        "variable": <id, optional>, "note": "..." }. Raw measurements are not touched;
+        reports apply the correction from the next request on (see sensors/calibration.py)
+        and the alert episodes it covers are rebuilt in the background.
+        Adding one needs a bearer token of an administrator of the sensor's station.
+        """
+        if not Sensor.objects.filter(pk=pk).exists():
+            return Response({'error': 'Sensor no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        if request.method == 'GET':
+            rows = CalibrationCorrection.objects.filter(sensor_id=pk).order_by('-correction_id').values(*CORRECTION_FIELDS)
+            return Response({'sensor_id': int(pk), 'corrections': list(rows)})
+        denied = _write_denied(request, pk)
+        if denied:
+            return denied
+
+        data = request.data
+        try:
+            valid_from = _parse_instant(data.get('valid_from'))
+            valid_to = _parse_instant(data.get('valid_to'))
+            gain = float(data.get('gain', 1.0))
+            value_offset = float(data.get('value_offset', 0.0))
+            variable_id = int(data['variable']) if data.get('variable') not in (None, '') else None
+        except (TypeError, ValueError) as ex:
+            return Response({'error': 'Corrección inválida', 'detail': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        if valid_from is None:
+            return Response({'error': 'valid_from es obligatorio'}, status=status.HTTP_400_BAD_REQUEST)
+        if valid_to is not None and valid_to <= valid_from:
+            return Response({'error': 'valid_to debe ser posterior a valid_from'}, status=status.HTTP_400_BAD_REQUEST)
+        if gain <= 0:
+            return Response({'error': 'gain debe ser positiva'}, status=status.HTTP_400_BAD_REQUEST)
+        if variable_id is not None and variable_catalog.get(variable_id) is None:
+            return Response({'error': 'Variable no encontrada'}, status=status.HTTP_400_BAD_REQUEST)
+        correction = CalibrationCorrection.objects.create(
+            sensor_id=pk, variable_id=variable_id, valid_from=valid_from, valid_to=valid_to,
+            gain=gain, value_offset=value_offset, note=data.get('note') or None,
+        )
+        row = CalibrationCorrection.objects.filter(pk=correction.pk).values(*CORRECTION_FIELDS).first()
+        return Response(row, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path=r'calibrations/(?P<correction_id>\d+)/revoke')
+    def revoke_calibration(self, request, pk=None, correction_id=None):
+        """Retire a correction; readings it covered go back to older corrections or raw values."""
+        denied = _write_denied(request, pk)
+        if denied:
+            return denied
+        corrections = CalibrationCorrection.objects.filter(pk=correction_id, sensor_id=pk, revoked_at__isnull=True)
+        revoked = corrections.values('variable_id', 'valid_from', 'valid_to').first()
+        if not revoked or not corrections.update(revoked_at=timezone.now()):
+            return Response({'error': 'Corrección no encontrada o ya revocada'}, status=status.HTTP_404_NOT_FOUND)
+        # QuerySet.update() sends no signals
+        calibration.invalidate()
+        reevaluate_alerts(int(pk), revoked['variable_id'], revoked['valid_from'], revoked['valid_to'])
+        return Response({'message': 'Corrección revocada', 'correction_id': int(correction_id)})
@@ -4,4 +4,15 @@ from django.apps import AppConfig
 class StationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stations'
-    verbose_name = 'Estaciones'
\ No newline at end of file
+    verbose_name = 'Estaciones'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .models import Station
+        from .nearest import station_index
+
+        def invalidate_index(sender, **kwargs):
+            station_index.invalidate()
+
+        post_save.connect(invalidate_index, sender=Station, dispatch_uid='stations.nearest.save')
+        post_delete.connect(invalidate_index, sender=Station, dispatch_uid='stations.nearest.delete')
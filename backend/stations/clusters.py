@@ -0,0 +1,63 @@
+"""Hierarchical geohash grid for clustering stations on the map.
+
+A cell of geohash precision p contains the cells of precision p + 1 that share its
+prefix, so the grid is a tree: a query walks down from the precision-1 cells, skips
+every cell outside the bounding box and stops at the precision that matches the map
+zoom. Payloads are bounded by the cells on screen, not by the number of stations.
+
+`station_index` (stations/nearest.py) builds the grid together with its KD-tree, so
+both are refreshed by the same invalidation.
+"""
+from .geo import geohash_bounds, geohash_encode
+
+MAX_PRECISION = 7
+# geohash precision per web-map zoom level: about 4-8 cells across a 256px tile
+ZOOM_PRECISION = (1, 1, 1, 2, 2, 3, 3, 3, 4, 4, 5, 5, 5, 6, 6)
+
+
+def precision_for_zoom(zoom):
+    zoom = max(0, int(zoom))
+    return ZOOM_PRECISION[zoom] if zoom < len(ZOOM_PRECISION) else MAX_PRECISION
+
+
+def _intersects(bounds, bbox):
+    min_lat, min_lon, max_lat, max_lon = bounds
+    return not (max_lat < bbox[0] or min_lat > bbox[2] or max_lon < bbox[1] or min_lon > bbox[3])
+
+
+class ClusterGrid:
+    def __init__(self, rows):
+        self.rows = rows
+        # prefix -> row indices of its stations; '' is the root
+        self.members = {'': list(range(len(rows)))}
+        self.children = {}
+        self._bounds = {}
+        for i, row in enumerate(rows):
+            cell = row.get('geohash') or geohash_encode(row['latitude'], row['longitude'])
+            parent = ''
+            for p in range(1, MAX_PRECISION + 1):
+                prefix = cell[:p]
+                if prefix not in self.members:
+                    self.members[prefix] = []
+                    self.children.setdefault(parent, []).append(prefix)
+                self.members[prefix].append(i)
+                parent = prefix
+
+    def bounds(self, cell):
+        b = self._bounds.get(cell)
+        if b is None:
+            b = self._bounds[cell] = geohash_bounds(cell)
+        return b
+
+    def cells(self, precision, bbox=None):
+        """Yield (cell, [station rows]) for the cells of `precision` that intersect `bbox`."""
+        precision = min(max(1, precision), MAX_PRECISION)
+        stack = list(self.children.get('', ()))
+        while stack:
+            cell = stack.pop()
+            if bbox is not None and not _intersects(self.bounds(cell), bbox):
+                continue
+            if len(cell) == precision or cell not in self.children:
+                yield cell, [self.rows[i] for i in self.members[cell]]
+            else:
+                stack.extend(self.children[cell])
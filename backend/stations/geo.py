@@ -0,0 +1,177 @@
+"""Coordinates, geohashes and area filters for stations.
+
+`Station.lat`/`lon` stay free text (test values are allowed); the numeric
+`latitude`/`longitude` columns and the `geohash` cell are derived from them on every
+save (and by the `station_geo_sync` trigger on databases built from
+`database/*.sql`). Rows whose text does not parse keep NULLs and are left out of
+spatial filters.
+
+Area parameters understood by `filter_area()` and `area_station_ids()`:
+
+- `bbox=min_lat,min_lon,max_lat,max_lon`
+- `near=lat,lon` with `radius` in km (default `STATION_NEAR_DEFAULT_KM`)
+"""
+import math
+
+from django.conf import settings
+
+GEOHASH_PRECISION = 9
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+
+
+class AreaError(ValueError):
+    """Malformed `bbox`/`near`/`radius` parameter."""
+
+
+def parse_coordinate(value, limit):
+    """Float value of a latitude (limit 90) or longitude (limit 180) string, or None."""
+    if value is None:
+        return None
+    try:
+        number = float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return None
+    if math.isnan(number) or abs(number) > limit:
+        return None
+    return number
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        ch <<= 1
+        if value >= mid:
+            ch |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return ''.join(out)
+
+
+def geohash_bounds(cell):
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for c in cell:
+        idx = _BASE32.index(c)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if idx >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def geo_fields(lat, lon):
+    """Values for the derived `latitude`, `longitude` and `geohash` columns."""
+    latitude = parse_coordinate(lat, 90)
+    longitude = parse_coordinate(lon, 180)
+    if latitude is None or longitude is None:
+        return {'latitude': None, 'longitude': None, 'geohash': None}
+    return {'latitude': latitude, 'longitude': longitude, 'geohash': geohash_encode(latitude, longitude)}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(lat, lon, radius_km):
+    """Bounding box that contains every point within `radius_km` of (lat, lon)."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-9 else min(180.0, dlat / cos_lat)
+    return max(-90.0, lat - dlat), max(-180.0, lon - dlon), min(90.0, lat + dlat), min(180.0, lon + dlon)
+
+
+def _floats(text, count, name):
+    parts = [p for p in str(text).split(',') if p.strip()]
+    if len(parts) != count:
+        raise AreaError(f'{name} expects {count} comma separated numbers')
+    try:
+        return [float(p) for p in parts]
+    except ValueError:
+        raise AreaError(f'{name} expects {count} comma separated numbers')
+
+
+def parse_bbox(text):
+    min_lat, min_lon, max_lat, max_lon = _floats(text, 4, 'bbox')
+    if min_lat > max_lat or min_lon > max_lon:
+        raise AreaError('bbox expects min_lat,min_lon,max_lat,max_lon')
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def parse_near(text, radius):
+    lat, lon = _floats(text, 2, 'near')
+    if abs(lat) > 90 or abs(lon) > 180:
+        raise AreaError('near is out of range')
+    if radius in (None, ''):
+        radius_km = float(getattr(settings, 'STATION_NEAR_DEFAULT_KM', 5))
+    else:
+        try:
+            radius_km = float(radius)
+        except ValueError:
+            raise AreaError('radius must be a number of km')
+    if radius_km <= 0:
+        raise AreaError('radius must be positive')
+    return lat, lon, radius_km
+
+
+def has_area(params):
+    return bool(params.get('bbox') or params.get('near'))
+
+
+def filter_bbox(qs, min_lat, min_lon, max_lat, max_lon):
+    """Index-backed bounding-box filter on a `Station` queryset."""
+    return qs.filter(latitude__gte=min_lat, latitude__lte=max_lat, longitude__gte=min_lon, longitude__lte=max_lon)
+
+
+def filter_area(qs, params):
+    """Restrict a `Station` queryset to the `bbox`/`near` area of `params`.
+
+    Both filters may be combined. `near` narrows the bounding-box candidates by their
+    exact great-circle distance. Raises `AreaError` on malformed parameters.
+    """
+    if params.get('bbox'):
+        qs = filter_bbox(qs, *parse_bbox(params['bbox']))
+    if params.get('near'):
+        lat, lon, radius_km = parse_near(params['near'], params.get('radius'))
+        candidates = filter_bbox(qs, *bbox_around(lat, lon, radius_km))
+        qs = qs.filter(station_id__in=[
+            station_id
+            for station_id, s_lat, s_lon in candidates.values_list('station_id', 'latitude', 'longitude')
+            if haversine_km(lat, lon, s_lat, s_lon) <= radius_km
+        ])
+    return qs
+
+
+def area_station_ids(params):
+    """Ids of the stations inside the area of `params`, or None when it has no area filter."""
+    from .models import Station
+
+    if not has_area(params):
+        return None
+    return list(filter_area(Station.objects.all(), params).values_list('station_id', flat=True))
+
+
+def station_id_set(value):
+    """Normalize a station filter (None, one id or a collection of ids) to a set of ints or None."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return {int(v) for v in value}
+    return {int(value)}
@@ -0,0 +1,87 @@
+import math
+
+from django.db import migrations, models
+
+# Frozen copy of stations.geo as of this migration, so later changes there cannot
+# alter what the backfill computes.
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def _parse_coordinate(value, limit):
+    if value is None:
+        return None
+    try:
+        number = float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return None
+    if math.isnan(number) or abs(number) > limit:
+        return None
+    return number
+
+
+def _geohash_encode(lat, lon, precision=9):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        ch <<= 1
+        if value >= mid:
+            ch |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return ''.join(out)
+
+
+def geo_fields(lat, lon):
+    latitude = _parse_coordinate(lat, 90)
+    longitude = _parse_coordinate(lon, 180)
+    if latitude is None or longitude is None:
+        return {'latitude': None, 'longitude': None, 'geohash': None}
+    return {'latitude': latitude, 'longitude': longitude, 'geohash': _geohash_encode(latitude, longitude)}
+
+
+def backfill(apps, schema_editor):
+    Station = apps.get_model('stations', 'Station')
+    for station in Station.objects.only('station_id', 'lat', 'lon').iterator():
+        Station.objects.filter(pk=station.pk).update(**geo_fields(station.lat, station.lon))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0005_alter_stationrequest_institution_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Latitud numérica'),
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Longitud numérica'),
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True, verbose_name='Geohash'),
+        ),
+        migrations.AddIndex(
+            model_name='station',
+            index=models.Index(fields=['latitude', 'longitude'], name='station_lat_lon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='station',
+            index=models.Index(fields=['geohash'], name='station_geohash_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
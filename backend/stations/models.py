@@ -8,6 +8,10 @@ class Station(models.Model):
     # Permitir valores de prueba sin validar formato numérico
     lat = models.CharField(_('Latitud'), max_length=32)
     lon = models.CharField(_('Longitud'), max_length=32)
+    # Valores numéricos derivados de lat/lon (NULL si el texto no es una coordenada), ver stations/geo.py
+    latitude = models.FloatField(_('Latitud numérica'), null=True, blank=True, editable=False)
+    longitude = models.FloatField(_('Longitud numérica'), null=True, blank=True, editable=False)
+    geohash = models.CharField(_('Geohash'), max_length=12, null=True, blank=True, editable=False)
     calibration_certificate = models.CharField(_('Certificado de calibración'), max_length=100, blank=True, null=True)
     maintenance_date = models.DateTimeField(_('Fecha de mantenimiento'), blank=True, null=True)
     admin_id = models.ForeignKey('users.User', on_delete=models.RESTRICT, db_column='admin_id', verbose_name=_('Administrador'), null=True, blank=True)
@@ -22,10 +26,24 @@ class Station(models.Model):
         db_table = 'station'
         verbose_name = _('Estación')
         verbose_name_plural = _('Estaciones')
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='station_lat_lon_idx'),
+            models.Index(fields=['geohash'], name='station_geohash_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return f"{self.station_id} - {self.s_name}"
 
+    def save(self, *args, **kwargs):
+        from .geo import geo_fields
+
+        for field, value in geo_fields(self.lat, self.lon).items():
+            setattr(self, field, value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'lat', 'lon'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'latitude', 'longitude', 'geohash'}
+        super().save(*args, **kwargs)
+
 
 class StationRequest(models.Model):
     STATUS_CHOICES = (
@@ -0,0 +1,153 @@
+"""In-memory spatial index of stations: k-nearest lookup and map clusters.
+
+Stations with numeric coordinates are kept in a KD-tree over unit vectors on the
+sphere: the straight-line (chord) distance between two unit vectors grows with the
+great-circle distance, so the Euclidean nearest neighbours are the nearest stations
+on the ground, without special cases at the poles or the antimeridian.
+
+The tree and the cluster grid (stations/clusters.py) are built together on first use. Saving or deleting a `Station` invalidates it (see
+`StationsConfig.ready`), as do the views that write stations with raw SQL or
+`QuerySet.update()`; other workers rebuild after `STATION_INDEX_TTL` seconds.
+"""
+import bisect
+import heapq
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .clusters import ClusterGrid, precision_for_zoom
+from .geo import EARTH_RADIUS_KM
+
+INDEX_FIELDS = ('station_id', 's_name', 'latitude', 'longitude', 'geohash', 's_state')
+
+
+def unit_vector(lat, lon):
+    p, l = math.radians(lat), math.radians(lon)
+    return math.cos(p) * math.cos(l), math.cos(p) * math.sin(l), math.sin(p)
+
+
+def chord_for_km(km):
+    """Chord length on the unit sphere of a great-circle distance in km."""
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+def km_for_chord(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class KDTree:
+    """Static 3-d tree; nodes are stored in flat lists indexed by node number."""
+
+    def __init__(self, points):
+        self.points = points
+        self.split = []  # point index of each node
+        self.axis = []
+        self.left = []
+        self.right = []
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, idx, depth):
+        if not idx:
+            return -1
+        axis = depth % 3
+        idx.sort(key=lambda i: self.points[i][axis])
+        mid = len(idx) // 2
+        node = len(self.split)
+        self.split.append(idx[mid])
+        self.axis.append(axis)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.left[node] = self._build(idx[:mid], depth + 1)
+        self.right[node] = self._build(idx[mid + 1:], depth + 1)
+        return node
+
+    def query(self, point, k, max_distance=None):
+        """[(distance, point index)] of the `k` nearest points, closest first."""
+        if k <= 0 or self.root < 0:
+            return []
+        bound = math.inf if max_distance is None else max_distance * max_distance
+        heap = []  # (-squared distance, point index), the worst hit on top
+        stack = [(self.root, 0.0)]  # (node, squared distance to its half-space)
+        while stack:
+            node, gap = stack.pop()
+            if node < 0 or gap > bound:
+                continue
+            i = self.split[node]
+            p = self.points[i]
+            d2 = (p[0] - point[0]) ** 2 + (p[1] - point[1]) ** 2 + (p[2] - point[2]) ** 2
+            if d2 <= bound:
+                if len(heap) < k:
+                    heapq.heappush(heap, (-d2, i))
+                elif d2 < -heap[0][0]:
+                    heapq.heapreplace(heap, (-d2, i))
+                if len(heap) == k:
+                    bound = min(bound, -heap[0][0])
+            diff = point[self.axis[node]] - p[self.axis[node]]
+            near, far = (self.left[node], self.right[node]) if diff < 0 else (self.right[node], self.left[node])
+            # the near side is popped first and tightens `bound` before the far side is checked
+            stack.append((far, diff * diff))
+            stack.append((near, gap))
+        return sorted((math.sqrt(-d2), i) for d2, i in heap)
+
+
+class StationIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (rows, tree, grid) swapped as one value so readers never mix two generations
+        self._state = None
+        self._loaded_at = 0.0
+
+    def _load(self):
+        ttl = getattr(settings, 'STATION_INDEX_TTL', 60)
+        if self._state is not None and time.monotonic() - self._loaded_at < ttl:
+            return self._state
+        with self._lock:
+            if self._state is not None and time.monotonic() - self._loaded_at < ttl:
+                return self._state
+            from .models import Station
+
+            rows = list(
+                Station.objects.filter(latitude__isnull=False, longitude__isnull=False)
+                .values(*INDEX_FIELDS).order_by('station_id')
+            )
+            tree = KDTree([unit_vector(r['latitude'], r['longitude']) for r in rows])
+            self._state = (rows, tree, ClusterGrid(rows))
+            self._loaded_at = time.monotonic()
+            return self._state
+
+    def invalidate(self):
+        # keep serving the old tree until the next lookup rebuilds it
+        with self._lock:
+            self._loaded_at = -math.inf
+
+    def __len__(self):
+        return len(self._load()[0])
+
+    def get(self, station_id):
+        """Index row of a station, or None if it has no coordinates."""
+        rows = self._load()[0]
+        i = bisect.bisect_left(rows, station_id, key=lambda r: r['station_id'])
+        return rows[i] if i < len(rows) and rows[i]['station_id'] == station_id else None
+
+    def nearest(self, lat, lon, k=5, radius_km=None):
+        """[(station row, distance in km)] of the `k` stations closest to (lat, lon).
+
+        With `radius_km`, stations farther away are left out even if fewer than `k` remain.
+        """
+        rows, tree, _grid = self._load()
+        max_chord = None if radius_km is None else chord_for_km(radius_km)
+        hits = tree.query(unit_vector(lat, lon), k, max_chord)
+        return [(rows[i], km_for_chord(chord)) for chord, i in hits]
+
+    def clusters(self, zoom, bbox=None):
+        """[(geohash cell, [station rows])] of the grid cells shown at `zoom` inside `bbox`."""
+        grid = self._load()[2]
+        return list(grid.cells(precision_for_zoom(zoom), bbox))
+
+    def cell_bounds(self, cell):
+        return self._load()[2].bounds(cell)
+
+
+station_index = StationIndex()
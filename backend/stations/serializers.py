@@ -21,8 +21,8 @@ class StationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Station
         fields = [
-            'station_id', 's_name', 'lat', 'lon', 'calibration_certificate', 'maintenance_date',
-            'admin_id', 's_state', 'institution',
+            'station_id', 's_name', 'lat', 'lon', 'latitude', 'longitude', 'geohash',
+            'calibration_certificate', 'maintenance_date', 'admin_id', 's_state', 'institution',
             'requested_institution', 'request_submitted_by'
         ]
 
@@ -0,0 +1,53 @@
+import math
+import random
+
+from django.test import SimpleTestCase
+
+from .nearest import KDTree, chord_for_km, km_for_chord, unit_vector
+
+
+def brute_force(points, point, k, max_distance=None):
+    hits = sorted((math.dist(p, point), i) for i, p in enumerate(points))
+    if max_distance is not None:
+        hits = [h for h in hits if h[0] <= max_distance]
+    return hits[:k]
+
+
+class KDTreeQueryTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.coords = [(rng.uniform(3.2, 3.7), rng.uniform(-76.8, -76.3)) for _ in range(300)]
+        self.points = [unit_vector(lat, lon) for lat, lon in self.coords]
+        self.tree = KDTree(self.points)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(11)
+        for _ in range(50):
+            point = unit_vector(rng.uniform(3.1, 3.8), rng.uniform(-76.9, -76.2))
+            for k in (1, 5, 20):
+                got = self.tree.query(point, k)
+                want = brute_force(self.points, point, k)
+                self.assertEqual([i for _d, i in got], [i for _d, i in want])
+                for (d_got, _), (d_want, _) in zip(got, want):
+                    self.assertAlmostEqual(d_got, d_want, places=12)
+
+    def test_max_distance_limits_the_hits(self):
+        point = unit_vector(3.45, -76.53)
+        limit = chord_for_km(5)
+        got = self.tree.query(point, 50, max_distance=limit)
+        self.assertEqual([i for _d, i in got], [i for _d, i in brute_force(self.points, point, 50, limit)])
+        self.assertTrue(all(km_for_chord(d) <= 5 + 1e-9 for d, _i in got))
+
+    def test_edge_cases(self):
+        self.assertEqual(KDTree([]).query(unit_vector(0, 0), 3), [])
+        self.assertEqual(self.tree.query(self.points[0], 0), [])
+        self.assertEqual(len(self.tree.query(self.points[0], 1000)), len(self.points))
+        distance, index = self.tree.query(self.points[42], 1)[0]
+        self.assertEqual((distance, index), (0.0, 42))
+
+    def test_distances_work_across_the_antimeridian(self):
+        points = [unit_vector(0, 179.9), unit_vector(0, -179.9), unit_vector(0, 170)]
+        tree = KDTree(points)
+        nearest = tree.query(unit_vector(0, 179.95), 2)
+        self.assertEqual(sorted(i for _d, i in nearest), [0, 1])
+        self.assertAlmostEqual(km_for_chord(nearest[1][0]), 16.7, delta=0.5)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db.utils import ProgrammingError
 import logging
 from rest_framework import viewsets
@@ -6,7 +7,13 @@ from rest_framework import status
 from rest_framework.response import Response
 from institutions.models import Institution
 from users.models import User
+from users.tokens import claims_user
+from measurements.queries import describe_readings, latest_readings
+from sensors.models import SensorDrift
+from variables.catalog import catalog as variable_catalog
+from . import geo
 from .models import Station
+from .nearest import station_index
 from .serializers import StationSerializer
 
 logger = logging.getLogger(__name__)
@@ -40,10 +47,16 @@ class StationViewSet(viewsets.ModelViewSet):
 
         if not cols:
             return Response({'error': 'No valid station fields provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if 'lat' in cols and 'lon' in cols:
+            # numeric copies used by the spatial filters (the DDL trigger recomputes the same values)
+            for c, v in geo.geo_fields(payload.get('lat'), payload.get('lon')).items():
+                cols.append(c)
+                vals.append(v)
 
         col_list = ', '.join(f'"{c}"' for c in cols)
         placeholders = ', '.join(['%s'] * len(vals))
-        returning = ', '.join(['station_id', 's_name', 'lat', 'lon', 'calibration_certificate', 'maintenance_date', 'admin_id', 's_state', 'institution_id'])
+        keys = ['station_id', 's_name', 'lat', 'lon', 'latitude', 'longitude', 'geohash', 'calibration_certificate', 'maintenance_date', 'admin_id', 's_state', 'institution_id']
+        returning = ', '.join(keys)
         sql = f'INSERT INTO "station" ({col_list}) VALUES ({placeholders}) RETURNING {returning};'
 
         try:
@@ -57,8 +70,9 @@ class StationViewSet(viewsets.ModelViewSet):
 
         if not row:
             return Response({'error': 'Unknown error creating station'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # the raw INSERT sends no post_save signal
+        station_index.invalidate()
 
-        keys = ['station_id', 's_name', 'lat', 'lon', 'calibration_certificate', 'maintenance_date', 'admin_id', 's_state', 'institution_id']
         result = dict(zip(keys, row))
         # convert bytes to str where applicable
         for k, v in result.items():
@@ -73,12 +87,16 @@ class StationViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         qs = super().get_queryset().select_related('institution')
         # Select only known columns to avoid referencing request-related columns
-        qs = qs.only('station_id', 's_name', 'lat', 'lon', 'calibration_certificate', 'maintenance_date', 'admin_id', 's_state', 'institution')
+        qs = qs.only('station_id', 's_name', 'lat', 'lon', 'latitude', 'longitude', 'geohash', 'calibration_certificate', 'maintenance_date', 'admin_id', 's_state', 'institution')
+        # Map views: ?bbox=min_lat,min_lon,max_lat,max_lon and/or ?near=lat,lon&radius=km
+        qs = geo.filter_area(qs, self.request.query_params)
         institution_admin = self.request.query_params.get('institution_admin')
         admin_id = self.request.query_params.get('admin_id')
-        # Try to detect current user id from common locations (query param or header)
+        # Bearer-token requests carry u_type as a claim, so scoping needs no user lookup
+        token_user = claims_user(self.request)
+        # Legacy clients without a token: detect current user id from common locations (query param or header)
         current_user_id = None
-        if not admin_id:
+        if not admin_id and token_user is None:
             current_user_id = self.request.query_params.get('current_user_id') or self.request.query_params.get('user_id')
             if not current_user_id:
                 # header 'X-User-Id' if frontend sets it
@@ -94,24 +112,19 @@ class StationViewSet(viewsets.ModelViewSet):
         try:
             if admin_id:
                 qs = qs.filter(admin_id=admin_id)
-            else:
+            elif token_user is not None:
+                # station admins only see their stations
+                if token_user.administers_stations:
+                    qs = qs.filter(admin_id=token_user.id)
+            elif current_user_id:
                 # if frontend provided a current user id and that user is a station admin, restrict to their stations
-                if current_user_id:
-                    try:
-                        u = User.objects.filter(id=current_user_id).only('id', 'u_type').first()
-                        if u and (u.u_type == 'admin' or u.u_type == 'station_admin'):
-                            qs = qs.filter(admin_id=u.id)
-                    except Exception:
-                        # ignore user lookup issues and do not apply the filter
-                        pass
-                else:
-                    # If request.user is set and is our User model, and is of type admin, apply filter
-                    try:
-                        ru = getattr(self.request, 'user', None)
-                        if ru and hasattr(ru, 'id') and hasattr(ru, 'u_type') and (ru.u_type == 'admin' or ru.u_type == 'station_admin'):
-                            qs = qs.filter(admin_id=ru.id)
-                    except Exception:
-                        pass
+                try:
+                    u = User.objects.filter(id=current_user_id).only('id', 'u_type').first()
+                    if u and (u.u_type == 'admin' or u.u_type == 'station_admin'):
+                        qs = qs.filter(admin_id=u.id)
+                except Exception:
+                    # ignore user lookup issues and do not apply the filter
+                    pass
         except ProgrammingError:
             pass
         # no request-related filters
@@ -125,11 +138,86 @@ class StationViewSet(viewsets.ModelViewSet):
         """
         try:
             return super().list(request, *args, **kwargs)
+        except geo.AreaError as ex:
+            return Response({'error': 'Parámetros de área inválidos', 'detail': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
         except ProgrammingError as ex:
             # Fallback: return minimal station data using values() to avoid model relation access
             qs = self.get_queryset().values('station_id', 's_name', 'lat', 'lon', 'admin_id', 's_state', 'institution_id')
             return Response({'message': 'Partial response due to missing DB columns', 'results': list(qs)})
 
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        """Return the `k` stations closest to a point, nearest first.
+        Query: ?lat=&lon=&k=5, optional &radius=<km> to drop farther stations and
+        &readings=1 to include each station's latest reading per variable.
+        Served from the in-memory KD-tree in stations/nearest.py.
+        """
+        params = request.query_params
+        lat = geo.parse_coordinate(params.get('lat'), 90)
+        lon = geo.parse_coordinate(params.get('lon'), 180)
+        if lat is None or lon is None:
+            return Response({'error': 'lat y lon son obligatorios y deben ser coordenadas válidas'}, status=status.HTTP_400_BAD_REQUEST)
+        max_k = getattr(settings, 'STATION_NEAREST_MAX_K', 50)
+        try:
+            k = int(params.get('k') or 5)
+            radius_km = float(params['radius']) if params.get('radius') else None
+        except ValueError as ex:
+            return Response({'error': 'k y radius deben ser numéricos', 'detail': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        if k < 1 or (radius_km is not None and radius_km <= 0):
+            return Response({'error': 'k y radius deben ser positivos'}, status=status.HTTP_400_BAD_REQUEST)
+        hits = station_index.nearest(lat, lon, min(k, max_k), radius_km)
+        results = [dict(row, distance_km=round(distance, 3)) for row, distance in hits]
+        if params.get('readings') in ('1', 'true', 'yes'):
+            latest = latest_readings([r['station_id'] for r in results])
+            for r in results:
+                r['latest'] = describe_readings(latest.get(r['station_id'], []))
+        return Response({'lat': lat, 'lon': lon, 'k': min(k, max_k), 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """Return station clusters for a map view, one per geohash cell on screen.
+        Query: ?zoom=<map zoom>&bbox=min_lat,min_lon,max_lat,max_lon, optional
+        &variable=<id or name> to add the max/mean of each cluster's latest readings.
+        Single-station clusters also carry the station's id and name.
+        """
+        params = request.query_params
+        try:
+            zoom = int(params.get('zoom') or 0)
+        except ValueError as ex:
+            return Response({'error': 'zoom debe ser un entero', 'detail': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            bbox = geo.parse_bbox(params['bbox']) if params.get('bbox') else None
+        except geo.AreaError as ex:
+            return Response({'error': 'Parámetros de área inválidos', 'detail': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        cells = station_index.clusters(zoom, bbox)
+        variable_ids = None
+        if params.get('variable'):
+            variable_ids = set(variable_catalog.resolve(params.get('variable')))
+            latest = latest_readings([row['station_id'] for _cell, members in cells for row in members])
+        results = []
+        for cell, members in cells:
+            item = {
+                'geohash': cell,
+                'count': len(members),
+                'lat': sum(r['latitude'] for r in members) / len(members),
+                'lon': sum(r['longitude'] for r in members) / len(members),
+                'bounds': station_index.cell_bounds(cell),
+            }
+            if len(members) == 1:
+                item['station_id'] = members[0]['station_id']
+                item['s_name'] = members[0]['s_name']
+            if variable_ids is not None:
+                values = [
+                    reading['value']
+                    for row in members
+                    for reading in latest.get(row['station_id'], [])
+                    if reading['variable_id'] in variable_ids
+                ]
+                item['max'] = max(values) if values else None
+                item['mean'] = sum(values) / len(values) if values else None
+            results.append(item)
+        return Response({'zoom': zoom, 'bbox': bbox, 'clusters': results})
+
     @action(detail=True, methods=['post'])
     def approve_connection(self, request, pk=None):
         """Approve a station connection by setting its `institution` FK to the provided institution_id.
@@ -156,6 +244,7 @@ class StationViewSet(viewsets.ModelViewSet):
             pass
         # Perform update without loading model fields that may be missing in DB
         qs.update(institution_id=inst.institution_id, s_state='approved')
+        station_index.invalidate()
         return Response({'message': 'Estación aprobada', 'station_id': int(pk), 'institution_id': int(inst.institution_id)})
 
     @action(detail=True, methods=['get'])
@@ -223,8 +312,33 @@ class StationViewSet(viewsets.ModelViewSet):
 
         try:
             qs.update(s_state=new_state)
+            station_index.invalidate()
             return Response({'message': 'Estado actualizado', 'station_id': int(pk), 's_state': new_state})
         except Exception as ex:
             # Be defensive against schema issues
             logger.exception('Failed to update station state')
-            return Response({'error': 'No se pudo actualizar el estado', 'detail': str(ex)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': 'No se pudo actualizar el estado', 'detail': str(ex)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['get'])
+    def drift(self, request, pk=None):
+        """Return the calibration drift of the station's sensors from the last
+        `check_sensor_drift` run: per sensor and variable, the bias against neighbouring
+        stations, its trend per day and whether it passed the drift limit.
+        """
+        if not Station.objects.filter(pk=pk).exists():
+            return Response({'error': 'Estación no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        results = list(
+            SensorDrift.objects.filter(sensor__station_id=pk).order_by('sensor_id', 'variable_id').values(
+                'sensor_id', 'variable_id', 'computed_at', 'window_start', 'window_end', 'neighbours',
+                'bias', 'slope_per_day', 'level', 'relative_drift', 'flagged',
+            )
+        )
+        for row in results:
+            variable = variable_catalog.get(row['variable_id']) or {}
+            row['variable'] = variable.get('v_name')
+            row['unit'] = variable.get('v_unit')
+        return Response({
+            'station_id': int(pk),
+            'flagged': sum(1 for r in results if r['flagged']),
+            'results': results,
+        })
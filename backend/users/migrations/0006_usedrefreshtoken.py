@@ -0,0 +1,24 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_remove_email_id_remove_phonenumber_id_email_email_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsedRefreshToken',
+            fields=[
+                ('jti', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('expires_at', models.DateTimeField()),
+                ('user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, to='users.user')),
+            ],
+            options={
+                'db_table': 'used_refresh_token',
+                'indexes': [models.Index(fields=['expires_at'], name='used_refresh_token_expires_idx')],
+            },
+        ),
+    ]
@@ -43,4 +43,17 @@ class PhoneNumber(models.Model):
 
 
     def __str__(self):
-        return self.p_number
\ No newline at end of file
+        return self.p_number
+
+
+class UsedRefreshToken(models.Model):
+    """A refresh token already traded in (see users/tokens.py); its `jti` is refused from then on."""
+    jti = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_column='user_id')
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'used_refresh_token'
+        indexes = [
+            models.Index(fields=['expires_at'], name='used_refresh_token_expires_idx'),
+        ]
@@ -0,0 +1,79 @@
+from contextlib import nullcontext
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import views
+from .tokens import ClaimsUser
+
+
+def claims(u_type='station_admin', institutions=(), stations=()):
+    return ClaimsUser({'user_id': 1, 'u_type': u_type, 'institutions': list(institutions), 'stations': list(stations)})
+
+
+class ClaimsScopeTests(SimpleTestCase):
+    def test_station_admin_manages_only_its_stations(self):
+        user = claims(stations=[5, 6])
+        self.assertTrue(user.manages_station(5))
+        self.assertTrue(user.manages_station('6'))
+        self.assertFalse(user.manages_station(7))
+        self.assertFalse(user.manages_station(None))
+        self.assertFalse(user.manages_institution(1))
+
+    def test_institution_admin_manages_the_institution_and_its_stations(self):
+        user = claims(u_type='admin', institutions=[3])
+        self.assertTrue(user.manages_institution(3))
+        self.assertTrue(user.manages_institution('3'))
+        self.assertFalse(user.manages_institution(4))
+        self.assertTrue(user.manages_station(9, institution_id=3))
+        self.assertFalse(user.manages_station(9, institution_id=4))
+        self.assertFalse(user.manages_station(9))
+
+    def test_super_admin_manages_everything(self):
+        user = claims(u_type='super_admin')
+        self.assertTrue(user.manages_institution(42))
+        self.assertTrue(user.manages_station(42))
+
+    def test_regular_user_manages_nothing(self):
+        user = claims(u_type='regular')
+        self.assertFalse(user.administers_stations)
+        self.assertFalse(user.manages_institution(1))
+        self.assertFalse(user.manages_station(1, institution_id=1))
+
+    def test_malformed_ids_are_not_matched(self):
+        user = claims(institutions=[1], stations=[1])
+        self.assertFalse(user.manages_station('abc'))
+        self.assertFalse(user.manages_institution(''))
+
+
+class RefreshRotationTests(SimpleTestCase):
+    def refresh(self, raw, used):
+        users = mock.Mock()
+        users.objects.filter.return_value.first.return_value = mock.Mock(id=1, validated=True)
+
+        def create(jti, **kwargs):
+            if jti in used:
+                raise IntegrityError('duplicate key')
+            used.add(jti)
+
+        tokens = mock.Mock()
+        tokens.objects.create.side_effect = create
+        request = APIRequestFactory().post('/api/users/token/refresh/', {'refresh': raw}, format='json')
+        with mock.patch.object(views, 'User', users), \
+                mock.patch.object(views, 'UsedRefreshToken', tokens), \
+                mock.patch.object(views.transaction, 'atomic', nullcontext), \
+                mock.patch.object(views, 'issue_tokens', return_value={'access': 'a', 'refresh': 'r'}):
+            return views.refresh_token(request)
+
+    def test_a_refresh_token_is_traded_once(self):
+        token = RefreshToken()
+        token['user_id'] = 1
+        used = set()
+        self.assertEqual(self.refresh(str(token), used).status_code, 200)
+        response = self.refresh(str(token), used)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data, {'error': 'Refresh token already used'})
+        self.assertEqual(used, {token['jti']})
@@ -0,0 +1,92 @@
+"""Signed JWT access/refresh tokens carrying the claims views need for scoping.
+
+`login_user` issues the pair; `refresh_token` trades a refresh token for a new
+pair with the claims re-read from the database, so changes to a user's stations
+or institutions show up at the next refresh. Refresh tokens rotate: the `jti` of
+a traded one goes to `used_refresh_token` and is refused if presented again. Requests carrying
+`Authorization: Bearer <access>` are authenticated without a database query
+(`JWTStatelessUserAuthentication`), and `request.user` is a `ClaimsUser`:
+
+- `user_id`: `users.id`
+- `u_type`: admin, station_admin, regular, ...
+- `institutions`: ids of the institutions the user administers
+- `stations`: ids of the stations the user administers
+
+`claims_user(request)` returns that user (None without a token); views that are
+scoped to an institution or a station check `manages_institution()` /
+`manages_station()` on it.
+"""
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+
+STATION_ADMIN_TYPES = ('admin', 'station_admin')
+SUPER_ADMIN_TYPES = ('super_admin',)
+
+
+def claims_for(user):
+    from institutions.models import Institution
+    from stations.models import Station
+
+    return {
+        'u_type': user.u_type,
+        'institutions': list(Institution.objects.filter(admin_id=user.id).values_list('institution_id', flat=True)),
+        'stations': list(Station.objects.filter(admin_id=user.id).values_list('station_id', flat=True)),
+    }
+
+
+def refresh_for(user):
+    refresh = RefreshToken.for_user(user)
+    for claim, value in claims_for(user).items():
+        refresh[claim] = value
+    return refresh
+
+
+def issue_tokens(user):
+    """{'access', 'refresh'} token strings for a validated user."""
+    refresh = refresh_for(user)
+    return {'access': str(refresh.access_token), 'refresh': str(refresh)}
+
+
+def _has(ids, value):
+    try:
+        return int(value) in ids
+    except (TypeError, ValueError):
+        return False
+
+
+def claims_user(request):
+    """`request.user` of a bearer-token request, or None."""
+    user = getattr(request, 'user', None)
+    return user if isinstance(user, ClaimsUser) else None
+
+
+class ClaimsUser(TokenUser):
+    """`request.user` of token-authenticated requests, read from the token claims."""
+
+    @property
+    def u_type(self):
+        return self.token.get('u_type')
+
+    @property
+    def institution_ids(self):
+        return self.token.get('institutions') or []
+
+    @property
+    def station_ids(self):
+        return self.token.get('stations') or []
+
+    @property
+    def administers_stations(self):
+        return self.u_type in STATION_ADMIN_TYPES
+
+    @property
+    def is_super_admin(self):
+        return self.u_type in SUPER_ADMIN_TYPES
+
+    def manages_institution(self, institution_id):
+        return self.is_super_admin or _has(self.institution_ids, institution_id)
+
+    def manages_station(self, station_id, institution_id=None):
+        """Whether the user administers the station, directly or through its institution."""
+        return (self.is_super_admin or _has(self.station_ids, station_id)
+                or (institution_id is not None and _has(self.institution_ids, institution_id)))
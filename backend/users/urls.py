@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import register_user, login_user, health, pending_users, approve_user, reject_user, user_status, user_detail
+from .views import register_user, login_user, health, pending_users, approve_user, reject_user, user_status, user_detail, refresh_token
 
 urlpatterns = [
     path('register/', register_user),
     path('login/', login_user),
+    path('token/refresh/', refresh_token),
     path('health/', health),
     path('pending/', pending_users),
     path('approve/<int:user_id>/', approve_user),
@@ -2,10 +2,16 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework import status
 from django.db import IntegrityError, transaction
+from django.utils import timezone
+from datetime import datetime, timezone as dt_timezone
 import logging
-from .models import User, Email, PhoneNumber
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import User, Email, PhoneNumber, UsedRefreshToken
 from stations.models import Station
 from .serializers import UserSerializer
+from .tokens import issue_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -147,10 +153,43 @@ def login_user(request):
         "user_id": user.id,
         "name": user.u_name,
         "last_name": user.last_name,
-        "u_type": user.u_type
+        "u_type": user.u_type,
+        **issue_tokens(user),
     })
 
 
+# ======================
+#  TOKEN REFRESH
+# ======================
+@api_view(['POST'])
+def refresh_token(request):
+    """Trade a refresh token for a new access token and refresh token.
+    Claims are re-read from the database so new station/institution assignments
+    apply; users deleted or no longer validated are refused. Refresh tokens rotate:
+    each one can be traded once, so a stolen one stops working once either holder uses it.
+    """
+    raw = (request.data.get('refresh') or '').strip()
+    if not raw:
+        return Response({"error": "Missing refresh token"}, status=400)
+    try:
+        old = RefreshToken(raw)
+    except TokenError as ex:
+        return Response({"error": "Invalid refresh token", "detail": str(ex)}, status=401)
+    user = User.objects.filter(id=old[jwt_settings.USER_ID_CLAIM]).first()
+    if not user or not user.validated:
+        return Response({"error": "El usuario no está activo"}, status=401)
+    try:
+        with transaction.atomic():
+            UsedRefreshToken.objects.create(
+                jti=old[jwt_settings.JTI_CLAIM], user=user,
+                expires_at=datetime.fromtimestamp(old['exp'], tz=dt_timezone.utc),
+            )
+    except IntegrityError:
+        return Response({"error": "Refresh token already used"}, status=401)
+    UsedRefreshToken.objects.filter(expires_at__lt=timezone.now()).delete()
+    return Response(issue_tokens(user))
+
+
 # Simple health endpoint to verify API is reachable
 @api_view(['GET'])
 def health(request):
@@ -4,4 +4,15 @@ from django.apps import AppConfig
 class VariablesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'variables'
-    verbose_name = 'Variables'
\ No newline at end of file
+    verbose_name = 'Variables'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .catalog import catalog
+        from .models import Variable
+
+        def invalidate_catalog(sender, **kwargs):
+            catalog.invalidate()
+
+        post_save.connect(invalidate_catalog, sender=Variable, dispatch_uid='variables.catalog.save')
+        post_delete.connect(invalidate_catalog, sender=Variable, dispatch_uid='variables.catalog.delete')
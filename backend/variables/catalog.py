@@ -0,0 +1,96 @@
+"""In-memory catalog of `Variable` rows.
+
+The table is small and rarely changes, so it is loaded once per process and
+indexed by every spelling clients use for a variable:
+
+- exact name, case-insensitive ('pm2.5')
+- normalized name without spaces/underscores/dashes ('PM2.5')
+- alphanumeric code ('PM25', also matches 'PM2,5' and 'pm 2.5')
+- unit-qualified name ('PM2.5 (µg/m3)', 'PM2.5 µg/m3')
+
+Saving or deleting a `Variable` invalidates the catalog (see `VariablesConfig.ready`);
+other workers pick up changes after `VARIABLE_CATALOG_TTL` seconds.
+"""
+import re
+import threading
+import time
+
+from django.conf import settings
+
+
+def _normalize(text):
+    return re.sub(r'[\s_\-]+', '', str(text or '')).upper()
+
+
+def _code(text):
+    return re.sub(r'[^0-9A-Z]+', '', str(text or '').upper())
+
+
+class VariableCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (rows, {v_id: row}, {key: [v_id]}), replaced as a whole so readers never see a mix
+        self._state = None
+        self._loaded_at = 0.0
+        # bumped on every reload so dependent caches can tell they are stale
+        self.version = 0
+
+    def _keys(self, row):
+        name, unit = row['v_name'], row['v_unit']
+        keys = {name.strip().lower(), _normalize(name), _code(name)}
+        if unit:
+            keys.add(f'{name} ({unit})'.lower())
+            keys.add(f'{name} {unit}'.lower())
+            keys.add(_normalize(f'{name}{unit}'))
+        return keys
+
+    def _load(self):
+        ttl = getattr(settings, 'VARIABLE_CATALOG_TTL', 300)
+        state = self._state
+        if state is not None and time.monotonic() - self._loaded_at < ttl:
+            return state
+        with self._lock:
+            state = self._state
+            if state is not None and time.monotonic() - self._loaded_at < ttl:
+                return state
+            from .models import Variable
+
+            rows = list(Variable.objects.values('v_id', 'v_name', 'v_unit', 'v_type').order_by('v_id'))
+            index = {}
+            for row in rows:
+                for key in self._keys(row):
+                    index.setdefault(key, []).append(row['v_id'])
+            state = self._state = (rows, {row['v_id']: row for row in rows}, index)
+            self._loaded_at = time.monotonic()
+            self.version += 1
+            return state
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def rows(self):
+        return self._load()[0]
+
+    def get(self, v_id):
+        return self._load()[1].get(int(v_id))
+
+    def resolve(self, value):
+        """Turn a request parameter (id, name, alias or code) into a list of variable ids.
+
+        Unknown values resolve to an empty list, never to a fuzzy match.
+        """
+        if value is None or str(value).strip() == '':
+            return []
+        text = str(value).strip()
+        if text.isdigit():
+            return [int(text)]
+        index = self._load()[2]
+        for key in (text.lower(), _normalize(text), _code(text)):
+            ids = index.get(key)
+            if ids:
+                return list(ids)
+        return []
+
+
+catalog = VariableCatalog()
@@ -2,6 +2,9 @@
 ASGI config for vrisa_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests under ``/api/stream/`` (Server-Sent Events or WebSocket) are served by the
+live measurement hub; everything else goes to Django, with the async report views
+(``REPORTS_ASYNC``, see reports/concurrent.py) on the ``/api/reports/`` routes.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +15,20 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vrisa_backend.settings')
+# report routes use the async views, which run independent queries concurrently
+os.environ.setdefault('REPORTS_ASYNC', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from measurements.series_cache import series_cache  # noqa: E402  (needs the app registry)
+from measurements.stream import stream_app  # noqa: E402
+
+series_cache.warm_in_background()
+
+STREAM_PATH = '/api/stream/'
+
+
+async def application(scope, receive, send):
+    if scope['type'] in ('http', 'websocket') and scope.get('path', '').startswith(STREAM_PATH):
+        return await stream_app(scope, receive, send)
+    return await django_application(scope, receive, send)
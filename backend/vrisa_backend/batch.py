@@ -0,0 +1,194 @@
+"""`POST /api/batch/`: run several read-only API calls in one round trip.
+
+Body::
+
+    {"requests": [
+        {"id": "vars", "path": "/api/variables/"},
+        {"id": "air", "path": "/api/reports/air_quality/", "params": {"days": 7}},
+        {"id": "addr-3", "path": "/api/stations/3/address/"}
+    ]}
+
+Every sub-request is a GET to an existing `/api/` route, resolved and dispatched
+in-process with the caller's headers (so the same JWT applies). Sub-requests are
+independent and run concurrently on a small pool of long-lived threads, each keeping
+its own database connection between batches (`CONN_MAX_AGE`). The reply is keyed by
+id::
+
+    {"responses": {"vars": {"status": 200, "headers": {...}, "body": [...]}, ...}}
+
+A failing sub-request only fails its own entry.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import json
+import logging
+import threading
+from urllib.parse import urlencode, urlsplit
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from .db_router import read_intent
+from .middleware import wants_replica
+
+logger = logging.getLogger(__name__)
+
+BATCH_PATH = '/api/batch/'
+# parent META entries that describe the batch request itself, not the caller
+_REQUEST_META = {'REQUEST_METHOD', 'PATH_INFO', 'QUERY_STRING', 'CONTENT_TYPE', 'CONTENT_LENGTH'}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BATCH_MAX_WORKERS', 4), thread_name_prefix='api-batch'
+                )
+    return _pool
+
+
+class BatchItemError(ValueError):
+    """A sub-request that cannot be dispatched; reported with its own status."""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _sub_request(parent, path, query):
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = path
+    sub.META = {k: v for k, v in parent.META.items() if k not in _REQUEST_META and isinstance(v, str)}
+    sub.META.update(REQUEST_METHOD='GET', PATH_INFO=path, QUERY_STRING=query)
+    sub.GET = QueryDict(query)
+    sub.COOKIES = parent.COOKIES
+    for attr in ('user', 'session'):
+        if hasattr(parent, attr):
+            setattr(sub, attr, getattr(parent, attr))
+    return sub
+
+
+def _parse_item(item):
+    """(path, query string) of a sub-request."""
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        raise BatchItemError('cada solicitud necesita un "path"')
+    if str(item.get('method', 'GET')).upper() != 'GET':
+        raise BatchItemError('solo se admiten solicitudes GET', status.HTTP_405_METHOD_NOT_ALLOWED)
+    url = urlsplit(item['path'])
+    if url.scheme or url.netloc or not url.path.startswith('/api/') or url.path.startswith(BATCH_PATH):
+        raise BatchItemError('path debe ser una ruta de /api/')
+    query = url.query
+    if item.get('params'):
+        if not isinstance(item['params'], dict):
+            raise BatchItemError('params debe ser un objeto')
+        extra = urlencode(item['params'], doseq=True)
+        query = f'{query}&{extra}' if query else extra
+    return url.path, query
+
+
+async def _run_async_view(coroutine):
+    """(response, streamed chunks or None) of an async view, body included: its parts
+    belong to the event loop that ran it."""
+    response = await coroutine
+    if getattr(response, 'streaming', False) and response.is_async:
+        return response, [chunk async for chunk in response.streaming_content]
+    return response, None
+
+
+def _body(response, chunks=None):
+    if getattr(response, 'streaming', False):
+        # streamed JSON (the async reports) is collected; other streams cannot be batched
+        if not response.get('Content-Type', '').startswith('application/json'):
+            raise BatchItemError('las respuestas en streaming no se pueden agrupar')
+        if chunks is None:
+            chunks = list(response.streaming_content)
+        return json.loads(b''.join(chunks))
+    if hasattr(response, 'data'):
+        return response.data
+    content = response.content.decode(response.charset or 'utf-8')
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(content)
+    return content
+
+
+def _dispatch(parent, path, query):
+    try:
+        match = resolve(path)
+    except Resolver404:
+        raise BatchItemError('ruta no encontrada', status.HTTP_404_NOT_FOUND)
+    sub = _sub_request(parent, path, query)
+    sub.resolver_match = match
+    token = read_intent.set(wants_replica('GET', path))
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+        chunks = None
+        if asyncio.iscoroutine(response):
+            # async views (the reports under ASGI) run to completion on this thread
+            response, chunks = async_to_sync(_run_async_view)(response)
+    finally:
+        read_intent.reset(token)
+    body = _body(response, chunks)
+    headers = {k: v for k, v in response.items() if k.lower() != 'content-type'}
+    return {'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def _run(parent, path, query):
+    # same connection housekeeping Django does around a request
+    close_old_connections()
+    try:
+        return _dispatch(parent, path, query)
+    except BatchItemError as ex:
+        return {'status': ex.status_code, 'headers': {}, 'body': {'error': str(ex)}}
+    except Exception as ex:
+        logger.exception('Batch sub-request %s failed', path)
+        return {'status': status.HTTP_500_INTERNAL_SERVER_ERROR, 'headers': {}, 'body': {'error': str(ex)}}
+    finally:
+        close_old_connections()
+
+
+@api_view(['POST'])
+def batch(request):
+    items = request.data.get('requests') if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response({'error': 'Se esperaba una lista "requests"'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+    if len(items) > limit:
+        return Response({'error': f'Máximo {limit} solicitudes por lote'}, status=status.HTTP_400_BAD_REQUEST)
+
+    parsed = []
+    for index, item in enumerate(items):
+        item_id = str(item.get('id', index)) if isinstance(item, dict) else str(index)
+        try:
+            parsed.append((item_id, _parse_item(item)))
+        except BatchItemError as ex:
+            parsed.append((item_id, ex))
+    ids = [item_id for item_id, _p in parsed]
+    if len(set(ids)) != len(ids):
+        return Response({'error': 'ids duplicados en el lote'}, status=status.HTTP_400_BAD_REQUEST)
+
+    parent = request._request
+    futures = {
+        # the request's context goes along, so sub-request queries show in its timings
+        item_id: _executor().submit(contextvars.copy_context().run, _run, parent, *target)
+        for item_id, target in parsed if not isinstance(target, BatchItemError)
+    }
+    responses = {}
+    for item_id, target in parsed:
+        if isinstance(target, BatchItemError):
+            responses[item_id] = {'status': target.status_code, 'headers': {}, 'body': {'error': str(target)}}
+        else:
+            responses[item_id] = futures[item_id].result()
+    return Response({'responses': responses})
@@ -0,0 +1,100 @@
+"""Response compression negotiated from `Accept-Encoding` (see `CompressionMiddleware`).
+
+Brotli is preferred when the client accepts it and the `brotli` package is
+installed, gzip otherwise. Only compressible content types are touched, and
+responses shorter than `COMPRESSION_MIN_BYTES` are sent as they are. Streamed
+responses are compressed as they go, with a flush after every chunk so the
+client still receives each part of a streamed report when it is produced. The
+levels (`COMPRESSION_GZIP_LEVEL`, `COMPRESSION_BROTLI_QUALITY`) trade ratio for CPU
+and suit responses compressed on every request.
+
+Paths under `COMPRESSION_EXCLUDE_PATHS` (login and token responses, the admin) are
+never compressed: a secret next to attacker-controlled input in a compressed body
+leaks through its length (BREACH).
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+
+def accepted_encodings(header):
+    """{coding: q} of an Accept-Encoding header."""
+    out = {}
+    for item in header.split(','):
+        name, _sep, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            out[name.strip().lower()] = q
+    return out
+
+
+def choose(header):
+    """'br', 'gzip' or None for a request's Accept-Encoding."""
+    accepted = accepted_encodings(header or '')
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def compressible(response):
+    content_type = response.get('Content-Type', '').lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(coding, data):
+    if coding == 'br':
+        return brotli.compress(data, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+    return gzip.compress(data, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 5), mtime=0)
+
+
+class _StreamCompressor:
+    def __init__(self, coding):
+        if coding == 'br':
+            self._brotli = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+        else:
+            self._brotli = None
+            # wbits 31: gzip container
+            self._zlib = zlib.compressobj(getattr(settings, 'COMPRESSION_GZIP_LEVEL', 5), zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress_stream(coding, content):
+    compressor = _StreamCompressor(coding)
+    for data in content:
+        if data:
+            yield compressor.chunk(data)
+    yield compressor.finish()
+
+
+async def compress_stream_async(coding, content):
+    compressor = _StreamCompressor(coding)
+    async for data in content:
+        if data:
+            yield compressor.chunk(data)
+    yield compressor.finish()
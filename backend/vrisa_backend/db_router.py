@@ -0,0 +1,88 @@
+"""Send read-only request traffic to the optional `replica` database.
+
+`ReplicaReadMiddleware` marks GET/HEAD requests under `REPLICA_READ_PATHS` as read
+intent; while that flag is set, model reads go to `replica` as long as the replica
+is reachable and less than `REPLICA_MAX_LAG_SECONDS` behind. Everything else,
+including every write, uses `default`. Without a `replica` entry in `DATABASES`
+the router is a no-op.
+"""
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+
+read_intent = contextvars.ContextVar('read_intent', default=False)
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class LagGuard:
+    """Caches the replica's replay lag for `REPLICA_LAG_CHECK_SECONDS`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._usable = False
+        self.lag = None
+
+    def usable(self):
+        interval = getattr(settings, 'REPLICA_LAG_CHECK_SECONDS', 5)
+        if time.monotonic() - self._checked_at < interval:
+            return self._usable
+        with self._lock:
+            if time.monotonic() - self._checked_at < interval:
+                return self._usable
+            self._usable = self._check()
+            self._checked_at = time.monotonic()
+        return self._usable
+
+    def _check(self):
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 10)
+        try:
+            with connections[REPLICA].cursor() as cur:
+                cur.execute(LAG_SQL)
+                self.lag = float(cur.fetchone()[0])
+        except DatabaseError:
+            logger.warning('Replica unreachable; reading from the primary', exc_info=True)
+            self.lag = None
+            return False
+        if self.lag > max_lag:
+            logger.warning('Replica is %.1fs behind; reading from the primary', self.lag)
+            return False
+        return True
+
+
+lag_guard = LagGuard()
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if read_intent.get() and replica_configured() and lag_guard.usable():
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
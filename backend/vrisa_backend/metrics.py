@@ -0,0 +1,342 @@
+"""In-process metrics, exported on `/metrics` in the Prometheus text format.
+
+Metrics are declared once at import time, next to the code they measure::
+
+    ROWS = metrics.counter('vrisa_ingest_rows_total', 'Measurements stored', ['station'])
+    ROWS.inc(len(batch), station=station_id)
+
+Updating one is a dict update under the metric's own lock. Gauges can also be
+computed when the metrics are collected (`gauge(..., collect=fn)`, where `fn`
+returns `{label values: value}`).
+
+With several worker processes (gunicorn, uvicorn workers), set `METRICS_DIR` to
+a directory shared by the workers of one host. Every process writes its values
+to its own file there every `METRICS_FLUSH_SECONDS` (from a background thread and
+at exit), and a scrape, served by any worker, merges all files: counters and
+histograms are summed, gauges are summed over live processes. Counters and
+histograms of processes that exited are folded into `archived.json`, so totals
+never go backwards when workers are recycled. Without `METRICS_DIR` a scrape
+only sees the process that serves it.
+"""
+import atexit
+import bisect
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+ARCHIVE_FILE = 'archived.json'
+
+
+class Metric:
+    def __init__(self, name, kind, help_text, labelnames=(), buckets=None, collect=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+        self.collect = collect
+        # label values -> float, or for histograms [count per bucket..., +Inf count, sum]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+        _writer.touch()
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = float(value)
+        _writer.touch()
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+        _writer.touch()
+
+    def snapshot(self):
+        """[[label values, value]] as stored in the per-process files."""
+        if self.collect is not None:
+            try:
+                return [[list(k), float(v)] for k, v in self.collect().items()]
+            except Exception:
+                return []
+        with self._lock:
+            return [[list(k), list(v) if isinstance(v, list) else v] for k, v in self.values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # modules can be imported twice (autoreload, management commands): keep the first
+            return self.metrics.setdefault(metric.name, metric)
+
+    def snapshot(self):
+        return {
+            name: {'kind': m.kind, 'help': m.help, 'labels': list(m.labelnames),
+                   'buckets': list(m.buckets) if m.buckets else None, 'values': m.snapshot()}
+            for name, m in list(self.metrics.items())
+        }
+
+
+registry = Registry()
+
+
+def counter(name, help_text, labelnames=()):
+    return registry.register(Metric(name, 'counter', help_text, labelnames))
+
+
+def gauge(name, help_text, labelnames=(), collect=None):
+    return registry.register(Metric(name, 'gauge', help_text, labelnames, collect=collect))
+
+
+def histogram(name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+    return registry.register(Metric(name, 'histogram', help_text, labelnames, buckets=buckets))
+
+
+def _directory():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_json(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+class FileWriter:
+    """Flushes this process's snapshot to `METRICS_DIR` in the background."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # METRICS_DIR is read once per process: without it every later touch() is a no-op
+        self._resolved = False
+        self._path = None
+
+    def touch(self):
+        if not self._resolved:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._resolved:
+                return
+            self._resolved = True
+            directory = _directory()
+            if not directory:
+                return
+            os.makedirs(directory, exist_ok=True)
+            # pid and start time, so a recycled pid never reuses an old file
+            self._path = os.path.join(directory, f'{os.getpid()}-{int(time.time())}.json')
+            threading.Thread(target=self._loop, name='metrics-flush', daemon=True).start()
+            atexit.register(self.flush)
+
+    def _loop(self):
+        while True:
+            time.sleep(getattr(settings, 'METRICS_FLUSH_SECONDS', 5))
+            # collected gauges change without updates, so flush every time
+            self.flush()
+
+    def flush(self):
+        self.touch()
+        if self._path is None:
+            return
+        try:
+            _write_json(self._path, {'pid': os.getpid(), 'metrics': registry.snapshot()})
+        except OSError:
+            pass
+
+
+_writer = FileWriter()
+
+
+def _after_fork():
+    # a preloading master's values are its own; the worker starts from zero with its own file
+    _writer._reset()
+    for metric in registry.metrics.values():
+        metric.values.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _add(merged, name, meta, values, gauges):
+    if meta['kind'] == 'gauge' and not gauges:
+        return
+    entry = merged.setdefault(name, {**meta, 'values': {}})
+    for labels, value in values:
+        key = tuple(labels)
+        current = entry['values'].get(key)
+        if current is None:
+            entry['values'][key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            if len(value) == len(current):
+                entry['values'][key] = [a + b for a, b in zip(current, value)]
+        else:
+            entry['values'][key] = current + value
+
+
+def collect():
+    """{name: metric description with merged `values`} over every process writing to METRICS_DIR."""
+    directory = _directory()
+    if not directory:
+        merged = {}
+        for name, meta in registry.snapshot().items():
+            _add(merged, name, meta, meta['values'], gauges=True)
+        return merged
+
+    _writer.flush()
+    os.makedirs(directory, exist_ok=True)
+    merged = {}
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        # one scrape at a time folds dead processes into the archive
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        archive = _read_json(archive_path) or {'metrics': {}}
+        archived = {}
+        for name, meta in archive['metrics'].items():
+            _add(archived, name, meta, meta['values'], gauges=False)
+        dead = []
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json') or filename == ARCHIVE_FILE:
+                continue
+            path = os.path.join(directory, filename)
+            data = _read_json(path)
+            if data is None:
+                continue
+            alive = _pid_alive(data['pid'])
+            for name, meta in data['metrics'].items():
+                if alive:
+                    _add(merged, name, meta, meta['values'], gauges=True)
+                else:
+                    _add(archived, name, meta, meta['values'], gauges=False)
+            if not alive:
+                dead.append(path)
+        if dead:
+            _write_json(archive_path, {'metrics': {
+                name: {**meta, 'values': [[list(k), v] for k, v in meta['values'].items()]}
+                for name, meta in archived.items()
+            }})
+            for path in dead:
+                os.remove(path)
+    for name, meta in archived.items():
+        _add(merged, name, meta, [[list(k), v] for k, v in meta['values'].items()], gauges=False)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def render(merged):
+    """Prometheus text exposition of `collect()`'s result."""
+    lines = []
+    for name in sorted(merged):
+        meta = merged[name]
+        lines.append(f'# HELP {name} {meta["help"]}')
+        lines.append(f'# TYPE {name} {meta["kind"]}')
+        names = meta['labels']
+        for key in sorted(meta['values']):
+            value = meta['values'][key]
+            if meta['kind'] != 'histogram':
+                lines.append(f'{name}{_labels(names, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(meta['buckets']) + [math.inf], value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(names, key, ("le", _number(bound)))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(names, key)} {_number(value[-1])}')
+            lines.append(f'{name}_count{_labels(names, key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """`GET /metrics`; with `METRICS_TOKEN` set, scrapers send it as a bearer token."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+        return HttpResponse('forbidden\n', status=403, content_type='text/plain')
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
+
+
+# Shared by the in-process caches (series cache, institution dashboards)
+CACHE_REQUESTS = counter('vrisa_cache_requests_total', 'Cache lookups by cache and result (hit/miss)', ['cache', 'result'])
+
+
+def _pool_stats():
+    from django.db import connections
+
+    out = {}
+    for alias in connections:
+        if 'pool' not in connections.settings[alias].get('OPTIONS', {}):
+            continue
+        pool = connections[alias].pool
+        if pool is None:
+            continue
+        stats = pool.get_stats()
+        for key in ('pool_size', 'pool_available', 'requests_waiting'):
+            out[(alias, key)] = stats.get(key, 0)
+    return out
+
+
+DB_POOL = gauge(
+    'vrisa_db_pool_connections', 'psycopg pool state per database: pool_size, pool_available, requests_waiting (DB_POOL=1)',
+    ['database', 'state'], collect=_pool_stats,
+)
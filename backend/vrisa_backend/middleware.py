@@ -0,0 +1,152 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+from . import compression, timing
+from .db_router import read_intent
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def wants_replica(method, path):
+    paths = getattr(settings, 'REPLICA_READ_PATHS', ())
+    return method in READ_METHODS and path.startswith(tuple(paths))
+
+
+class ReplicaReadMiddleware:
+    """Flag read-only report and list requests so their queries can use the replica."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = read_intent.set(wants_replica(request.method, request.path))
+        try:
+            return self.get_response(request)
+        finally:
+            read_intent.reset(token)
+
+    async def __acall__(self, request):
+        token = read_intent.set(wants_replica(request.method, request.path))
+        try:
+            return await self.get_response(request)
+        finally:
+            read_intent.reset(token)
+
+
+class RequestTimingMiddleware:
+    """Count queries and time the view and rendering of every request (see `timing`).
+
+    Goes first in MIDDLEWARE so `total` covers the other middleware too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        timing.enable()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = timing.RequestTimings()
+        token = timing.activate(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.deactivate(token)
+        timing.finish(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        timings = timing.RequestTimings()
+        token = timing.activate(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.deactivate(token)
+        timing.finish(request, response, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = timing.current()
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses render after this hook returns
+        timings = timing.current()
+        if timings is not None:
+            timings.render_started = time.perf_counter()
+        return response
+
+
+class CompressionMiddleware:
+    """Compress responses with the best encoding the client accepts (see `compression`).
+
+    Goes right after RequestTimingMiddleware, so compression counts towards `total`
+    and every other middleware sees the uncompressed response.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if not compression.compressible(response) or response.has_header('Content-Encoding'):
+            return response
+        if request.path.startswith(tuple(getattr(settings, 'COMPRESSION_EXCLUDE_PATHS', ()))):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not response.streaming and len(response.content) < getattr(settings, 'COMPRESSION_MIN_BYTES', 1024):
+            return response
+        coding = compression.choose(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.compress_stream_async(coding, response.streaming_content)
+            else:
+                response.streaming_content = compression.compress_stream(coding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            body = compression.compress(coding, response.content)
+            if len(body) >= len(response.content):
+                return response
+            response.content = body
+            response['Content-Length'] = str(len(body))
+
+        # the compressed body is a different representation of the same resource
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
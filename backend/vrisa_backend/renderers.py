@@ -0,0 +1,123 @@
+"""Fast JSON rendering for the API.
+
+`FastJSONRenderer` is the default DRF renderer (see `REST_FRAMEWORK`). With orjson
+installed it encodes whole responses in C, datetimes included (UTC as `Z`, like
+DRF); Decimals become numbers as with DRF's encoder, and anything else orjson does
+not know goes through DRF's encoder. Without orjson it is DRF's `JSONRenderer`.
+`dumps()` is the same encoding for views that build their responses themselves.
+
+`stream_json_list()` writes a JSON array a chunk of rows at a time, so list
+endpoints never hold the whole list, or its serialized form, in memory;
+`stream_json_object()` does the same for one list member of an object. The rows are
+read while the body is sent, after the middleware returned, so every step runs in a
+copy of the request's context: replica routing and the request timings still apply
+to those queries.
+"""
+import contextvars
+from decimal import Decimal
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+_encoder = JSONEncoder()
+_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if orjson is not None else 0
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return _encoder.default(obj)
+
+
+def dumps(data, indent=False):
+    """Compact UTF-8 JSON bytes of `data`."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+    return json.dumps(
+        data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'), indent=2 if indent else None,
+    ).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        return dumps(data, indent=bool(indent))
+
+
+def _array_chunks(rows, serialize, chunk_size):
+    yield b'['
+    first = True
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) < chunk_size:
+            continue
+        yield (b'' if first else b',') + dumps(serialize(chunk))[1:-1]
+        first = False
+        chunk = []
+    if chunk:
+        yield (b'' if first else b',') + dumps(serialize(chunk))[1:-1]
+    yield b']'
+
+
+def _object_chunks(head, key, rows, serialize, chunk_size):
+    members = dumps(head)[1:-1]
+    yield b'{' + members + (b',' if members else b'') + dumps(key) + b':'
+    yield from _array_chunks(rows, serialize, chunk_size)
+    yield b'}'
+
+
+def _in_context(context, chunks):
+    while True:
+        chunk = context.run(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def _async_chunks(context, chunks):
+    # one database-bound step at a time on the request's sync thread
+    step = sync_to_async(context.run, thread_sensitive=True)
+    while True:
+        chunk = await step(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _streaming_response(request, chunks, headers=None):
+    context = contextvars.copy_context()
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        content = _async_chunks(context, chunks)
+    else:
+        content = _in_context(context, chunks)
+    return StreamingHttpResponse(content, content_type='application/json', headers=headers)
+
+
+def _chunk_size(chunk_size):
+    return chunk_size or getattr(settings, 'JSON_STREAM_CHUNK_ROWS', 2000)
+
+
+def stream_json_list(request, rows, serialize, chunk_size=None, headers=None):
+    """Streamed JSON array of `rows` (e.g. `queryset.iterator()`), `serialize(chunk)` giving the list
+    written for each chunk. Under ASGI the body is an async iterator, so it is not buffered."""
+    return _streaming_response(request, _array_chunks(rows, serialize, _chunk_size(chunk_size)), headers)
+
+
+def stream_json_object(request, head, key, rows, serialize, chunk_size=None, headers=None):
+    """Streamed JSON object: the members of `head`, then `key` holding the array `stream_json_list` writes."""
+    return _streaming_response(request, _object_chunks(head, key, rows, serialize, _chunk_size(chunk_size)), headers)
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from datetime import timedelta
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +46,7 @@ INSTALLED_APPS = [
     'measurements',
     'variables',
     'reports',
+    'benchmarks',
     'rest_framework',
     'corsheaders',
 ]
@@ -54,7 +57,11 @@ CORS_ALLOWED_ORIGINS = [
 # During local development, allow all origins to simplify testing from Expo/web
 if DEBUG:
     CORS_ALLOW_ALL_ORIGINS = True
+# Let browser clients read which storage tier answered a report (reports/planner.py)
+CORS_EXPOSE_HEADERS = ['X-Report-Tier', 'Server-Timing']
 MIDDLEWARE = [
+    'vrisa_backend.middleware.RequestTimingMiddleware',
+    'vrisa_backend.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -63,6 +70,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'vrisa_backend.middleware.ReplicaReadMiddleware',
 ]
 
 ROOT_URLCONF = 'vrisa_backend.urls'
@@ -96,9 +104,46 @@ DATABASES = {
         'PASSWORD': 'vr!sa2024',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Keep connections open between requests (checked before reuse) instead of
+        # connecting on every request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# DB_POOL=1 uses psycopg's connection pool instead (needs the psycopg_pool package);
+# Django requires CONN_MAX_AGE = 0 with a pool
+if os.environ.get('DB_POOL') == '1':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+    }}
+
+# Optional streaming replica for read-only report and list traffic (vrisa_backend/db_router.py)
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['vrisa_backend.db_router.ReadReplicaRouter']
+# GET/HEAD requests under these prefixes may read from the replica
+REPLICA_READ_PATHS = (
+    '/api/reports/',
+    '/api/variables/',
+    '/api/stations/',
+    '/api/sensors/',
+    '/api/measurements/',
+    '/api/institutions/',
+)
+# Fall back to the primary while the replica replays WAL more than this far behind
+# (keep it below SERIES_CACHE_COMMIT_LAG_SECONDS)
+REPLICA_MAX_LAG_SECONDS = 10
+REPLICA_LAG_CHECK_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -143,7 +188,183 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
   "DEFAULT_AUTHENTICATION_CLASSES": (
-    "rest_framework_simplejwt.authentication.JWTAuthentication",
+    # request.user is built from the token claims (users/tokens.py), no user query
+    "rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication",
+  ),
+  "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.AllowAny",),
+  # orjson-backed JSON (vrisa_backend/renderers.py)
+  "DEFAULT_RENDERER_CLASSES": (
+    "vrisa_backend.renderers.FastJSONRenderer",
+    "rest_framework.renderers.BrowsableAPIRenderer",
   ),
-  "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.AllowAny",)
 }
+
+# Alerts
+# Exceedances closer than this to an episode's last sample extend it instead of opening a new one
+ALERT_EVENT_GAP_MINUTES = 60
+
+# Live stream (/api/stream/, served by asgi.py)
+# Events buffered per client before the oldest are dropped
+STREAM_CLIENT_BUFFER = 256
+STREAM_KEEPALIVE_SECONDS = 15
+# Without the relay the hub is in-process: /api/stream/ and all ingest must run in a
+# single ASGI process. STREAM_RELAY=1 relays events through PostgreSQL LISTEN/NOTIFY
+# on STREAM_RELAY_CHANNEL, so several WSGI/ASGI workers can ingest and serve streams.
+STREAM_RELAY = os.environ.get('STREAM_RELAY') == '1'
+STREAM_RELAY_CHANNEL = 'vrisa_stream'
+
+# Variable catalog (variables/catalog.py): seconds before a worker reloads the table
+# even without a local save/delete signal
+VARIABLE_CATALOG_TTL = 300
+
+# Measurement partitions (python manage.py manage_partitions, run e.g. daily from cron)
+MEASUREMENT_PARTITIONS_AHEAD = 3
+# Months of raw measurements to keep; None keeps every partition
+MEASUREMENT_RETENTION_MONTHS = None
+
+# Tiered retention (python manage.py compact_measurements), keyed by Variable.v_type.
+# raw_days: raw rows older than this are folded into measurement_hourly/measurement_daily
+#           and deleted (None keeps raw rows forever)
+# hourly_days: hourly rollups older than this are deleted; daily rollups are kept forever
+# archive: write the raw rows to gzip CSV files under MEASUREMENT_ARCHIVE_DIR before deleting
+# Keep MEASUREMENT_RETENTION_MONTHS longer than every raw_days so partitions are compacted before they are dropped.
+# Off until raw_days is set; check first with compact_measurements --dry-run. For example:
+#   'default': {'raw_days': 90, 'hourly_days': 730, 'archive': True},
+#   'meteorologica': {'raw_days': 30, 'hourly_days': 365, 'archive': False},
+MEASUREMENT_RETENTION = {
+    'default': {'raw_days': None, 'hourly_days': None, 'archive': True},
+}
+MEASUREMENT_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# Recent-series cache (measurements/series_cache.py, needs numpy)
+SERIES_CACHE_ENABLED = True
+SERIES_CACHE_HOURS = 24 * 7
+# Upper bound of points kept per sensor/variable series (1/min for two weeks)
+SERIES_CACHE_MAX_POINTS = 20160
+SERIES_CACHE_WARM_ON_START = True
+# How often a worker looks for rows ingested by other workers, and how long
+# it waits before assuming a transaction holding a lower m_id has committed
+SERIES_CACHE_SYNC_SECONDS = 1.0
+SERIES_CACHE_COMMIT_LAG_SECONDS = 30
+
+# Columnar archive of sealed months (python manage.py export_columnar, needs numpy);
+# answers days=all reports. None disables it.
+COLUMNAR_ARCHIVE_DIR = BASE_DIR / 'columnar'
+
+# Station area filters (stations/geo.py): radius used by ?near=lat,lon without ?radius=
+STATION_NEAR_DEFAULT_KM = 5
+
+# Nearest stations (/api/stations/nearest/, stations/nearest.py): seconds before a worker
+# rebuilds its KD-tree even without a local save/delete signal, and the largest k served
+STATION_INDEX_TTL = 60
+STATION_NEAREST_MAX_K = 50
+# Readings older than this are not reported as a station's latest (measurements/queries.py)
+LATEST_READINGS_HOURS = 24
+
+# Batched API calls (/api/batch/, vrisa_backend/batch.py)
+BATCH_MAX_REQUESTS = 20
+# Threads running sub-requests concurrently; each keeps its own DB connection
+BATCH_MAX_WORKERS = 4
+
+# Signed tokens issued by /api/users/login/ and /api/users/token/refresh/ (users/tokens.py)
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.environ.get('JWT_ACCESS_MINUTES', 30))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.environ.get('JWT_REFRESH_DAYS', 7))),
+    'USER_ID_FIELD': 'id',
+    'USER_ID_CLAIM': 'user_id',
+    'TOKEN_USER_CLASS': 'users.tokens.ClaimsUser',
+}
+
+# Institution dashboard (/api/institutions/{id}/dashboard/): seconds a per-institution
+# snapshot is served from the cache, and the window used for data completeness
+INSTITUTION_DASHBOARD_CACHE_SECONDS = 30
+DASHBOARD_COVERAGE_HOURS = 24
+
+# Sensor health checks (python manage.py check_sensor_health, sensors/health.py, needs numpy)
+# First scan of a series looks back this far
+HEALTH_INITIAL_HOURS = 24
+# Cadence assumed for a series until it has enough readings to measure it
+HEALTH_DEFAULT_CADENCE_SECONDS = 60
+# Flatline: this many consecutive readings with a standard deviation <= epsilon
+HEALTH_FLATLINE_SAMPLES = 30
+HEALTH_FLATLINE_EPSILON = 1e-6
+# Flat runs at these values are expected (e.g. precipitation at 0)
+HEALTH_FLATLINE_ALLOWED_VALUES = (0,)
+# Spike (Hampel): deviation from the median of the previous readings, in robust sigmas
+HEALTH_SPIKE_WINDOW = 30
+HEALTH_SPIKE_SIGMAS = 6.0
+# A series with a spike this recent reports status 'spike'
+HEALTH_SPIKE_RECENT_HOURS = 6
+# Dropout: gap longer than this many times the series' median cadence
+HEALTH_DROPOUT_FACTOR = 5
+# Closed health events older than this are deleted; None keeps them
+HEALTH_EVENT_RETENTION_DAYS = 90
+# Days of events returned by /api/sensors/{id}/health/
+HEALTH_EVENT_DAYS = 7
+
+# Calibration drift against neighbouring stations (python manage.py check_sensor_drift,
+# sensors/drift.py, needs numpy)
+# Days of hourly means compared, and the trailing days averaged for the current bias
+DRIFT_WINDOW_DAYS = 30
+DRIFT_RECENT_DAYS = 7
+# Neighbours per series: the closest stations within the radius measuring the same
+# variable, picked among this many candidates
+DRIFT_NEIGHBOURS = 3
+DRIFT_CANDIDATES = 15
+DRIFT_RADIUS_KM = 25
+# A day counts with at least this many overlapping hours; a trend needs this many days
+DRIFT_MIN_HOURS = 12
+DRIFT_MIN_DAYS = 7
+# Flag when the bias trend over the window exceeds this share of the neighbours' level,
+# and only with at least this many usable neighbour pairs (with two, the median is
+# the mean and one faulty neighbour is enough to flag the sensor)
+DRIFT_RELATIVE_LIMIT = 0.1
+DRIFT_MIN_PAIRS = 3
+
+# Calibration corrections applied when measurements are read (sensors/calibration.py):
+# seconds other workers keep serving their copy of the correction table
+CALIBRATION_TTL = 60
+
+# Benchmarks (python manage.py bench_load / bench_reports, benchmarks/): scratch database
+# filled with synthetic data, never the main one, and the slowdown allowed against a baseline
+BENCH_DATABASE_NAME = os.environ.get('BENCH_DB_NAME', 'vrisa_bench')
+BENCH_TOLERANCE = 0.25
+
+# Request instrumentation (vrisa_backend/timing.py): Server-Timing header on every
+# response and a JSON log record for slow requests and likely N+1 query patterns
+REQUEST_TIMING_ENABLED = os.environ.get('REQUEST_TIMING', '1') != '0'
+REQUEST_TIMING_HEADER = True
+# Origin allowed to read Server-Timing from the browser (the frontend), if any
+REQUEST_TIMING_ALLOW_ORIGIN = os.environ.get('TIMING_ALLOW_ORIGIN') or None
+REQUEST_SLOW_MS = 1000
+# Queries of the same shape in one request reported as a likely N+1
+REQUEST_REPEATED_QUERIES = 10
+# Query shapes included in a slow request record
+REQUEST_SLOW_LOG_QUERIES = 5
+
+# Prometheus metrics on /metrics (vrisa_backend/metrics.py). With several worker processes
+# set METRICS_DIR to a directory shared by the workers of the host; each one writes its
+# values there every METRICS_FLUSH_SECONDS and any of them serves the merged totals
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_SECONDS = 5
+# Bearer token required from scrapers, if set
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+# Async report views (reports/concurrent.py): on by default under asgi.py, REPORTS_ASYNC=0
+# keeps the sync views there. Threads (each with its own database connection) a worker
+# uses to run the independent queries of reports concurrently
+REPORTS_ASYNC = os.environ.get('REPORTS_ASYNC') == '1'
+REPORT_QUERY_WORKERS = int(os.environ.get('REPORT_QUERY_WORKERS', 8))
+
+# JSON responses (vrisa_backend/renderers.py): encoded with orjson when it is installed.
+# List endpoints stream their arrays, serializing this many rows at a time
+JSON_STREAM_CHUNK_ROWS = 2000
+
+# Response compression (vrisa_backend/compression.py): brotli when the client accepts it
+# and the brotli package is installed, gzip otherwise, for bodies of COMPRESSION_MIN_BYTES
+# or more. Levels tuned for per-request compression rather than the best ratio
+COMPRESSION_MIN_BYTES = 1024
+COMPRESSION_GZIP_LEVEL = 5
+COMPRESSION_BROTLI_QUALITY = 4
+# Never compressed: responses carrying credentials (BREACH)
+COMPRESSION_EXCLUDE_PATHS = ('/api/users/', '/admin/')
@@ -0,0 +1,43 @@
+from unittest import mock
+import gzip
+
+from django.test import SimpleTestCase
+
+from . import compression
+
+
+class ChooseTests(SimpleTestCase):
+    def choose(self, header, brotli=True):
+        with mock.patch.object(compression, 'brotli', object() if brotli else None):
+            return compression.choose(header)
+
+    def test_prefers_brotli_when_available(self):
+        self.assertEqual(self.choose('gzip, deflate, br'), 'br')
+        self.assertEqual(self.choose('gzip, deflate, br', brotli=False), 'gzip')
+
+    def test_honours_q_values(self):
+        self.assertEqual(self.choose('br;q=0, gzip'), 'gzip')
+        self.assertEqual(self.choose('br;q=0, gzip;q=0'), None)
+        self.assertEqual(self.choose('gzip;q=0.5'), 'gzip')
+        self.assertEqual(self.choose('br;q=bad, gzip'), 'gzip')
+
+    def test_wildcard_and_identity(self):
+        self.assertEqual(self.choose('*'), 'br')
+        self.assertEqual(self.choose('*', brotli=False), 'gzip')
+        self.assertEqual(self.choose('*;q=0, gzip'), 'gzip')
+        self.assertEqual(self.choose('identity'), None)
+        self.assertEqual(self.choose(''), None)
+        self.assertEqual(self.choose(None), None)
+
+    def test_names_are_case_insensitive(self):
+        self.assertEqual(self.choose(' GZip ', brotli=False), 'gzip')
+
+
+class CompressStreamTests(SimpleTestCase):
+    def test_gzip_stream_round_trips_and_flushes_every_chunk(self):
+        parts = [b'{"a":', b'', b'[1,2,3]', b'}']
+        chunks = list(compression.compress_stream('gzip', parts))
+        self.assertEqual(gzip.decompress(b''.join(chunks)), b''.join(parts))
+        # every non-empty part produced output of its own, plus the trailer
+        self.assertEqual(len(chunks), 4)
+        self.assertTrue(all(chunks[:-1]))
@@ -0,0 +1,268 @@
+"""Per-request instrumentation: SQL queries, database time, view and render time.
+
+`RequestTimingMiddleware` (vrisa_backend/middleware.py) opens a `RequestTimings`
+for every request in a context variable. Every database connection carries an
+execute wrapper (installed when the connection is created) that adds each query's
+SQL and duration to the current request, if there is one; outside requests it only
+reads the context variable. Batch sub-requests run with the batch request's
+context, so their queries count towards it.
+
+The request is split into:
+
+- `db`: time spent executing SQL (psycopg fetches results during execute, except
+  for server-side cursors), with the query count
+- `app`: the view minus its database time (parsing, NumPy aggregation, serializers)
+- `render`: DRF rendering the response body, after the view returned
+- any `span()` a view opened (e.g. `cache` for the recent-series cache)
+- `total`: the whole request as seen by the middleware
+
+These go to the client in a `Server-Timing` header and the total to the request
+latency histograms on `/metrics` (report views add their window class, tiers and
+row counts with `note()`). Queries are grouped by shape
+(literals and `IN (...)` lists collapsed); a shape repeated
+`REQUEST_REPEATED_QUERIES` times is a likely N+1. Requests slower than
+`REQUEST_SLOW_MS`, or with such a repeated shape, are logged as a JSON record with
+the phases and the worst query shapes.
+"""
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import FileResponse
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = metrics.histogram('vrisa_http_request_seconds', 'Request latency by view', ['view', 'method', 'status'])
+REPORT_SECONDS = metrics.histogram(
+    'vrisa_report_seconds', 'Report latency by report, window class and storage tiers', ['report', 'window', 'tier'],
+)
+REPORT_ROWS = metrics.histogram(
+    'vrisa_report_rows', 'Readings aggregated per report, over all tiers', ['report', 'window'],
+    buckets=(100, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8),
+)
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+_IN_LIST_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_LOG_CHARS = 500
+
+
+def shape(sql):
+    """SQL with literals and parameter lists collapsed, so repeated queries group together."""
+    return _LITERAL_RE.sub('?', _IN_LIST_RE.sub('(...)', sql))
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.render_started = None
+        self.queries = 0
+        self.db_ms = 0.0
+        # sql -> [count, total ms, max ms]
+        self.by_sql = {}
+        self.spans = {}
+        self.notes = {}
+        # batch sub-requests add queries from several threads
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, ms):
+        with self._lock:
+            self.queries += 1
+            self.db_ms += ms
+            entry = self.by_sql.get(sql)
+            if entry is None:
+                self.by_sql[sql] = [1, ms, ms]
+            else:
+                entry[0] += 1
+                entry[1] += ms
+                entry[2] = max(entry[2], ms)
+
+    def add_span(self, name, ms):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def shapes(self):
+        """[{sql, count, total_ms, max_ms}] per query shape, slowest in total first."""
+        grouped = {}
+        with self._lock:
+            items = list(self.by_sql.items())
+        for sql, (count, total, worst) in items:
+            entry = grouped.setdefault(shape(sql), [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += total
+            entry[2] = max(entry[2], worst)
+        out = [
+            {'sql': sql[:SQL_LOG_CHARS], 'count': count, 'total_ms': round(total, 2), 'max_ms': round(worst, 2)}
+            for sql, (count, total, worst) in grouped.items()
+        ]
+        out.sort(key=lambda s: s['total_ms'], reverse=True)
+        return out
+
+    def phases(self, ended):
+        """{phase: ms} of a request that ended at `ended` (perf_counter)."""
+        phases = {'db': self.db_ms}
+        if self.view_started is not None:
+            view_ended = self.render_started or ended
+            # clamped: concurrent batch sub-requests can add up to more DB time than wall time
+            phases['app'] = max(0.0, (view_ended - self.view_started) * 1000 - self.db_ms)
+        if self.render_started is not None:
+            phases['render'] = (ended - self.render_started) * 1000
+        phases.update(self.spans)
+        phases['total'] = (ended - self.started) * 1000
+        return {name: round(ms, 2) for name, ms in phases.items()}
+
+    def server_timing(self, phases):
+        parts = []
+        for name, ms in phases.items():
+            desc = f';desc="{self.queries} {"query" if self.queries == 1 else "queries"}"' if name == 'db' else ''
+            parts.append(f'{name};dur={ms}{desc}')
+        return ', '.join(parts)
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, (time.perf_counter() - started) * 1000)
+
+
+def _install(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def enable():
+    """Attach the query wrapper to every connection, present and future."""
+    connection_created.connect(_install, dispatch_uid='vrisa_request_timing')
+    for conn in connections.all(initialized_only=True):
+        _install(connection=conn)
+
+
+def current():
+    return _current.get()
+
+
+def activate(timings):
+    return _current.set(timings)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def note(key, value):
+    """Attach a value to the current request, for the metrics recorded when it ends."""
+    timings = _current.get()
+    if timings is not None:
+        timings.notes[key] = value
+
+
+@contextmanager
+def span(name):
+    """Time a block of the current request; it shows up as its own Server-Timing entry."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_span(name, (time.perf_counter() - started) * 1000)
+
+
+def _observe(request, response, timings, seconds):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match is not None else 'unmatched'
+    REQUEST_SECONDS.observe(seconds, view=view, method=request.method, status=f'{response.status_code // 100}xx')
+    if view.startswith('reports-'):
+        report = view[len('reports-'):]
+        window = timings.notes.get('window', 'none')
+        REPORT_SECONDS.observe(seconds, report=report, window=window, tier=timings.notes.get('tier', 'none'))
+        if 'rows' in timings.notes:
+            REPORT_ROWS.observe(timings.notes['rows'], report=report, window=window)
+
+
+def _set_header(response, timings, phases):
+    if getattr(settings, 'REQUEST_TIMING_HEADER', True):
+        response['Server-Timing'] = timings.server_timing(phases)
+        allow_origin = getattr(settings, 'REQUEST_TIMING_ALLOW_ORIGIN', None)
+        if allow_origin:
+            response['Timing-Allow-Origin'] = allow_origin
+
+
+def _when_streamed(content, callback):
+    try:
+        yield from content
+    finally:
+        callback()
+
+
+async def _when_streamed_async(content, callback):
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        callback()
+
+
+def finish(request, response, timings):
+    """Add the Server-Timing header, record the request metrics and log the request
+    if it was slow or repeated a query.
+
+    Streamed responses (e.g. the async reports) get a header with the phases up to
+    their first byte; metrics and the slow log wait until the body is complete.
+    """
+    phases = timings.phases(time.perf_counter())
+    _set_header(response, timings, phases)
+    if getattr(response, 'streaming', False) and not isinstance(response, FileResponse):
+        def done():
+            _record(request, response, timings, timings.phases(time.perf_counter()))
+
+        if response.is_async:
+            response.streaming_content = _when_streamed_async(response.streaming_content, done)
+        else:
+            response.streaming_content = _when_streamed(response.streaming_content, done)
+        return
+    _record(request, response, timings, phases)
+
+
+def _record(request, response, timings, phases):
+    _observe(request, response, timings, phases['total'] / 1000)
+    threshold = getattr(settings, 'REQUEST_REPEATED_QUERIES', 10)
+    slow = phases['total'] >= getattr(settings, 'REQUEST_SLOW_MS', 1000)
+    if not slow and timings.queries < threshold:
+        return
+    shapes = timings.shapes()
+    repeated = [s for s in shapes if s['count'] >= threshold]
+    if not slow and not repeated:
+        return
+    record = {
+        'method': request.method,
+        'path': request.path,
+        'query': request.META.get('QUERY_STRING', ''),
+        'status': response.status_code,
+        'phases_ms': phases,
+        'queries': timings.queries,
+        'worst_queries': shapes[:getattr(settings, 'REQUEST_SLOW_LOG_QUERIES', 5)],
+        'repeated_queries': repeated,
+    }
+    logger.warning(
+        '%s request %s %s: %s', 'Slow' if slow else 'N+1', request.method, request.path,
+        json.dumps(record, default=str), extra={'request_timing': record},
+    )
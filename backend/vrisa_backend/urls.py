@@ -22,6 +22,8 @@ from institutions.views import register_institution_with_user, approve_instituti
 from stations.views import StationViewSet
 from sensors.views import SensorViewSet
 from measurements.views import MeasurementViewSet
+from .batch import batch
+from .metrics import metrics_view
 
 router = DefaultRouter()
 router.register(r'institutions', InstitutionViewSet, basename='institutions')
@@ -32,9 +34,11 @@ router.register(r'measurements', MeasurementViewSet, basename='measurements')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view),
     path('api/users/', include('users.urls')),
     path('api/institutions/register_with_user/', register_institution_with_user),
     path('api/institutions/approve/<int:institution_id>/', approve_institution),
+    path('api/batch/', batch),
     path('api/', include(router.urls)),
     path('api/variables/', include('variables.urls')),
     path('api/reports/', include('reports.urls')),
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vrisa_backend.settings')
 
 application = get_wsgi_application()
+
+from measurements.series_cache import series_cache  # noqa: E402  (needs the app registry)
+
+series_cache.warm_in_background()
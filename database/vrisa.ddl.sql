@@ -8,6 +8,13 @@ CREATE TABLE users (
     u_type VARCHAR(25) NOT NULL, --tipo de usuario: admin, ciudadano, institucion, administrador_estacion
     validated BOOLEAN DEFAULT FALSE
 );
+-- refresh tokens ya canjeados (rotacion): un jti repetido se rechaza; las filas vencidas se borran al refrescar
+CREATE TABLE used_refresh_token(
+    jti VARCHAR(64) PRIMARY KEY,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    expires_at TIMESTAMP NOT NULL
+);
+CREATE INDEX used_refresh_token_expires_idx ON used_refresh_token (expires_at);
 ----------------- relaciones de contacto ------------------------
 CREATE TABLE email (
     email_id SERIAL PRIMARY KEY,
@@ -45,8 +52,14 @@ CREATE TABLE station(
     maintenance_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     admin_id INT REFERENCES users(id),
     s_state VARCHAR(20) NOT NULL, -- activo, inactivo, mantenimiento
-    institution_id INT REFERENCES institution(institution_id) ON DELETE SET NULL
+    institution_id INT REFERENCES institution(institution_id) ON DELETE SET NULL,
+    -- derivados de lat/lon por el trigger trg_station_geo_sync
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    geohash VARCHAR(12)
 );
+CREATE INDEX station_lat_lon_idx ON station (latitude, longitude);
+CREATE INDEX station_geohash_idx ON station (geohash varchar_pattern_ops);
 ------------------ sensores ------------------------
 CREATE TABLE sensor(
     sensor_id SERIAL PRIMARY KEY,
@@ -64,12 +77,74 @@ CREATE TABLE variable(
     v_type VARCHAR(50) NOT NULL
 );
 ------------------ mediciones ------------------------
+-- particionada por mes sobre m_date (la llave primaria debe incluir la columna de particion)
+-- las particiones futuras y la retencion se manejan con `python manage.py manage_partitions`
 CREATE TABLE measurement(
-    m_id SERIAL PRIMARY KEY,
+    m_id SERIAL,
     m_date TIMESTAMP NOT NULL,
     m_value DECIMAL(10,4) NOT NULL,
     sensor_id INT REFERENCES sensor(sensor_id) ON DELETE RESTRICT,
-    variable_id INT REFERENCES variable(v_id) ON DELETE RESTRICT
+    variable_id INT REFERENCES variable(v_id) ON DELETE RESTRICT,
+    PRIMARY KEY (m_id, m_date)
+) PARTITION BY RANGE (m_date);
+-- filtros de los reportes: variable + sensor + rango de fechas
+CREATE INDEX measurement_var_sensor_idx ON measurement (variable_id, sensor_id, m_date);
+-- ultima medicion por sensor/estacion
+CREATE INDEX measurement_sensor_date_idx ON measurement (sensor_id, m_date);
+CREATE INDEX measurement_date_brin ON measurement USING BRIN (m_date);
+-- recibe filas fuera de las particiones mensuales existentes
+CREATE TABLE measurement_default PARTITION OF measurement DEFAULT;
+-- particiones mensuales iniciales: desde 2024-01 hasta 3 meses despues del mes actual
+DO $$
+DECLARE
+    p_month DATE := DATE '2024-01-01';
+BEGIN
+    WHILE p_month <= date_trunc('month', now())::date + INTERVAL '3 months' LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF measurement FOR VALUES FROM (%L) TO (%L)',
+            'measurement_y' || to_char(p_month, 'YYYY') || 'm' || to_char(p_month, 'MM'),
+            p_month,
+            (p_month + INTERVAL '1 month')::date
+        );
+        p_month := (p_month + INTERVAL '1 month')::date;
+    END LOOP;
+END
+$$;
+------------------ agregados de mediciones ------------------------
+-- nivel compactado: `python manage.py compact_measurements` mueve aqui las mediciones
+-- antiguas (segun MEASUREMENT_RETENTION por tipo de variable) y las borra de measurement
+CREATE TABLE measurement_hourly(
+    sensor_id INT NOT NULL REFERENCES sensor(sensor_id) ON DELETE RESTRICT,
+    variable_id INT NOT NULL REFERENCES variable(v_id) ON DELETE RESTRICT,
+    bucket TIMESTAMP NOT NULL, -- inicio de la hora
+    samples INT NOT NULL,
+    value_sum DECIMAL(18,4) NOT NULL,
+    value_min DECIMAL(10,4) NOT NULL,
+    value_max DECIMAL(10,4) NOT NULL,
+    PRIMARY KEY (variable_id, sensor_id, bucket)
+);
+CREATE INDEX measurement_hourly_bucket_brin ON measurement_hourly USING BRIN (bucket);
+
+CREATE TABLE measurement_daily(
+    sensor_id INT NOT NULL REFERENCES sensor(sensor_id) ON DELETE RESTRICT,
+    variable_id INT NOT NULL REFERENCES variable(v_id) ON DELETE RESTRICT,
+    bucket TIMESTAMP NOT NULL, -- inicio del dia
+    samples INT NOT NULL,
+    value_sum DECIMAL(18,4) NOT NULL,
+    value_min DECIMAL(10,4) NOT NULL,
+    value_max DECIMAL(10,4) NOT NULL,
+    PRIMARY KEY (variable_id, sensor_id, bucket)
+);
+CREATE INDEX measurement_daily_bucket_brin ON measurement_daily USING BRIN (bucket);
+------------------ revisiones de mediciones ------------------------
+-- mediciones editadas o borradas (valores anteriores y nuevos); cada worker relee esas
+-- series en su cache (measurements/series_cache.py)
+CREATE TABLE measurement_revision(
+    revision_id BIGSERIAL PRIMARY KEY,
+    sensor_id INT NOT NULL REFERENCES sensor(sensor_id) ON DELETE CASCADE,
+    variable_id INT NOT NULL REFERENCES variable(v_id) ON DELETE RESTRICT,
+    m_date TIMESTAMP NOT NULL,
+    revised_at TIMESTAMP NOT NULL
 );
 ------------------ reportes ------------------------
 CREATE TABLE report(
@@ -91,4 +166,76 @@ CREATE TABLE report_log (
     FOREIGN KEY (institution_id) REFERENCES institution (institution_id) ON DELETE RESTRICT 
 );
 ------ se utilizara un trigger para insertar en el log cada vez que se cree un reporte
--------------------------------------------------------------------------------------
\ No newline at end of file
+-------------------------------------------------------------------------------------
+------------------ eventos de alerta ------------------------
+-- episodios de superacion de umbrales, se actualizan al ingresar mediciones
+CREATE TABLE alert_event(
+    event_id BIGSERIAL PRIMARY KEY,
+    station_id INT NOT NULL REFERENCES station(station_id) ON DELETE CASCADE,
+    variable_id INT NOT NULL REFERENCES variable(v_id) ON DELETE RESTRICT,
+    severity VARCHAR(20) NOT NULL, -- info, warning, critical
+    first_seen TIMESTAMP NOT NULL,
+    last_seen TIMESTAMP NOT NULL,
+    peak_value DECIMAL(10,4) NOT NULL,
+    samples INT NOT NULL DEFAULT 1
+);
+CREATE INDEX alert_event_open_idx ON alert_event (station_id, variable_id, severity, last_seen DESC);
+CREATE INDEX alert_event_last_seen_idx ON alert_event (last_seen DESC);
+------------------ salud de sensores ------------------------
+-- estado por sensor/variable y punto de control del ultimo analisis (`python manage.py check_sensor_health`)
+CREATE TABLE sensor_health(
+    sensor_id INT NOT NULL REFERENCES sensor(sensor_id) ON DELETE CASCADE,
+    variable_id INT NOT NULL REFERENCES variable(v_id) ON DELETE RESTRICT,
+    status VARCHAR(20) NOT NULL DEFAULT 'ok', -- ok, spike, flatline, dropout
+    checked_until TIMESTAMP NOT NULL,
+    cadence_seconds DOUBLE PRECISION,
+    flatline_since TIMESTAMP,
+    last_spike_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (sensor_id, variable_id)
+);
+-- picos puntuales y episodios de valor constante o de datos faltantes (ended_at NULL = en curso)
+CREATE TABLE sensor_health_event(
+    event_id BIGSERIAL PRIMARY KEY,
+    sensor_id INT NOT NULL REFERENCES sensor(sensor_id) ON DELETE CASCADE,
+    variable_id INT NOT NULL REFERENCES variable(v_id) ON DELETE RESTRICT,
+    kind VARCHAR(20) NOT NULL, -- spike, flatline, dropout
+    started_at TIMESTAMP NOT NULL,
+    ended_at TIMESTAMP,
+    value DOUBLE PRECISION,
+    score DOUBLE PRECISION
+);
+CREATE INDEX sensor_health_event_idx ON sensor_health_event (sensor_id, started_at DESC);
+------------------ deriva de calibracion ------------------------
+-- tendencia del sesgo de cada sensor/variable frente a estaciones vecinas (`python manage.py check_sensor_drift`)
+CREATE TABLE sensor_drift(
+    sensor_id INT NOT NULL REFERENCES sensor(sensor_id) ON DELETE CASCADE,
+    variable_id INT NOT NULL REFERENCES variable(v_id) ON DELETE RESTRICT,
+    computed_at TIMESTAMP NOT NULL,
+    window_start TIMESTAMP NOT NULL,
+    window_end TIMESTAMP NOT NULL,
+    neighbours INT NOT NULL,
+    bias DOUBLE PRECISION,
+    slope_per_day DOUBLE PRECISION,
+    level DOUBLE PRECISION,
+    relative_drift DOUBLE PRECISION,
+    flagged BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (sensor_id, variable_id)
+);
+------------------ correcciones de calibracion ------------------------
+-- ganancia/desplazamiento por sensor y rango de tiempo, aplicados al leer (measurement conserva el valor crudo);
+-- variable_id NULL = todas las variables del sensor; la correccion mas reciente que cubre una lectura gana
+CREATE TABLE calibration_correction(
+    correction_id SERIAL PRIMARY KEY,
+    sensor_id INT NOT NULL REFERENCES sensor(sensor_id) ON DELETE CASCADE,
+    variable_id INT REFERENCES variable(v_id) ON DELETE RESTRICT,
+    valid_from TIMESTAMP NOT NULL,
+    valid_to TIMESTAMP,
+    gain DOUBLE PRECISION NOT NULL DEFAULT 1,
+    value_offset DOUBLE PRECISION NOT NULL DEFAULT 0,
+    note TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    revoked_at TIMESTAMP,
+    CHECK (valid_to IS NULL OR valid_to > valid_from)
+);
+CREATE INDEX calibration_correction_sensor_idx ON calibration_correction (sensor_id, valid_from);
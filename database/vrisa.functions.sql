@@ -232,4 +232,56 @@ BEGIN
 
 END;
 $$ LANGUAGE plpgsql;
--------------------------------------------------------------------------------------
\ No newline at end of file
+-------------------------------------------------------------------------------------
+---------------------- geohash de una coordenada (igual a stations/geo.py) ------------------------
+CREATE OR REPLACE FUNCTION geohash_encode(
+    p_lat DOUBLE PRECISION,
+    p_lon DOUBLE PRECISION,
+    p_precision INT DEFAULT 9
+)
+RETURNS VARCHAR AS $$
+DECLARE
+    base32 CONSTANT TEXT := '0123456789bcdefghjkmnpqrstuvwxyz';
+    lat_min DOUBLE PRECISION := -90;
+    lat_max DOUBLE PRECISION := 90;
+    lon_min DOUBLE PRECISION := -180;
+    lon_max DOUBLE PRECISION := 180;
+    mid DOUBLE PRECISION;
+    result TEXT := '';
+    ch INT := 0;
+    bits INT := 0;
+    even BOOLEAN := TRUE;
+BEGIN
+    IF p_lat IS NULL OR p_lon IS NULL THEN
+        RETURN NULL;
+    END IF;
+    WHILE length(result) < p_precision LOOP
+        ch := ch << 1;
+        IF even THEN
+            mid := (lon_min + lon_max) / 2;
+            IF p_lon >= mid THEN
+                ch := ch | 1;
+                lon_min := mid;
+            ELSE
+                lon_max := mid;
+            END IF;
+        ELSE
+            mid := (lat_min + lat_max) / 2;
+            IF p_lat >= mid THEN
+                ch := ch | 1;
+                lat_min := mid;
+            ELSE
+                lat_max := mid;
+            END IF;
+        END IF;
+        even := NOT even;
+        bits := bits + 1;
+        IF bits = 5 THEN
+            result := result || substr(base32, ch + 1, 1);
+            bits := 0;
+            ch := 0;
+        END IF;
+    END LOOP;
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
@@ -83,3 +83,28 @@ CREATE TRIGGER trg_log_report_creation
 AFTER INSERT ON report
 FOR EACH ROW
 EXECUTE FUNCTION log_report_creation();
+-------------------------------------------------------------------------------------
+-- Trigger to keep the numeric coordinates and geohash of a station in sync ----------
+CREATE OR REPLACE FUNCTION station_geo_sync()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF abs(NEW.lat) <= 90 AND abs(NEW.lon) <= 180 THEN
+        NEW.latitude = NEW.lat;
+        NEW.longitude = NEW.lon;
+        NEW.geohash = geohash_encode(NEW.latitude, NEW.longitude);
+    ELSE
+        NEW.latitude = NULL;
+        NEW.longitude = NULL;
+        NEW.geohash = NULL;
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+-- creation of da trigger
+CREATE TRIGGER trg_station_geo_sync
+BEFORE INSERT OR UPDATE OF lat, lon ON station
+FOR EACH ROW
+EXECUTE FUNCTION station_geo_sync();
+-- stations loaded by vrisa.dml.sql before the trigger existed
+UPDATE station SET lat = lat;